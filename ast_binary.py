@@ -0,0 +1,333 @@
+# ast_binary.py - Versioned binary AST format with lazy, zero-copy decoding
+#
+# Layout (all integers are little-endian u32 unless noted):
+#
+#   header        magic 'PAST', u16 version, u16 reserved, node count,
+#                 list word count, string count, string blob size, root node
+#   node table    node count records of RECORD_WORDS words: kind in the low
+#                 8 bits and source column above them, source line (or NONE),
+#                 then one word per field (string index, node index, list
+#                 offset or NONE)
+#   list table    for each list: its length followed by that many node indices
+#   string table  string count + 1 offsets into the blob
+#   string blob   UTF-8 data
+#
+# Every record has the same size, so a node is found by index in O(1) and a
+# reader only touches the parts of the file it actually visits.
+import mmap
+import struct
+import sys
+from array import array
+
+from ast_nodes import *
+
+class ASTFormatError(Exception):
+    pass
+
+MAGIC = b'PAST'
+FORMAT_VERSION = 2
+HEADER = struct.Struct('<4sHHIIIII')
+RECORD_WORDS = 6
+FIELD_BASE = 2      # words before the first field: kind/column, line
+KIND_BITS = 8
+KIND_MASK = (1 << KIND_BITS) - 1
+MAX_COLUMN = (1 << (32 - KIND_BITS)) - 1
+NONE = 0xFFFFFFFF
+
+# Field kinds
+STR, NODE, LIST = 0, 1, 2
+
+# Node kinds are positions in this table; append new kinds at the end and bump
+# FORMAT_VERSION whenever an existing entry changes.
+SCHEMA = [
+    (ASTProgram, (('declarations', LIST),)),
+    (ASTFunctionDeclaration, (('name', STR), ('parameters', LIST), ('return_type', STR), ('body', NODE))),
+    (ASTParameter, (('name', STR), ('type', STR))),
+    (ASTBlock, (('statements', LIST),)),
+    (ASTVariableDeclaration, (('name', STR), ('type', STR), ('value', NODE))),
+    (ASTAssignment, (('name', STR), ('value', NODE))),
+    (ASTReturnStatement, (('expression', NODE),)),
+    (ASTIfStatement, (('condition', NODE), ('then_block', NODE), ('else_block', NODE))),
+    (ASTWhileStatement, (('condition', NODE), ('body', NODE))),
+    (ASTForStatement, (('init', NODE), ('condition', NODE), ('update', NODE), ('body', NODE))),
+    (ASTExpressionStatement, (('expression', NODE),)),
+    (ASTBuiltinCall, (('name', STR), ('args', LIST))),
+    (ASTFunctionCall, (('name', STR), ('args', LIST))),
+    (ASTBinaryOp, (('operator', STR), ('left', NODE), ('right', NODE))),
+    (ASTUnaryOp, (('operator', STR), ('operand', NODE))),
+    (ASTCast, (('expression', NODE), ('target_type', STR))),
+    (ASTLiteral, (('value', STR),)),
+    (ASTArrayLiteral, (('elements', LIST),)),
+    (ASTIdentifier, (('name', STR),)),
+    (ASTIndex, (('array', NODE), ('index', NODE))),
+    (ASTIndexAssignment, (('array', NODE), ('index', NODE), ('value', NODE))),
+]
+KIND_OF = {cls: kind for kind, (cls, _) in enumerate(SCHEMA)}
+FIELD_INDEX = [{name: (slot, field_kind) for slot, (name, field_kind) in enumerate(fields)}
+               for _, fields in SCHEMA]
+
+# --- writing ----------------------------------------------------------------
+
+def dumps(root):
+    nodes = array('I')
+    lists = array('I')
+    strings = {}
+    indices = {}        # id(node) -> index; shared subtrees are written once
+    keep_alive = []
+
+    def string(value):
+        if value is None:
+            return NONE
+        if value not in strings:
+            strings[value] = len(strings)
+        return strings[value]
+
+    def reserve(node):
+        key = id(node)
+        if key not in indices:
+            indices[key] = len(nodes) // RECORD_WORDS
+            nodes.extend([NONE] * RECORD_WORDS)
+            keep_alive.append(node)
+            pending.append(node)
+        return indices[key]
+
+    pending = []
+    root_index = reserve(root)
+    while pending:
+        node = pending.pop()
+        kind = KIND_OF.get(type(node))
+        if kind is None:
+            raise ASTFormatError(f"Cannot serialize {type(node).__name__}")
+        base = indices[id(node)] * RECORD_WORDS
+        nodes[base] = kind | min(node.column or 0, MAX_COLUMN) << KIND_BITS
+        nodes[base + 1] = NONE if node.line is None else node.line
+        for slot, (name, field_kind) in enumerate(SCHEMA[kind][1]):
+            value = getattr(node, name)
+            if field_kind == STR:
+                word = string(value)
+            elif field_kind == NODE:
+                word = NONE if value is None else reserve(value)
+            else:
+                word = len(lists)
+                lists.append(len(value))
+                lists.extend(reserve(item) for item in value)
+            nodes[base + FIELD_BASE + slot] = word
+
+    blob = bytearray()
+    offsets = array('I', [0])
+    for value in strings:
+        blob += value.encode('utf-8')
+        offsets.append(len(blob))
+
+    if sys.byteorder != 'little':
+        for column in (nodes, lists, offsets):
+            column.byteswap()
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(nodes) // RECORD_WORDS,
+                         len(lists), len(strings), len(blob), root_index)
+    return b''.join((header, nodes.tobytes(), lists.tobytes(), offsets.tobytes(), bytes(blob)))
+
+def dump(root, path):
+    with open(path, 'wb') as f:
+        f.write(dumps(root))
+
+# --- reading ----------------------------------------------------------------
+
+class ASTFile:
+    # A read-only view over an encoded AST. Nothing is decoded up front; nodes
+    # come back as LazyNode handles and strings are decoded on first use.
+    def __init__(self, buffer):
+        view = memoryview(buffer)
+        if len(view) < HEADER.size:
+            raise ASTFormatError("Truncated AST file")
+        magic, version, _, node_count, list_words, string_count, blob_size, root = \
+            HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ASTFormatError("Not a PArL AST file")
+        if version != FORMAT_VERSION:
+            raise ASTFormatError(f"Unsupported AST format version {version}")
+
+        offset = HEADER.size
+        sizes = (node_count * RECORD_WORDS * 4, list_words * 4, (string_count + 1) * 4)
+        if len(view) < offset + sum(sizes) + blob_size:
+            raise ASTFormatError("Truncated AST file")
+        self.nodes = self._words(view[offset:offset + sizes[0]])
+        offset += sizes[0]
+        self.lists = self._words(view[offset:offset + sizes[1]])
+        offset += sizes[1]
+        self.offsets = self._words(view[offset:offset + sizes[2]])
+        offset += sizes[2]
+        self.blob = view[offset:offset + blob_size]
+        self.node_count = node_count
+        self.root_index = root
+        self.string_cache = {}
+        self._mapping = None
+
+    @staticmethod
+    def _words(view):
+        if sys.byteorder == 'little':
+            return view.cast('I')
+        words = array('I', view.tobytes())
+        words.byteswap()
+        return words
+
+    @classmethod
+    def open(cls, path):
+        # Memory-maps the file so only the pages that are read get loaded
+        with open(path, 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        ast_file = cls(mapping)
+        ast_file._mapping = mapping
+        return ast_file
+
+    def close(self):
+        for view in (self.nodes, self.lists, self.offsets, self.blob):
+            if isinstance(view, memoryview):
+                view.release()
+        if self._mapping is not None:
+            self._mapping.close()
+            self._mapping = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def root(self):
+        return LazyNode(self, self.root_index)
+
+    def kind(self, index):
+        return self.nodes[index * RECORD_WORDS] & KIND_MASK
+
+    def span(self, index):
+        # (line, column) of a node, either None when it has no position
+        base = index * RECORD_WORDS
+        line = self.nodes[base + 1]
+        column = self.nodes[base] >> KIND_BITS
+        return (None if line == NONE else line), (column or None)
+
+    def word(self, index, slot):
+        return self.nodes[index * RECORD_WORDS + FIELD_BASE + slot]
+
+    def string(self, index):
+        if index == NONE:
+            return None
+        value = self.string_cache.get(index)
+        if value is None:
+            value = str(self.blob[self.offsets[index]:self.offsets[index + 1]], 'utf-8')
+            self.string_cache[index] = value
+        return value
+
+    def list_items(self, offset):
+        count = self.lists[offset]
+        return self.lists[offset + 1:offset + 1 + count]
+
+    def field(self, index, name):
+        if name == 'line':
+            return self.span(index)[0]
+        if name == 'column':
+            return self.span(index)[1]
+        kind = self.kind(index)
+        try:
+            slot, field_kind = FIELD_INDEX[kind][name]
+        except KeyError:
+            raise AttributeError(f"{SCHEMA[kind][0].__name__} has no field '{name}'") from None
+        word = self.word(index, slot)
+        if field_kind == STR:
+            return self.string(word)
+        if field_kind == NODE:
+            return None if word == NONE else LazyNode(self, word)
+        return LazyList(self, self.list_items(word))
+
+    def function_signatures(self):
+        # Yields (name, [(param name, param type)], return type) for every
+        # top-level function while decoding nothing else. Hot enough on large
+        # files that the record arithmetic is done inline.
+        nodes, lists, string = self.nodes, self.lists, self.string
+        fun_kind = KIND_OF[ASTFunctionDeclaration]
+        name_slot, params_slot, return_slot = (
+            FIELD_BASE + FIELD_INDEX[fun_kind][field][0] for field in ('name', 'parameters', 'return_type'))
+        declarations = nodes[self.root_index * RECORD_WORDS + FIELD_BASE]
+        for i in range(declarations + 1, declarations + 1 + lists[declarations]):
+            base = lists[i] * RECORD_WORDS
+            if nodes[base] & KIND_MASK != fun_kind:
+                continue
+            params = []
+            offset = nodes[base + params_slot]
+            for j in range(offset + 1, offset + 1 + lists[offset]):
+                param = lists[j] * RECORD_WORDS + FIELD_BASE
+                params.append((string(nodes[param]), string(nodes[param + 1])))
+            yield string(nodes[base + name_slot]), params, string(nodes[base + return_slot])
+
+    def materialize(self, index=None):
+        # Decode a whole subtree into regular ast_nodes objects
+        index = self.root_index if index is None else index
+        decoded = {}
+
+        def build(i):
+            if i in decoded:
+                return decoded[i]
+            cls, fields = SCHEMA[self.kind(i)]
+            node = cls.__new__(cls)
+            decoded[i] = node
+            line, column = self.span(i)
+            if line is not None:
+                node.line, node.column = line, column
+            for slot, (name, field_kind) in enumerate(fields):
+                word = self.word(i, slot)
+                if field_kind == STR:
+                    value = self.string(word)
+                elif field_kind == NODE:
+                    value = None if word == NONE else build(word)
+                else:
+                    value = [build(item) for item in self.list_items(word)]
+                setattr(node, name, value)
+            return node
+
+        return build(index)
+
+class LazyNode:
+    __slots__ = ('file', 'index')
+
+    def __init__(self, file, index):
+        self.file = file
+        self.index = index
+
+    @property
+    def node_type(self):
+        return SCHEMA[self.file.kind(self.index)][0]
+
+    def __getattr__(self, name):
+        return self.file.field(self.index, name)
+
+    def __eq__(self, other):
+        return isinstance(other, LazyNode) and other.file is self.file and other.index == self.index
+
+    def __hash__(self):
+        return hash((id(self.file), self.index))
+
+    def materialize(self):
+        return self.file.materialize(self.index)
+
+    def __repr__(self):
+        return f"<{self.node_type.__name__} #{self.index}>"
+
+class LazyList:
+    __slots__ = ('file', 'items')
+
+    def __init__(self, file, items):
+        self.file = file
+        self.items = items
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return LazyList(self.file, self.items[i])
+        return LazyNode(self.file, self.items[i])
+
+    def __iter__(self):
+        for index in self.items:
+            yield LazyNode(self.file, index)
@@ -1,5 +1,8 @@
 class ASTNode:
-    pass
+    # Position of the construct's first token, set by the parser. Nodes that
+    # later passes create keep these class-level defaults.
+    line = None
+    column = None
 
 class ASTProgram(ASTNode):
     def __init__(self, declarations):
@@ -45,6 +48,15 @@ class ASTAssignment(ASTNode):
     def __str__(self):
         return f"{self.name} = {self.value}"
 
+class ASTIndexAssignment(ASTNode):
+    def __init__(self, array, index, value):
+        self.array = array
+        self.index = index
+        self.value = value
+
+    def __str__(self):
+        return f"{self.array}[{self.index}] = {self.value}"
+
 class ASTReturnStatement(ASTNode):
     def __init__(self, expression):
         self.expression = expression
@@ -142,6 +154,14 @@ class ASTArrayLiteral(ASTNode):
     def __str__(self):
         return f"[{', '.join(str(e) for e in self.elements)}]"
 
+class ASTIndex(ASTNode):
+    def __init__(self, array, index):
+        self.array = array
+        self.index = index
+
+    def __str__(self):
+        return f"{self.array}[{self.index}]"
+
 class ASTIdentifier(ASTNode):
     def __init__(self, name):
         self.name = name
@@ -0,0 +1,87 @@
+# ast_utils.py - Generic helpers for passes that walk or rewrite ast_nodes trees
+from ast_nodes import *
+
+def children(node):
+    # Yield the direct child nodes of a node in field order
+    for value in vars(node).values():
+        if isinstance(value, ASTNode):
+            yield value
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, ASTNode):
+                    yield item
+
+def walk(node):
+    # Pre-order traversal over a node and all of its descendants
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        yield current
+        stack.extend(reversed(list(children(current))))
+
+def node_count(node):
+    return sum(1 for _ in walk(node))
+
+def clone(node):
+    import copy     # deferred: only the optimizers clone, and copy is slow to import
+    return copy.deepcopy(node)
+
+def is_name(value):
+    # The parser stores identifiers as ASTLiteral values, so names have to be
+    # told apart from numeric, boolean and colour literals by their spelling.
+    return (isinstance(value, str) and value != ''
+            and (value[0].isalpha() or value[0] == '_')
+            and value not in ('true', 'false'))
+
+def name_of(expr):
+    # Return the variable name an expression refers to, or None
+    if isinstance(expr, ASTIdentifier):
+        return expr.name
+    if isinstance(expr, ASTLiteral) and is_name(expr.value):
+        return expr.value
+    return None
+
+def literal_value(text):
+    if text == 'true':
+        return True
+    if text == 'false':
+        return False
+    if text.startswith('#'):
+        return int(text[1:], 16)
+    if '.' in text:
+        return float(text)
+    return int(text)
+
+def element_type(type_):
+    # 'int' for the array types 'int[4]' and 'int[]', None for scalar types
+    if type_ is not None and type_.endswith(']'):
+        return type_[:type_.index('[')]
+    return None
+
+def array_length(type_):
+    # The declared length of an array type, or None for 'int[]' and scalars
+    if element_type(type_) is None:
+        return None
+    size = type_[type_.index('[') + 1:-1]
+    return int(size) if size else None
+
+def calls_in(node):
+    # Yield every function call (expression or statement form) under a node
+    for current in walk(node):
+        if isinstance(current, (ASTFunctionCall, ASTBuiltinCall)):
+            yield current
+
+def free_names(func):
+    # Names a function reads or writes without declaring them itself
+    declared = {param.name for param in func.parameters}
+    used = set()
+    for node in walk(func.body):
+        if isinstance(node, ASTVariableDeclaration):
+            declared.add(node.name)
+        elif isinstance(node, ASTAssignment):
+            used.add(node.name)
+        else:
+            name = name_of(node)
+            if name is not None:
+                used.add(name)
+    return used - declared
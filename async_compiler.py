@@ -0,0 +1,194 @@
+# async_compiler.py - asyncio front door to the PArL compiler
+#
+#   compiler = AsyncCompiler(max_workers=2, max_pending=32)
+#   code = await compiler.compile(source, timeout=2.0)
+#   functions = pybackend.load(code, runtime)
+#
+# The pipeline (lexer, parser, analyzer, code generation) runs on a bounded
+# thread pool so the event loop never executes it. Each request carries a
+# cancellation flag that the pipeline polls at its checkpoints: every few
+# thousand tokens while lexing, after every top-level declaration while
+# parsing, analysing and generating code. A checkpoint also gives up the GIL
+# briefly, so a very large input is processed in chunks instead of holding the
+# interpreter for its whole duration. The one step that cannot be chunked is
+# CPython's compile() of the generated module, which holds the GIL throughout
+# and grows faster than linearly with the number of functions, so it runs in
+# a process pool and the code object comes back marshalled. (On platforms
+# that start processes with 'spawn', the calling script needs the usual
+# __main__ guard.) A request that times out or is cancelled stops at the next
+# checkpoint. At most max_pending requests are queued or running; beyond that
+# compile() waits for a slot, or raises CompileQueueFull when called with
+# wait=False. Source is lexed and parsed under limits.Limits (by default the
+# standard size, token and depth limits), so hostile input fails fast with
+# LimitExceeded.
+import asyncio
+import marshal
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import pybackend
+from lexer import Lexer
+from limits import Limits
+from parser import Parser
+from semantic_analysis import SemanticAnalyzer
+
+DEFAULT_MAX_WORKERS = 2
+DEFAULT_MAX_PENDING = 32
+# How often a worker waiting on the process pool looks for cancellation
+POLL_SECONDS = 0.01
+
+class CompilationCancelled(Exception):
+    pass
+
+class CompilationTimeout(Exception):
+    pass
+
+class CompileQueueFull(Exception):
+    pass
+
+class CancellationToken:
+    def __init__(self):
+        self.event = threading.Event()
+
+    def cancel(self):
+        self.event.set()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def checkpoint(self):
+        if self.event.is_set():
+            raise CompilationCancelled()
+        # Let other threads (the event loop among them) run
+        time.sleep(0)
+
+def compile_module(text, filename):
+    # Runs in a worker process
+    return marshal.dumps(compile(text, filename, 'exec'))
+
+def compile_in_process(processes, text, filename, token):
+    future = processes.submit(compile_module, text, filename)
+    while True:
+        try:
+            return marshal.loads(future.result(timeout=POLL_SECONDS))
+        except FutureTimeout:
+            if token.cancelled:
+                # The process finishes the compile() regardless; only the
+                # result is dropped
+                future.cancel()
+                raise CompilationCancelled() from None
+
+def compile_pipeline(source, token, cache_dir=None, limits=None, processes=None):
+    # The blocking pipeline with checkpoints; runs on a worker thread
+    token.checkpoint()
+    path = None
+    if cache_dir:
+        path = os.path.join(cache_dir, pybackend.source_hash(source)[:32] + '.parlc')
+        code = pybackend.read_cache(path)
+        if code is not None:
+            return code
+    if limits is not None:
+        limits = limits.start()
+    tokens = Lexer(source, verbose=False, checkpoint=token.checkpoint, limits=limits).tokenize()
+    token.checkpoint()
+    program = Parser(tokens, verbose=False, checkpoint=token.checkpoint, limits=limits).parse_program()
+    token.checkpoint()
+    SemanticAnalyzer(checkpoint=token.checkpoint).analyze(program)
+    token.checkpoint()
+    filename = f"<parl:{pybackend.source_hash(source)[:12]}>"
+    if processes is None:
+        code = pybackend.compile_program(program, filename, checkpoint=token.checkpoint)
+    else:
+        text = pybackend.transpile(program, checkpoint=token.checkpoint)
+        token.checkpoint()
+        code = compile_in_process(processes, text, filename, token)
+    if path:
+        pybackend.write_cache(path, code)
+    return code
+
+class AsyncCompiler:
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, max_pending=DEFAULT_MAX_PENDING,
+                 timeout=None, cache_dir=None, limits=None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='parl-compile')
+        self.processes = ProcessPoolExecutor(max_workers=max_workers)
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.cache_dir = cache_dir
+        self.limits = Limits() if limits is None else limits
+        self.pending = 0
+        self.slots = None       # created on first use, inside the running loop
+        self.tokens = set()
+        self.closed = False
+
+    async def compile(self, source, timeout=None, wait=True):
+        # Returns the compiled code object. Raises CompilationTimeout when
+        # timeout seconds pass (waiting for a slot included), CompileQueueFull
+        # when wait is False and no slot is free, and the usual ParserError /
+        # SemanticAnalysisError / BackendError for bad programs.
+        if self.closed:
+            raise RuntimeError("AsyncCompiler is closed")
+        loop = asyncio.get_running_loop()
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.max_pending)
+        timeout = self.timeout if timeout is None else timeout
+        deadline = None if timeout is None else loop.time() + timeout
+
+        if not wait and self.slots.locked():
+            raise CompileQueueFull(f"{self.max_pending} compilations already pending")
+        try:
+            await asyncio.wait_for(self.slots.acquire(), self.remaining(loop, deadline))
+        except asyncio.TimeoutError:
+            raise CompilationTimeout("Timed out waiting for a compilation slot") from None
+
+        # The slot is given back when the worker is really done with the
+        # request, which may be after the caller has stopped waiting for it
+        token = CancellationToken()
+        self.tokens.add(token)
+        self.pending += 1
+        try:
+            future = self.executor.submit(compile_pipeline, source, token, self.cache_dir,
+                                          self.limits, self.processes)
+        except BaseException:
+            self.release(token)
+            raise
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self.release, token))
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.remaining(loop, deadline))
+        except asyncio.TimeoutError:
+            token.cancel()
+            raise CompilationTimeout(f"Compilation took longer than {timeout} seconds") from None
+        except asyncio.CancelledError:
+            token.cancel()
+            raise
+
+    @staticmethod
+    def remaining(loop, deadline):
+        if deadline is None:
+            return None
+        return max(deadline - loop.time(), 0)
+
+    def release(self, token):
+        self.tokens.discard(token)
+        self.pending -= 1
+        self.slots.release()
+
+    async def close(self):
+        # Cancels everything in flight and waits for the workers to stop
+        self.closed = True
+        for token in list(self.tokens):
+            token.cancel()
+        def shutdown():
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.processes.shutdown(wait=True, cancel_futures=True)
+        await asyncio.get_running_loop().run_in_executor(None, shutdown)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
@@ -0,0 +1,124 @@
+# bench_adversarial.py - Pathological-input scaling and fuzzing of the front end
+#
+#   python bench_adversarial.py [fuzz iterations]
+#
+# Part one times each pathological input family at two sizes. Linear work
+# shows a ratio near 2 between the sizes; anything near 4 or above is flagged
+# as super-linear. Part two mutates a valid program at random and checks that
+# the front end, under the standard limits, either accepts the result or
+# rejects it with one of its own errors: never a crash, never a RecursionError.
+import random
+import sys
+import time
+
+from lexer import Lexer
+from parser import Parser, ParserError
+from semantic_analysis import SemanticAnalyzer, SemanticAnalysisError
+from limits import Limits, LimitExceeded
+
+EXPECTED_ERRORS = (ParserError, SemanticAnalysisError, LimitExceeded)
+
+SEED_PROGRAM = """
+fun Max(x: int, y: int) -> int {
+    let m: int = x;
+    if (y > x) { m = y; }
+    return m;
+}
+fun Blend(a: colour, t: float) -> colour {
+    return ((a as float) * t) as colour;
+}
+let c: colour = #00ff00;
+for (let i: int = 0; i < 10; i = i + 1) {
+    __write(i, Max(i, 3), Blend(c, 0.5));
+}
+/* block
+   comment */
+__print(not (1 < 2) and true or false);
+"""
+
+FAMILIES = {
+    'nested parentheses': lambda n: "let x: int = " + "(" * n + "1" + ")" * n + ";",
+    'unary chain': lambda n: "let x: int = " + "- " * n + "1;",
+    'operator chain': lambda n: "let x: int = " + " + ".join(["1"] * n) + ";",
+    'nested blocks': lambda n: "while (true) {" * n + "}" * n,
+    'unterminated comment': lambda n: "let x: int = 1; /*" + "*" * (n * 10),
+    'line comment': lambda n: "//" + "x" * (n * 10),
+    'colour run': lambda n: "let c: colour = #" + "a" * (n * 10) + ";",
+    'hash storm': lambda n: "#" * (n * 10),
+    'error characters': lambda n: "@$" * (n * 5),
+    'many statements': lambda n: "let x: int = 1;\n" + "x = x + 1;\n" * n,
+    'many functions': lambda n: "".join(f"fun F{i}() -> int {{ return {i}; }}\n" for i in range(n)),
+}
+
+def front_end(source, limits=None):
+    limits = (limits or Limits()).start()
+    tokens = Lexer(source, verbose=False, limits=limits).tokenize()
+    program = Parser(tokens, verbose=False, limits=limits).parse_program()
+    SemanticAnalyzer().analyze(program)
+    return program
+
+def outcome(source):
+    try:
+        front_end(source)
+        return 'ok'
+    except EXPECTED_ERRORS as error:
+        return type(error).__name__
+
+def timed(source):
+    start = time.perf_counter()
+    result = outcome(source)
+    return time.perf_counter() - start, result
+
+def scaling(size=20000):
+    print(f"{'family':<22}{'n':>8}{'2n':>10}{'ratio':>8}  outcome")
+    for name, make in FAMILIES.items():
+        small, result = timed(make(size))
+        large, _ = timed(make(size * 2))
+        ratio = large / small if small > 0 else float('inf')
+        flag = "  super-linear?" if ratio > 3.5 else ""
+        print(f"{name:<22}{small * 1000:7.1f}ms{large * 1000:8.1f}ms{ratio:8.2f}  {result}{flag}")
+
+def mutate(source, rng):
+    pieces = ['(', ')', '{', '}', ';', ',', '-', 'not', '#', '/*', '*/', '//', 'fun', 'let', 'as',
+              '__print', '1.', '.5', '#ffffff', '\n', '@', '"', 'x', '->', '==']
+    chars = list(source)
+    for _ in range(rng.randint(1, 8)):
+        position = rng.randrange(len(chars) + 1)
+        action = rng.random()
+        if action < 0.4 and chars:
+            del chars[min(position, len(chars) - 1)]
+        elif action < 0.8:
+            chars[position:position] = rng.choice(pieces)
+        else:
+            # Duplicate a slice to build up nesting and long runs
+            end = min(len(chars), position + rng.randint(1, 40))
+            chars[position:position] = chars[position:end] * rng.randint(2, 50)
+    return ''.join(chars)
+
+def fuzz(iterations, seed=0):
+    rng = random.Random(seed)
+    counts = {}
+    worst = 0.0
+    for i in range(iterations):
+        source = mutate(SEED_PROGRAM, rng)
+        start = time.perf_counter()
+        try:
+            result = outcome(source)
+        except Exception as error:
+            print(f"iteration {i}: unexpected {type(error).__name__}: {error}")
+            print(repr(source))
+            return False
+        worst = max(worst, time.perf_counter() - start)
+        counts[result] = counts.get(result, 0) + 1
+    print(f"fuzzed {iterations} inputs, slowest {worst * 1000:.1f} ms: "
+          + ", ".join(f"{k} {v}" for k, v in sorted(counts.items())))
+    return True
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    scaling()
+    if not fuzz(iterations):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
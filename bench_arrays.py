@@ -0,0 +1,53 @@
+# bench_arrays.py - Array storage and bounds-check elimination on a pixel kernel
+#
+#   python bench_arrays.py [runs]
+#
+# Runs a three-tap blur over 864 floats (a 36x24 image, flattened) 200
+# times. The "proved" program bounds its loop with a constant, so bounds.py
+# removes every check; the "checked" one reads the size from __width and
+# __height and keeps them all. Also prints how much memory the element
+# storage takes against a list of boxed floats.
+import sys
+import time
+from array import array
+
+import pybackend
+from runtime import Runtime
+
+PROVED = """
+fun Blur(src: float[864], dst: float[864]) -> int {
+    for (let i: int = 1; i < 863; i = i + 1) {
+        dst[i] = (src[i - 1] + src[i] + src[i + 1]) / 3.0;
+    }
+    return 0;
+}
+let image: float[864] = [0.5];
+let out: float[864] = [0.0];
+for (let pass: int = 0; pass < 200; pass = pass + 1) {
+    let done: int = Blur(image, out);
+    image = out;
+}
+"""
+CHECKED = PROVED.replace("i < 863", "i < __width * __height - 1")
+
+def best(source, runs):
+    functions = pybackend.load(pybackend.compile_source(source, None), Runtime())
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        functions['.main']()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    checked = best(CHECKED, runs)
+    proved = best(PROVED, runs)
+    print(f"bounds checked   {checked * 1000:8.1f} ms")
+    print(f"checks removed   {proved * 1000:8.1f} ms   ({checked / proved:.2f}x)")
+    values = [0.5 + i for i in range(864)]
+    boxed = sys.getsizeof(values) + sum(sys.getsizeof(v) for v in values)
+    print(f"864 floats: array {sys.getsizeof(array('d', values))} bytes, list {boxed} bytes")
+
+if __name__ == '__main__':
+    main()
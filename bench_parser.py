@@ -0,0 +1,54 @@
+# bench_parser.py - Hand-written against generated parser on the same tokens
+#
+#   python bench_parser.py [runs]
+#
+# Parses about two thousand lines of PArL from differential.py's program
+# generator (fixed seeds) with parser.Parser and with the parser that
+# parsergen.py generates from grammar.py, after checking that both build the
+# same tree. Lexing is done once up front and not timed.
+import random
+import sys
+import time
+
+import generated_parser
+from differential import ProgramGenerator, canonical
+from lexer import Lexer
+from parser import Parser, ParserError
+
+def source(programs=200):
+    # The generator's layout is random and not every program it writes
+    # parses ('x as int < y'); keep the ones that do
+    texts = []
+    seed = 0
+    while len(texts) < programs:
+        text = ProgramGenerator(random.Random(seed)).program()
+        seed += 1
+        try:
+            Parser(Lexer(text, verbose=False).tokenize(), verbose=False).parse_program()
+        except ParserError:
+            continue
+        texts.append(text)
+    return '\n'.join(texts)
+
+def best(parse, tokens, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        parse(tokens)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    text = source()
+    tokens = Lexer(text, verbose=False).tokenize()
+    hand = lambda tokens: Parser(tokens, verbose=False).parse_program()
+    assert canonical(hand(tokens)) == canonical(generated_parser.parse(tokens))
+    print(f"{len(text.splitlines())} lines, {len(tokens)} tokens")
+    hand_time = best(hand, tokens, runs)
+    generated_time = best(generated_parser.parse, tokens, runs)
+    print(f"hand-written   {hand_time * 1000:8.1f} ms")
+    print(f"generated      {generated_time * 1000:8.1f} ms   ({hand_time / generated_time:.2f}x)")
+
+if __name__ == '__main__':
+    main()
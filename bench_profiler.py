@@ -0,0 +1,60 @@
+# bench_profiler.py - Run-time overhead of the sampling profiler
+#
+#   python bench_profiler.py [runs]
+#
+# Times the same compiled program with and without a Profiler attached, at
+# the default interval and at 1 ms, and reports the best of each. The
+# overhead at the default interval should stay under 5%.
+import sys
+import time
+
+import pybackend
+from profiler import Profiler, DEFAULT_INTERVAL
+from runtime import Runtime
+
+SOURCE = """
+fun Mix(a: int, b: int) -> int {
+    return (a * 31 + b) / 7;
+}
+fun Row(y: int) -> int {
+    let acc: int = 0;
+    for (let x: int = 0; x < __width; x = x + 1) {
+        acc = Mix(acc, x * y);
+        __write(x, y, acc);
+    }
+    return acc;
+}
+let total: int = 0;
+for (let frame: int = 0; frame < 400; frame = frame + 1) {
+    for (let y: int = 0; y < __height; y = y + 1) {
+        total = total + Row(y);
+    }
+}
+"""
+
+def timed(functions, interval):
+    start = time.perf_counter()
+    if interval is None:
+        functions['.main']()
+        return time.perf_counter() - start, 0
+    with Profiler(functions['.lines'], interval) as profiler:
+        functions['.main']()
+    return time.perf_counter() - start, profiler.samples
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    functions = pybackend.load(pybackend.compile_source(SOURCE, None), Runtime())
+    scenarios = [('no profiler', None), ('default interval', DEFAULT_INTERVAL), ('1 ms interval', 0.001)]
+    results = {name: [] for name, _ in scenarios}
+    for _ in range(runs):
+        # Interleaved so drift in machine load hits every scenario alike
+        for name, interval in scenarios:
+            results[name].append(timed(functions, interval))
+    baseline = min(seconds for seconds, _ in results['no profiler'])
+    for name, _ in scenarios:
+        seconds, samples = min(results[name])
+        overhead = 100 * (seconds / baseline - 1)
+        print(f"{name:<18}{seconds * 1000:9.1f} ms{samples:8} samples{overhead:+8.1f}%")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# bench_startup.py - Wall-clock start-up cost of one-shot compiler runs
+#
+#   python bench_startup.py [runs]
+#
+# Each scenario is a fresh interpreter process, as in a pre-commit hook. The
+# "eager imports" line loads every module the old pipeline imported up front
+# and is the number the lazy entry point is meant to beat.
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SOURCE = """
+fun Max(x: int, y: int) -> int {
+    if (y > x) { return y; }
+    return x;
+}
+let limit: int = Max(3, __height);
+for (let i: int = 0; i < limit; i = i + 1) {
+    __write(i, i, #00ff00);
+}
+"""
+
+EAGER = ("import hashlib, importlib.util, copy, random, "
+         "lexer, parser, semantic_analysis, runtime, pybackend")
+
+def measure(command, runs, setup=None):
+    times = []
+    for _ in range(runs):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        subprocess.run(command, cwd=HERE, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    python = sys.executable
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'bench.parl')
+        with open(path, 'w') as f:
+            f.write(SOURCE)
+        cache_dir = os.path.join(workdir, 'cache')
+        entry = [python, 'parlc.py']
+
+        def clear_cache():
+            for name in os.listdir(cache_dir) if os.path.isdir(cache_dir) else ():
+                os.remove(os.path.join(cache_dir, name))
+
+        scenarios = [
+            ("interpreter only", [python, '-c', 'pass'], None),
+            ("eager imports", [python, '-c', EAGER], None),
+            ("parlc --check", entry + ['--check', path], None),
+            ("parlc (cold cache)", entry + ['--cache-dir', cache_dir, path], clear_cache),
+            ("parlc (warm cache)", entry + ['--cache-dir', cache_dir, path], None),
+            ("parlc --run (warm)", entry + ['--run', '--cache-dir', cache_dir, path], None),
+        ]
+        print(f"median of {runs} runs")
+        for label, command, setup in scenarios:
+            print(f"{label:<22}{measure(command, runs, setup):8.2f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+# bounds.py - Static range analysis for array accesses in counted for loops
+#
+# A loop written
+#
+#   for (let i: int = START; i < END; i = i + STEP) { ... }      (or i <= END)
+#
+# with START >= 0 and STEP > 0 constants, END a constant, and no assignment
+# to i in its body, keeps i within [START, END - 1] everywhere in the body.
+# An access a[i], a[i + k] or a[i - k] there, to an array whose length L is
+# known from its type, cannot leave the array when the shifted range lies
+# inside [0, L - 1], so the backend drops its bounds check. So does a[c] for
+# a constant c in range, anywhere. Constants are
+# integer literals, int variables initialised with a constant and never
+# assigned, and sums, differences and products of constants.
+#
+# Lengths come from declared types (int[8]) or, for 'int[]', from the array
+# literal or array the variable is initialised with. Arrays keep their length
+# for life: assigning one array to another copies elements and the analyzer
+# only allows it between arrays of equal length.
+from ast_nodes import *
+from ast_utils import walk, name_of, array_length
+
+def safe_accesses(program):
+    # ids of the ASTIndex and ASTIndexAssignment nodes that need no check
+    safe = set()
+    top_level = []
+    for decl in program.declarations:
+        if isinstance(decl, ASTFunctionDeclaration):
+            lengths = {p.name: array_length(p.type) for p in decl.parameters}
+            RangeAnalysis(decl.body, safe).block(decl.body.statements, lengths, {}, {})
+        else:
+            top_level.append(decl)
+    # Functions may assign top-level variables, so they count for main
+    RangeAnalysis(program, safe).block(top_level, {}, {}, {})
+    return safe
+
+class RangeAnalysis:
+    def __init__(self, body, safe):
+        # Variables assigned anywhere in body are never constants
+        self.assigned = {node.name for node in walk(body) if isinstance(node, ASTAssignment)}
+        self.safe = safe
+
+    def block(self, statements, lengths, constants, ranges):
+        # lengths: array name -> length or None; constants: name -> int;
+        # ranges: loop variable -> (low, high). Copied per scope so sibling
+        # blocks may reuse a name with a different type.
+        lengths, constants = dict(lengths), dict(constants)
+        for stmt in statements:
+            self.statement(stmt, lengths, constants, ranges)
+
+    def statement(self, stmt, lengths, constants, ranges):
+        if isinstance(stmt, ASTVariableDeclaration):
+            self.expressions(stmt.value, lengths, constants, ranges)
+            if stmt.type.endswith(']'):
+                lengths[stmt.name] = self.length_of(stmt.type, stmt.value, lengths)
+            else:
+                lengths.pop(stmt.name, None)
+                value = self.constant(stmt.value, constants)
+                if value is not None and stmt.type == 'int' and stmt.name not in self.assigned:
+                    constants[stmt.name] = value
+        elif isinstance(stmt, ASTIndexAssignment):
+            self.access(stmt, lengths, constants, ranges)
+            self.expressions(stmt.index, lengths, constants, ranges)
+            self.expressions(stmt.value, lengths, constants, ranges)
+        elif isinstance(stmt, ASTForStatement):
+            self.loop(stmt, lengths, constants, ranges)
+        elif isinstance(stmt, ASTIfStatement):
+            self.expressions(stmt.condition, lengths, constants, ranges)
+            self.block(stmt.then_block.statements, lengths, constants, ranges)
+            if stmt.else_block:
+                self.block(stmt.else_block.statements, lengths, constants, ranges)
+        elif isinstance(stmt, ASTWhileStatement):
+            self.expressions(stmt.condition, lengths, constants, ranges)
+            self.block(stmt.body.statements, lengths, constants, ranges)
+        elif isinstance(stmt, ASTBlock):
+            self.block(stmt.statements, lengths, constants, ranges)
+        else:
+            self.expressions(stmt, lengths, constants, ranges)
+
+    def loop(self, stmt, lengths, constants, ranges):
+        lengths, constants = dict(lengths), dict(constants)
+        self.statement(stmt.init, lengths, constants, ranges)
+        self.expressions(stmt.condition, lengths, constants, ranges)
+        self.expressions(stmt.update, lengths, constants, ranges)
+        counted = self.counted_range(stmt, constants)
+        if counted is not None:
+            ranges = dict(ranges)
+            ranges[stmt.init.name] = counted
+        self.block(stmt.body.statements, lengths, constants, ranges)
+
+    def counted_range(self, stmt, constants):
+        # (low, high) of the loop variable inside the body, or None
+        name = stmt.init.name
+        start = self.constant(stmt.init.value, constants)
+        condition, update = stmt.condition, stmt.update
+        if (start is None or start < 0 or stmt.init.type != 'int'
+                or not isinstance(condition, ASTBinaryOp) or condition.operator not in ('<', '<=')
+                or name_of(condition.left) != name or update.name != name):
+            return None
+        end = self.constant(condition.right, constants)
+        step = update.value
+        if (end is None or not isinstance(step, ASTBinaryOp) or step.operator != '+'
+                or any(isinstance(node, ASTAssignment) and node.name == name for node in walk(stmt.body))):
+            return None
+        if name_of(step.left) == name:
+            increment = self.constant(step.right, {})
+        elif name_of(step.right) == name:
+            increment = self.constant(step.left, {})
+        else:
+            return None
+        if increment is None or increment <= 0:
+            return None
+        return start, end - 1 if condition.operator == '<' else end
+
+    def expressions(self, node, lengths, constants, ranges):
+        if not lengths:
+            return
+        for current in walk(node):
+            if isinstance(current, ASTIndex):
+                self.access(current, lengths, constants, ranges)
+
+    def access(self, node, lengths, constants, ranges):
+        length = lengths.get(name_of(node.array))
+        if length is None:
+            return
+        index = self.constant(node.index, constants)
+        if index is not None:
+            # a[3] needs no loop to be proved in range
+            low = high = index
+        else:
+            offset = self.offset(node.index, ranges)
+            if offset is None:
+                return
+            (low, high), shift = offset
+            low, high = low + shift, high + shift
+        if low >= 0 and high < length:
+            self.safe.add(id(node))
+
+    def offset(self, index, ranges):
+        # ((low, high), k) for an index i, i + k, k + i or i - k
+        name = name_of(index)
+        if name in ranges:
+            return ranges[name], 0
+        if isinstance(index, ASTBinaryOp) and index.operator in ('+', '-'):
+            left, right = name_of(index.left), name_of(index.right)
+            if left in ranges:
+                shift = self.constant(index.right, {})
+                if shift is not None:
+                    return ranges[left], shift if index.operator == '+' else -shift
+            elif right in ranges and index.operator == '+':
+                shift = self.constant(index.left, {})
+                if shift is not None:
+                    return ranges[right], shift
+        return None
+
+    def constant(self, expr, constants):
+        # The value of an int literal, constant variable or +, - and * over
+        # them, else None
+        if isinstance(expr, ASTUnaryOp) and expr.operator == '-':
+            value = self.constant(expr.operand, constants)
+            return -value if value is not None else None
+        if isinstance(expr, ASTBinaryOp) and expr.operator in ('+', '-', '*'):
+            # Folded along the left spine, which may be longer than the
+            # recursion limit allows
+            spine = []
+            while isinstance(expr, ASTBinaryOp) and expr.operator in ('+', '-', '*'):
+                spine.append(expr)
+                expr = expr.left
+            value = self.constant(expr, constants)
+            for node in reversed(spine):
+                right = self.constant(node.right, constants)
+                if value is None or right is None:
+                    return None
+                value = value + right if node.operator == '+' else \
+                    value - right if node.operator == '-' else value * right
+            return value
+        name = name_of(expr)
+        if name is not None:
+            return constants.get(name)
+        if isinstance(expr, ASTLiteral) and expr.value.isdigit():
+            return int(expr.value)
+        return None
+
+    def length_of(self, type_, value, lengths):
+        length = array_length(type_)
+        if length is not None:
+            return length
+        if isinstance(value, ASTArrayLiteral):
+            return len(value.elements)
+        return lengths.get(name_of(value))
@@ -0,0 +1,394 @@
+# differential.py - Differential testing of lexer/parser engines against the reference
+#
+#   python differential.py [--cases N] [--seed S] [--jobs J] [--invalid R]
+#
+# Random programs, grammar-valid ones and mutated (mostly invalid) ones, are
+# run through the reference Lexer and Parser and through every alternative
+# engine in ENGINES. Token streams, a canonical dump of the AST and the
+# diagnostics (exception type and message) must all match the reference.
+# A failing case is shrunk to a small reproducer before it is reported, and
+# cases are spread over worker processes.
+#
+# An engine is a pair of callables: tokenize(source) -> tokens and
+# parse(tokens) -> ASTProgram. New fast paths register themselves in
+# ENGINES below so that every run checks them. Source positions (the line
+# and column on every node) are compared too, except for engines that
+# declare spans=False because they cannot keep one position per occurrence.
+import argparse
+import multiprocessing
+import random
+import sys
+
+from ast_nodes import ASTNode
+from lexer import Lexer
+from parser import Parser
+from limits import Limits
+from hashcons import InternTable
+import ast_binary
+import generated_parser
+
+class Engine:
+    def __init__(self, name, tokenize, parse, spans=True):
+        self.name = name
+        self.tokenize = tokenize
+        self.parse = parse
+        self.spans = spans
+
+    def run(self, source):
+        # Returns (tokens, ast dump, diagnostic); a stage that fails leaves
+        # the later ones None
+        try:
+            tokens = self.tokenize(source)
+        except Exception as error:
+            return None, None, diagnostic('lex', error)
+        token_stream = [(t.type, t.lexeme, t.line, t.column) for t in tokens]
+        try:
+            program = self.parse(tokens)
+        except Exception as error:
+            return token_stream, None, diagnostic('parse', error)
+        return token_stream, canonical(program, self.spans), None
+
+def diagnostic(stage, error):
+    return f"{stage}: {type(error).__name__}: {error}"
+
+SPAN_FIELDS = ('line', 'column')
+
+def canonical(node, spans=True):
+    # A deterministic text form of a tree: class name and every public field
+    # in name order, so two engines agree only if their trees are identical
+    if isinstance(node, ASTNode):
+        fields = ', '.join(f"{name}={canonical(value, spans)}" for name, value in sorted(vars(node).items())
+                           if not name.startswith('_') and (spans or name not in SPAN_FIELDS))
+        return f"{type(node).__name__}({fields})"
+    if isinstance(node, (list, tuple)):
+        return '[' + ', '.join(canonical(item, spans) for item in node) + ']'
+    return repr(node)
+
+# --- engines ----------------------------------------------------------------
+
+def reference_tokenize(source):
+    return Lexer(source, verbose=False).tokenize()
+
+def reference_parse(tokens):
+    return Parser(tokens, verbose=False).parse_program()
+
+# No caps, so the limit bookkeeping itself is what gets compared
+UNLIMITED = Limits(max_source_size=None, max_tokens=None, max_depth=None, max_chain=None)
+
+def limited_tokenize(source):
+    return Lexer(source, verbose=False, limits=UNLIMITED).tokenize()
+
+def limited_parse(tokens):
+    return Parser(tokens, verbose=False, limits=UNLIMITED).parse_program()
+
+SHARED_NAMES = {}
+
+def interned_tokenize(source):
+    # One intern table across every case, as the language server uses it
+    return Lexer(source, verbose=False, names=SHARED_NAMES).tokenize()
+
+def binary_round_trip(tokens):
+    program = reference_parse(tokens)
+    return ast_binary.ASTFile(ast_binary.dumps(program)).materialize()
+
+def hash_consed_parse(tokens):
+    return Parser(tokens, verbose=False, interner=InternTable()).parse_program()
+
+REFERENCE = Engine('reference', reference_tokenize, reference_parse)
+ENGINES = [
+    Engine('limits', limited_tokenize, limited_parse),
+    Engine('interned', interned_tokenize, reference_parse),
+    Engine('binary-ast', reference_tokenize, binary_round_trip),
+    # Shared nodes keep the position of their first occurrence
+    Engine('hash-consed', reference_tokenize, hash_consed_parse, spans=False),
+    # Generated from grammar.py by parsergen.py
+    Engine('generated', reference_tokenize, generated_parser.parse),
+]
+
+def engine_named(name):
+    for engine in ENGINES:
+        if engine.name == name:
+            return engine
+    raise KeyError(name)
+
+# --- program generation -----------------------------------------------------
+
+TYPES = ('int', 'float', 'bool', 'colour')
+BINARY_OPERATORS = ('+', '-', '*', '/', '<', '<=', '>', '>=', '==', '!=', 'and', 'or')
+
+class ProgramGenerator:
+    # Grammar-valid PArL with random layout; names are mostly ones in scope
+    def __init__(self, rng, max_depth=4):
+        self.rng = rng
+        self.max_depth = max_depth
+        self.names = []
+        self.functions = []
+        self.counter = 0
+
+    def fresh(self, prefix):
+        self.counter += 1
+        return f"{prefix}{self.counter}"
+
+    def space(self):
+        roll = self.rng.random()
+        if roll < 0.8:
+            return ' '
+        if roll < 0.9:
+            return '\n' + '    ' * self.rng.randint(0, 2)
+        if roll < 0.95:
+            return ' // note\n'
+        return ' /* note */ '
+
+    def program(self):
+        parts = [self.function() for _ in range(self.rng.randint(0, 3))]
+        self.names = []
+        parts += [self.statement(0, in_function=False) for _ in range(self.rng.randint(1, 5))]
+        return '\n'.join(parts) + '\n'
+
+    def function(self):
+        name = self.fresh('F')
+        params = [(self.fresh('p'), self.type()) for _ in range(self.rng.randint(0, 3))]
+        self.functions.append((name, len(params)))
+        self.names = [p for p, _ in params]
+        header = ', '.join(f"{p}:{self.space()}{t}" for p, t in params)
+        body = [self.statement(1, in_function=True) for _ in range(self.rng.randint(0, 3))]
+        body.append(f"return {self.expression(0)};")
+        return f"fun {name}({header}) ->{self.space()}{self.type()} {{{self.space()}" \
+               + self.space().join(body) + "\n}"
+
+    def type(self):
+        # Mostly scalars, sometimes an array type with or without a length
+        if self.rng.random() < 0.8:
+            return self.rng.choice(TYPES)
+        size = self.rng.choice(('', str(self.rng.randint(1, 16))))
+        return f"{self.rng.choice(TYPES)}[{size}]"
+
+    def block(self, depth, in_function):
+        saved = list(self.names)
+        statements = [self.statement(depth + 1, in_function) for _ in range(self.rng.randint(0, 3))]
+        self.names = saved
+        return "{" + self.space() + self.space().join(statements) + self.space() + "}"
+
+    def statement(self, depth, in_function):
+        choices = ['let', 'assign', 'print', 'write', 'call', 'array', 'store']
+        if depth < self.max_depth:
+            choices += ['if', 'while', 'for']
+        if in_function:
+            choices.append('return')
+        kind = self.rng.choice(choices)
+        if kind == 'let' or (kind == 'assign' and not self.names):
+            name = self.fresh('v')
+            text = f"let {name}:{self.space()}{self.rng.choice(TYPES)} = {self.expression(0)};"
+            self.names.append(name)
+            return text
+        if kind == 'assign':
+            return f"{self.rng.choice(self.names)} ={self.space()}{self.expression(0)};"
+        if kind == 'array':
+            name = self.fresh('a')
+            elements = ', '.join(self.expression(1) for _ in range(self.rng.randint(1, 4)))
+            self.names.append(name)
+            return f"let {name}: {self.type()} = [{elements}];"
+        if kind == 'store':
+            target = self.rng.choice(self.names) if self.names else self.fresh('a')
+            return f"{target}[{self.expression(1)}] ={self.space()}{self.expression(0)};"
+        if kind == 'print':
+            return f"__print({self.expression(0)});"
+        if kind == 'write':
+            args = ', '.join(self.expression(1) for _ in range(3))
+            return f"__write({args});" if self.rng.random() < 0.7 else \
+                f"__write_box({args}, {self.expression(1)}, {self.expression(1)});"
+        if kind == 'call':
+            return f"{self.call(0)};"
+        if kind == 'return':
+            return f"return {self.expression(0)};"
+        if kind == 'if':
+            text = f"if ({self.expression(0)}) {self.block(depth, in_function)}"
+            if self.rng.random() < 0.5:
+                text += f" else {self.block(depth, in_function)}"
+            return text
+        if kind == 'while':
+            return f"while ({self.expression(0)}) {self.block(depth, in_function)}"
+        counter = self.fresh('i')
+        self.names.append(counter)
+        text = (f"for (let {counter}: int = {self.expression(1)}; {self.expression(1)};"
+                f" {counter} = {counter} + 1) {self.block(depth, in_function)}")
+        self.names.remove(counter)
+        return text
+
+    def call(self, depth):
+        if self.functions and self.rng.random() < 0.7:
+            name, arity = self.rng.choice(self.functions)
+        else:
+            name, arity = self.fresh('G'), self.rng.randint(0, 2)
+        args = ', '.join(self.expression(depth + 1) for _ in range(arity))
+        return f"{name}({args})"
+
+    def expression(self, depth):
+        rng = self.rng
+        if depth >= self.max_depth or rng.random() < 0.3:
+            return self.atom()
+        roll = rng.random()
+        if roll < 0.45:
+            op = rng.choice(BINARY_OPERATORS)
+            return f"{self.expression(depth + 1)} {op}{self.space()}{self.expression(depth + 1)}"
+        if roll < 0.6:
+            return f"({self.expression(depth + 1)})"
+        if roll < 0.7:
+            return f"{rng.choice(('-', 'not '))}{self.expression(depth + 1)}"
+        if roll < 0.8:
+            return f"{self.expression(depth + 1)} as {rng.choice(TYPES)}"
+        if roll < 0.85:
+            return self.call(depth)
+        if roll < 0.9 and self.names:
+            return f"{rng.choice(self.names)}[{self.expression(depth + 1)}]"
+        builtin = rng.choice(('__read', '__random_int'))
+        args = ', '.join(self.expression(depth + 1) for _ in range(2 if builtin == '__read' else 1))
+        return f"{builtin}({args})"
+
+    def atom(self):
+        rng = self.rng
+        roll = rng.random()
+        if roll < 0.3 and self.names:
+            return rng.choice(self.names)
+        if roll < 0.5:
+            return str(rng.randint(0, 1000))
+        if roll < 0.6:
+            return f"{rng.randint(0, 99)}.{rng.randint(0, 99)}"
+        if roll < 0.7:
+            return '#' + ''.join(rng.choice('0123456789abcdef') for _ in range(6))
+        if roll < 0.8:
+            return rng.choice(('true', 'false'))
+        if roll < 0.9:
+            return rng.choice(('__width', '__height'))
+        return self.fresh('u')
+
+NOISE = ('(', ')', '{', '}', ';', ',', '=', '->', 'as', 'let', 'fun', '#', '#12', '1.', '.5',
+         '@', '/*', '*/', 'not', '__print', '[', ']', '\n')
+
+def mutate(source, rng):
+    # Token-level edits of a valid program; the result is usually invalid
+    tokens = [t.lexeme for t in reference_tokenize(source) if t.type != 'EOF']
+    for _ in range(rng.randint(1, 4)):
+        position = rng.randrange(len(tokens) + 1)
+        roll = rng.random()
+        if roll < 0.4 and tokens:
+            del tokens[min(position, len(tokens) - 1)]
+        elif roll < 0.8:
+            tokens.insert(position, rng.choice(NOISE))
+        elif tokens:
+            other = rng.randrange(len(tokens))
+            position = min(position, len(tokens) - 1)
+            tokens[position], tokens[other] = tokens[other], tokens[position]
+    return ' '.join(tokens)
+
+def generate_case(seed, invalid_ratio=0.3):
+    rng = random.Random(seed)
+    source = ProgramGenerator(rng).program()
+    if rng.random() < invalid_ratio:
+        source = mutate(source, rng)
+    return source
+
+# --- comparison and shrinking -----------------------------------------------
+
+FIELDS = ('tokens', 'ast', 'diagnostic')
+
+def compare(source, engines=None):
+    # Returns [(engine name, field, reference value, engine value)]
+    expected = REFERENCE.run(source)
+    without_spans = None
+    mismatches = []
+    for engine in engines or ENGINES:
+        actual = engine.run(source)
+        reference = expected
+        if not engine.spans and expected[1] is not None:
+            if without_spans is None:
+                program = REFERENCE.parse(REFERENCE.tokenize(source))
+                without_spans = (expected[0], canonical(program, False), None)
+            reference = without_spans
+        for field, want, got in zip(FIELDS, reference, actual):
+            if want != got:
+                mismatches.append((engine.name, field, want, got))
+                break
+    return mismatches
+
+def shrink(source, still_fails):
+    # Greedy delta debugging, first over lines and then over tokens:
+    # repeatedly drop chunks, halving the chunk size when nothing can go
+    source = reduce_units(source.split('\n'), '\n', still_fails)
+    try:
+        lexemes = [t.lexeme for t in reference_tokenize(source) if t.type != 'EOF']
+    except Exception:
+        return source
+    candidate = ' '.join(lexemes)
+    if still_fails(candidate):
+        source = reduce_units(lexemes, ' ', still_fails)
+    return source
+
+def reduce_units(units, separator, still_fails):
+    chunk = max(len(units) // 2, 1)
+    while True:
+        i = 0
+        progress = False
+        while i < len(units):
+            trial = units[:i] + units[i + chunk:]
+            if trial and still_fails(separator.join(trial)):
+                units = trial
+                progress = True
+            else:
+                i += chunk
+        if chunk == 1 and not progress:
+            return separator.join(units)
+        if not progress:
+            chunk = max(chunk // 2, 1)
+
+def check_case(args):
+    # Worker entry point: returns None or (seed, shrunk source, mismatches)
+    seed, invalid_ratio, engine_names = args
+    engines = [engine_named(name) for name in engine_names]
+    source = generate_case(seed, invalid_ratio)
+    mismatches = compare(source, engines)
+    if not mismatches:
+        return None
+    failing = {(name, field) for name, field, _, _ in mismatches}
+    def still_fails(candidate):
+        return any((name, field) in failing for name, field, _, _ in compare(candidate, engines))
+    small = shrink(source, still_fails)
+    return seed, small, compare(small, engines)
+
+def run_campaign(cases, seed=0, jobs=None, invalid_ratio=0.3, engines=None):
+    names = [engine.name for engine in (engines or ENGINES)]
+    work = [(seed + i, invalid_ratio, names) for i in range(cases)]
+    if jobs == 1:
+        results = map(check_case, work)
+        return [r for r in results if r is not None]
+    with multiprocessing.Pool(jobs) as pool:
+        results = pool.imap_unordered(check_case, work, chunksize=16)
+        return sorted(r for r in results if r is not None)
+
+def report(failure):
+    seed, source, mismatches = failure
+    lines = [f"seed {seed}: minimal reproducer {source!r}"]
+    for name, field, want, got in mismatches:
+        lines.append(f"  {name} differs in {field}")
+        lines.append(f"    reference: {want}")
+        lines.append(f"    {name + ':':<10} {got}")
+    return '\n'.join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare lexer/parser engines against the reference")
+    parser.add_argument('--cases', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--jobs', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--invalid', type=float, default=0.3, help="share of mutated, mostly invalid cases")
+    parser.add_argument('--engine', action='append', help="only check the named engine(s)")
+    args = parser.parse_args(argv)
+
+    engines = [engine_named(name) for name in args.engine] if args.engine else ENGINES
+    failures = run_campaign(args.cases, args.seed, args.jobs, args.invalid, engines)
+    for failure in failures:
+        print(report(failure))
+    print(f"{args.cases} cases, {len(engines)} engines, {len(failures)} failing")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,438 @@
+# generated_parser.py - Generated by parsergen.py from grammar.py; do not edit
+#
+#   program = generated_parser.parse(Lexer(source, verbose=False).tokenize())
+#
+# Builds the same trees, positions included, as parser.Parser and raises the
+# same ParserErrors. It has no limits, checkpoints, interning or debug output;
+# use parser.Parser where those are needed.
+from ast_nodes import *
+from parser import ParserError
+
+LEXEME_TYPES = frozenset(('KEYWORD', 'OPERATOR', 'SEPARATOR'))
+
+def at(tok, node):
+    node.line = tok.line
+    node.column = tok.column
+    return node
+
+def expected(name, tok):
+    return ParserError(f"Expected {name}, got {tok.lexeme} at line {tok.line}")
+
+def parse(tokens):
+    # Kind of each token: its lexeme for keywords, operators and separators,
+    # else its type
+    kinds = [tok.lexeme if tok.type in LEXEME_TYPES else tok.type for tok in tokens]
+    pos = 0
+
+    def parse_program():
+        nonlocal pos
+        start = tokens[pos]
+        functions = []
+        statements = []
+        while kinds[pos] != 'EOF':
+            if kinds[pos] == 'fun':
+                functions.append(parse_function())
+            else:
+                statements.append(parse_statement())
+        pos += 1
+        return at(start, ASTProgram(functions + statements))
+
+    def parse_function():
+        nonlocal pos
+        start = tokens[pos]
+        parameters = []
+        if kinds[pos] != 'fun':
+            raise expected('fun', tokens[pos])
+        pos += 1
+        if kinds[pos] != 'IDENTIFIER' and tokens[pos].lexeme != 'IDENTIFIER':
+            raise expected('IDENTIFIER', tokens[pos])
+        name = tokens[pos]
+        pos += 1
+        if kinds[pos] != '(':
+            raise expected('(', tokens[pos])
+        pos += 1
+        if kinds[pos] != ')':
+            parameters.append(parse_parameter())
+            while kinds[pos] != ')':
+                if kinds[pos] != ',':
+                    raise expected(',', tokens[pos])
+                pos += 1
+                parameters.append(parse_parameter())
+        pos += 1
+        if kinds[pos] != '->':
+            raise expected('->', tokens[pos])
+        pos += 1
+        return_type = parse_type()
+        body = parse_block()
+        return at(start, ASTFunctionDeclaration(name.lexeme, parameters, return_type, body))
+
+    def parse_parameter():
+        nonlocal pos
+        start = tokens[pos]
+        if kinds[pos] != 'IDENTIFIER' and tokens[pos].lexeme != 'IDENTIFIER':
+            raise expected('IDENTIFIER', tokens[pos])
+        name = tokens[pos]
+        pos += 1
+        if kinds[pos] != ':':
+            raise expected(':', tokens[pos])
+        pos += 1
+        typ = parse_type()
+        return at(start, ASTParameter(name.lexeme, typ))
+
+    def parse_type():
+        nonlocal pos
+        if tokens[pos].type != 'KEYWORD' and tokens[pos].lexeme != 'KEYWORD':
+            raise expected('KEYWORD', tokens[pos])
+        name = tokens[pos]
+        pos += 1
+        suffix = None
+        if kinds[pos] == '[':
+            pos += 1
+            size = None
+            if kinds[pos] == 'INT_LITERAL':
+                size = tokens[pos]
+                pos += 1
+            if kinds[pos] != ']':
+                raise expected(']', tokens[pos])
+            pos += 1
+            suffix = f"[{size.lexeme if size else ''}]"
+        return name.lexeme + (suffix or '')
+
+    def parse_block():
+        nonlocal pos
+        start = tokens[pos]
+        statements = []
+        if kinds[pos] != '{':
+            raise expected('{', tokens[pos])
+        pos += 1
+        while kinds[pos] != '}':
+            statements.append(parse_statement())
+        pos += 1
+        return at(start, ASTBlock(statements))
+
+    def parse_statement():
+        k = kinds[pos]
+        if k == 'let':
+            return parse_declaration()
+        elif k == 'return':
+            return parse_return_statement()
+        elif k == 'if':
+            return parse_if_statement()
+        elif k == 'while':
+            return parse_while_statement()
+        elif k == 'for':
+            return parse_for_statement()
+        elif k == 'BUILTIN':
+            return parse_builtin_statement()
+        elif k == 'IDENTIFIER':
+            return parse_expression_statement()
+        else:
+            raise ParserError(f'Unexpected token {tokens[pos].lexeme} at line {tokens[pos].line}')
+
+    def parse_declaration():
+        nonlocal pos
+        start = tokens[pos]
+        if kinds[pos] != 'let':
+            raise expected('let', tokens[pos])
+        pos += 1
+        if kinds[pos] != 'IDENTIFIER' and tokens[pos].lexeme != 'IDENTIFIER':
+            raise expected('IDENTIFIER', tokens[pos])
+        name = tokens[pos]
+        pos += 1
+        if kinds[pos] != ':':
+            raise expected(':', tokens[pos])
+        pos += 1
+        typ = parse_type()
+        if kinds[pos] != '=':
+            raise expected('=', tokens[pos])
+        pos += 1
+        value = parse_expression()
+        if kinds[pos] != ';':
+            raise expected(';', tokens[pos])
+        pos += 1
+        return at(start, ASTVariableDeclaration(name.lexeme, typ, value))
+
+    def parse_return_statement():
+        nonlocal pos
+        start = tokens[pos]
+        if kinds[pos] != 'return':
+            raise expected('return', tokens[pos])
+        pos += 1
+        value = parse_expression()
+        if kinds[pos] != ';':
+            raise expected(';', tokens[pos])
+        pos += 1
+        return at(start, ASTReturnStatement(value))
+
+    def parse_if_statement():
+        nonlocal pos
+        start = tokens[pos]
+        if kinds[pos] != 'if':
+            raise expected('if', tokens[pos])
+        pos += 1
+        if kinds[pos] != '(':
+            raise expected('(', tokens[pos])
+        pos += 1
+        condition = parse_expression()
+        if kinds[pos] != ')':
+            raise expected(')', tokens[pos])
+        pos += 1
+        then_block = parse_block()
+        else_block = None
+        if kinds[pos] == 'else':
+            pos += 1
+            else_block = parse_block()
+        return at(start, ASTIfStatement(condition, then_block, else_block))
+
+    def parse_while_statement():
+        nonlocal pos
+        start = tokens[pos]
+        if kinds[pos] != 'while':
+            raise expected('while', tokens[pos])
+        pos += 1
+        if kinds[pos] != '(':
+            raise expected('(', tokens[pos])
+        pos += 1
+        condition = parse_expression()
+        if kinds[pos] != ')':
+            raise expected(')', tokens[pos])
+        pos += 1
+        body = parse_block()
+        return at(start, ASTWhileStatement(condition, body))
+
+    def parse_for_statement():
+        nonlocal pos
+        start = tokens[pos]
+        if kinds[pos] != 'for':
+            raise expected('for', tokens[pos])
+        pos += 1
+        if kinds[pos] != '(':
+            raise expected('(', tokens[pos])
+        pos += 1
+        init = parse_declaration()
+        condition = parse_expression()
+        if kinds[pos] != ';':
+            raise expected(';', tokens[pos])
+        pos += 1
+        update = parse_assignment()
+        if kinds[pos] != ')':
+            raise expected(')', tokens[pos])
+        pos += 1
+        body = parse_block()
+        return at(start, ASTForStatement(init, condition, update, body))
+
+    def parse_assignment():
+        nonlocal pos
+        start = tokens[pos]
+        if kinds[pos] != 'IDENTIFIER' and tokens[pos].lexeme != 'IDENTIFIER':
+            raise expected('IDENTIFIER', tokens[pos])
+        name = tokens[pos]
+        pos += 1
+        if kinds[pos] != '=':
+            raise expected('=', tokens[pos])
+        pos += 1
+        value = parse_expression()
+        return at(start, ASTAssignment(name.lexeme, value))
+
+    def parse_builtin_statement():
+        nonlocal pos
+        start = tokens[pos]
+        args = []
+        if kinds[pos] != 'BUILTIN' and tokens[pos].lexeme != 'BUILTIN':
+            raise expected('BUILTIN', tokens[pos])
+        name = tokens[pos]
+        pos += 1
+        if kinds[pos] != '(':
+            raise expected('(', tokens[pos])
+        pos += 1
+        if kinds[pos] != ')':
+            args.append(parse_expression())
+            while kinds[pos] != ')':
+                if kinds[pos] != ',':
+                    raise expected(',', tokens[pos])
+                pos += 1
+                args.append(parse_expression())
+        pos += 1
+        if kinds[pos] != ';':
+            raise expected(';', tokens[pos])
+        pos += 1
+        return at(start, ASTBuiltinCall(name.lexeme, args))
+
+    def parse_expression_statement():
+        nonlocal pos
+        start = tokens[pos]
+        target = parse_expression()
+        value = None
+        if kinds[pos] == '=' and (type(target) in (ASTLiteral, ASTIndex)):
+            pos += 1
+            value = parse_expression()
+        if kinds[pos] != ';':
+            raise expected(';', tokens[pos])
+        pos += 1
+        return (at(start, ASTExpressionStatement(target)) if value is None else at(start, ASTAssignment(target.value, value)) if type(target) is ASTLiteral else at(start, ASTIndexAssignment(target.array, target.index, value)))
+
+    def parse_expression():
+        nonlocal pos
+        start = tokens[pos]
+        value = parse_disjunction()
+        while kinds[pos] == 'as':
+            pos += 1
+            if tokens[pos].type != 'KEYWORD' and tokens[pos].lexeme != 'KEYWORD':
+                raise expected('KEYWORD', tokens[pos])
+            target = tokens[pos]
+            pos += 1
+            value = at(start, ASTCast(value, target.lexeme))
+        return value
+
+    def parse_disjunction():
+        nonlocal pos
+        start = tokens[pos]
+        left = parse_conjunction()
+        while kinds[pos] == 'or':
+            op = tokens[pos]
+            pos += 1
+            right = parse_conjunction()
+            left = at(start, ASTBinaryOp(op.lexeme, left, right))
+        return left
+
+    def parse_conjunction():
+        nonlocal pos
+        start = tokens[pos]
+        left = parse_equality()
+        while kinds[pos] == 'and':
+            op = tokens[pos]
+            pos += 1
+            right = parse_equality()
+            left = at(start, ASTBinaryOp(op.lexeme, left, right))
+        return left
+
+    def parse_equality():
+        nonlocal pos
+        start = tokens[pos]
+        left = parse_comparison()
+        while kinds[pos] in {'!=', '=='}:
+            op = tokens[pos]
+            pos += 1
+            right = parse_comparison()
+            left = at(start, ASTBinaryOp(op.lexeme, left, right))
+        return left
+
+    def parse_comparison():
+        nonlocal pos
+        start = tokens[pos]
+        left = parse_term()
+        while kinds[pos] in {'<', '<=', '>', '>='}:
+            op = tokens[pos]
+            pos += 1
+            right = parse_term()
+            left = at(start, ASTBinaryOp(op.lexeme, left, right))
+        return left
+
+    def parse_term():
+        nonlocal pos
+        start = tokens[pos]
+        left = parse_factor()
+        while kinds[pos] in {'+', '-'}:
+            op = tokens[pos]
+            pos += 1
+            right = parse_factor()
+            left = at(start, ASTBinaryOp(op.lexeme, left, right))
+        return left
+
+    def parse_factor():
+        nonlocal pos
+        start = tokens[pos]
+        left = parse_unary()
+        while kinds[pos] in {'*', '/'}:
+            op = tokens[pos]
+            pos += 1
+            right = parse_unary()
+            left = at(start, ASTBinaryOp(op.lexeme, left, right))
+        return left
+
+    def parse_unary():
+        nonlocal pos
+        start = tokens[pos]
+        if kinds[pos] in {'-', 'not'}:
+            op = tokens[pos]
+            pos += 1
+            operand = parse_unary()
+            return at(start, ASTUnaryOp(op.lexeme, operand))
+        else:
+            return parse_primary()
+
+    def parse_primary():
+        nonlocal pos
+        start = tokens[pos]
+        k = kinds[pos]
+        if k == 'IDENTIFIER':
+            name = tokens[pos]
+            pos += 1
+            k = kinds[pos]
+            if k == '(':
+                args = []
+                pos += 1
+                if kinds[pos] != ')':
+                    args.append(parse_expression())
+                    while kinds[pos] != ')':
+                        if kinds[pos] != ',':
+                            raise expected(',', tokens[pos])
+                        pos += 1
+                        args.append(parse_expression())
+                pos += 1
+                node = at(start, ASTFunctionCall(name.lexeme, args))
+            elif k == '[':
+                pos += 1
+                index = parse_expression()
+                if kinds[pos] != ']':
+                    raise expected(']', tokens[pos])
+                pos += 1
+                node = at(start, ASTIndex(at(start, ASTLiteral(name.lexeme)), index))
+            else:
+                node = at(start, ASTLiteral(name.lexeme))
+            return node
+        elif k in {'BOOLEAN_LITERAL', 'COLOUR_LITERAL', 'FLOAT_LITERAL', 'INT_LITERAL', 'false', 'true'}:
+            literal = tokens[pos]
+            pos += 1
+            return at(start, ASTLiteral(literal.lexeme))
+        elif k == '(':
+            pos += 1
+            value = parse_expression()
+            if kinds[pos] != ')':
+                raise expected(')', tokens[pos])
+            pos += 1
+            return value
+        elif k == '[':
+            elements = []
+            pos += 1
+            if kinds[pos] != ']':
+                elements.append(parse_expression())
+                while kinds[pos] != ']':
+                    if kinds[pos] != ',':
+                        raise expected(',', tokens[pos])
+                    pos += 1
+                    elements.append(parse_expression())
+            pos += 1
+            return at(start, ASTArrayLiteral(elements))
+        elif k == 'BUILTIN':
+            name = tokens[pos]
+            pos += 1
+            if kinds[pos] == '(':
+                args = []
+                pos += 1
+                if kinds[pos] != ')':
+                    args.append(parse_expression())
+                    while kinds[pos] != ')':
+                        if kinds[pos] != ',':
+                            raise expected(',', tokens[pos])
+                        pos += 1
+                        args.append(parse_expression())
+                pos += 1
+                node = at(start, ASTFunctionCall(name.lexeme, args))
+            else:
+                node = at(start, ASTLiteral(name.lexeme))
+            return node
+        else:
+            raise ParserError(f'Unexpected primary expression at line {tokens[pos].line}')
+
+    return parse_program()
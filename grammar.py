@@ -0,0 +1,139 @@
+# grammar.py - The PArL grammar, from which parsergen.py generates a parser
+#
+# Notation (see parsergen.py for the details):
+#
+#   rule: ...                  a rule; the first one is the start rule
+#   'x'                        a token with that lexeme
+#   IDENTIFIER                 a token of that TokenType
+#   a b | c                    sequence and alternatives
+#   ( ... )  [ ... ]  { ... }  group, option, repetition; an option or
+#                              repetition is entered when the lookahead
+#                              can start it
+#   [ ... ]~  { ... }~         entered unless the lookahead can follow it,
+#                              so a stray token is reported inside it
+#   name=x  names+=x           capture the token or result of x; += appends
+#   &IDENTIFIER                the alternative is taken on that token only
+#   &{ expr }                  and only when the Python expression holds
+#   => expr                    the value of the alternative; a node built
+#                              here gets the position of the rule's first
+#                              token. '=> name = expr' updates a capture.
+#   ! "message"                reported when no alternative of the rule
+#                              matches ({lexeme} and {line} are filled in)
+#
+# The decisions mirror parser.Parser so that both accept the same programs
+# and report errors with the same messages; differential.py checks this.
+# After editing, run 'python parsergen.py' to regenerate generated_parser.py.
+
+GRAMMAR = r"""
+program:
+    { functions+=function | statements+=statement }~ EOF
+    => ASTProgram(functions + statements)
+
+function:
+    'fun' name=IDENTIFIER '(' [ parameters+=parameter { ',' parameters+=parameter }~ ]~ ')'
+    '->' return_type=type body=block
+    => ASTFunctionDeclaration(name.lexeme, parameters, return_type, body)
+
+parameter:
+    name=IDENTIFIER ':' typ=type => ASTParameter(name.lexeme, typ)
+
+# 'int', or 'int[4]' / 'int[]' for arrays; any keyword is accepted here and
+# left for the analyzer to reject
+type:
+    name=KEYWORD suffix=[ '[' size=[ INT_LITERAL ] ']' => f"[{size.lexeme if size else ''}]" ]
+    => name.lexeme + (suffix or '')
+
+block:
+    '{' { statements+=statement }~ '}' => ASTBlock(statements)
+
+statement:
+      declaration
+    | return_statement
+    | if_statement
+    | while_statement
+    | for_statement
+    | builtin_statement
+    | &IDENTIFIER expression_statement
+
+declaration:
+    'let' name=IDENTIFIER ':' typ=type '=' value=expression ';'
+    => ASTVariableDeclaration(name.lexeme, typ, value)
+
+return_statement:
+    'return' value=expression ';' => ASTReturnStatement(value)
+
+if_statement:
+    'if' '(' condition=expression ')' then_block=block [ 'else' else_block=block ]
+    => ASTIfStatement(condition, then_block, else_block)
+
+while_statement:
+    'while' '(' condition=expression ')' body=block => ASTWhileStatement(condition, body)
+
+for_statement:
+    'for' '(' init=declaration condition=expression ';' update=assignment ')' body=block
+    => ASTForStatement(init, condition, update, body)
+
+assignment:
+    name=IDENTIFIER '=' value=expression => ASTAssignment(name.lexeme, value)
+
+builtin_statement:
+    name=BUILTIN '(' [ args+=expression { ',' args+=expression }~ ]~ ')' ';'
+    => ASTBuiltinCall(name.lexeme, args)
+
+# 'x = v;' and 'a[i] = v;' only turn out to be assignments at the '='
+expression_statement:
+    target=expression [ &{ type(target) in (ASTLiteral, ASTIndex) } '=' value=expression ] ';'
+    => (ASTExpressionStatement(target) if value is None
+        else ASTAssignment(target.value, value) if type(target) is ASTLiteral
+        else ASTIndexAssignment(target.array, target.index, value))
+
+expression:
+    value=disjunction { 'as' target=KEYWORD => value = ASTCast(value, target.lexeme) }
+    => value
+
+disjunction:
+    left=conjunction { op='or' right=conjunction => left = ASTBinaryOp(op.lexeme, left, right) }
+    => left
+
+conjunction:
+    left=equality { op='and' right=equality => left = ASTBinaryOp(op.lexeme, left, right) }
+    => left
+
+equality:
+    left=comparison { op=( '==' | '!=' ) right=comparison => left = ASTBinaryOp(op.lexeme, left, right) }
+    => left
+
+comparison:
+    left=term { op=( '<' | '<=' | '>' | '>=' ) right=term => left = ASTBinaryOp(op.lexeme, left, right) }
+    => left
+
+term:
+    left=factor { op=( '+' | '-' ) right=factor => left = ASTBinaryOp(op.lexeme, left, right) }
+    => left
+
+factor:
+    left=unary { op=( '*' | '/' ) right=unary => left = ASTBinaryOp(op.lexeme, left, right) }
+    => left
+
+unary:
+      op=( '-' | 'not' ) operand=unary => ASTUnaryOp(op.lexeme, operand)
+    | primary
+
+# Index expressions are built without interning: equal index expressions
+# may read different values
+primary:
+      name=IDENTIFIER node=( '(' [ args+=expression { ',' args+=expression }~ ]~ ')'
+                             => ASTFunctionCall(name.lexeme, args)
+                           | '[' index=expression ']' => ASTIndex(ASTLiteral(name.lexeme), index)
+                           | => ASTLiteral(name.lexeme) )
+      => node
+    | literal=( INT_LITERAL | FLOAT_LITERAL | BOOLEAN_LITERAL | COLOUR_LITERAL | 'true' | 'false' )
+      => ASTLiteral(literal.lexeme)
+    | '(' value=expression ')' => value
+    | '[' [ elements+=expression { ',' elements+=expression }~ ]~ ']' => ASTArrayLiteral(elements)
+    | name=BUILTIN node=( '(' [ args+=expression { ',' args+=expression }~ ]~ ')'
+                          => ASTFunctionCall(name.lexeme, args)
+                        | => ASTLiteral(name.lexeme) )
+      => node
+  ! "Unexpected primary expression at line {line}"
+"""
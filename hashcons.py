@@ -0,0 +1,112 @@
+# hashcons.py - Structural interning (hash-consing) of expression nodes
+#
+#   table = InternTable()
+#   program = Parser(tokens, verbose=False, interner=table).parse_program()
+#
+# With an intern table the parser builds expression nodes through make(), so
+# structurally equal expressions come back as one shared object: equality of
+# two interned expressions is an identity test, and generated code that
+# repeats (p1_score < score_max) a hundred times holds it once. Children are
+# interned before their parents, which lets the table key a node by its
+# operator or value and the identities of its children.
+#
+# Every interned node carries a stable 128-bit structural hash (blake2b over
+# the node kind, its scalar fields and its children's hashes), the same in
+# every process and every run, so it can key on-disk caches or match subtrees
+# across two versions of a file. structural_hash() gives the same digest for
+# any subtree, interned or not, statements and whole function bodies included.
+#
+# Shared nodes must not be modified in place. Passes that rewrite the tree
+# (the inliner, tail-call elimination) have to run on unshare(program).
+from hashlib import blake2b
+
+from ast_nodes import *
+
+HASH_SIZE = 16
+
+# The node kinds the table interns: expressions, which nothing mutates.
+# Array indexing (ASTIndex) is left out: two equal a[i] may read different
+# values, and each access carries its own bounds-check decision. So are
+# calls, since two __random_int(5) are two separate draws; make() builds any
+# other kind as a fresh node.
+INTERNED = (ASTBinaryOp, ASTUnaryOp, ASTLiteral, ASTIdentifier, ASTCast,
+            ASTArrayLiteral)
+
+# Where a node was written is not part of its structure
+SPAN_FIELDS = ('line', 'column')
+
+def field_items(node):
+    # Field order is by name, so the hash does not depend on how a node
+    # happened to assign its attributes
+    return sorted((name, value) for name, value in vars(node).items()
+                  if not name.startswith('_') and name not in SPAN_FIELDS)
+
+def hash_node(node, child_hash):
+    digest = blake2b(digest_size=HASH_SIZE)
+    digest.update(type(node).__name__.encode('utf-8'))
+    for name, value in field_items(node):
+        digest.update(b'\x00' + name.encode('utf-8') + b'=')
+        if isinstance(value, ASTNode):
+            digest.update(b'N' + child_hash(value))
+        elif isinstance(value, list):
+            digest.update(b'L%d:' % len(value))
+            for item in value:
+                digest.update(b'N' + child_hash(item) if isinstance(item, ASTNode)
+                              else b'S' + repr(item).encode('utf-8'))
+        else:
+            digest.update(b'S' + repr(value).encode('utf-8'))
+    return digest.digest()
+
+def structural_hash(node):
+    # Digest of a subtree; reuses the hashes stored on interned nodes
+    stored = getattr(node, '_hash', None)
+    if stored is not None:
+        return stored
+    return hash_node(node, structural_hash)
+
+def same(a, b):
+    # Structural equality: O(1) for interned nodes, a hash comparison otherwise
+    return a is b or structural_hash(a) == structural_hash(b)
+
+class InternTable:
+    def __init__(self):
+        self.table = {}
+        self.hits = 0
+
+    def __len__(self):
+        return len(self.table)
+
+    def make(self, cls, *args):
+        # Construct cls(*args), or return the existing equal node
+        if cls not in INTERNED:
+            return cls(*args)
+        key = (cls,) + tuple(tuple(map(id, arg)) if isinstance(arg, list)
+                             else id(arg) if isinstance(arg, ASTNode) else arg
+                             for arg in args)
+        node = self.table.get(key)
+        if node is not None:
+            self.hits += 1
+            return node
+        node = cls(*args)
+        node._hash = hash_node(node, structural_hash)
+        # The key refers to the children by identity, and the node keeps
+        # them alive for as long as the table keeps the node
+        self.table[key] = node
+        return node
+
+    def stats(self):
+        return {'unique': len(self.table), 'shared': self.hits,
+                'requested': len(self.table) + self.hits}
+
+def unshare(node):
+    # A copy in which no node appears twice, safe to rewrite in place
+    if isinstance(node, list):
+        return [unshare(item) for item in node]
+    if not isinstance(node, ASTNode):
+        return node
+    copy = node.__class__.__new__(node.__class__)
+    for name, value in vars(node).items():
+        if name == '_hash':
+            continue
+        setattr(copy, name, unshare(value) if isinstance(value, (ASTNode, list)) else value)
+    return copy
@@ -0,0 +1,442 @@
+# inliner.py - AST-level function inlining and tail-call elimination for PArL
+from ast_nodes import *
+from ast_utils import walk, node_count, clone, name_of, calls_in, free_names, literal_value, element_type
+
+DEFAULT_INLINE_BUDGET = 24
+
+class OptimizationReport:
+    def __init__(self):
+        self.inlined = []       # (caller, callee, form)
+        self.tail_calls = []    # (function, number of eliminated calls)
+        self.skipped = []       # (function, reason)
+
+    def __str__(self):
+        lines = []
+        for caller, callee, form in self.inlined:
+            lines.append(f"inlined {callee} into {caller} ({form})")
+        for name, count in self.tail_calls:
+            lines.append(f"eliminated {count} tail call(s) in {name}")
+        for name, reason in self.skipped:
+            lines.append(f"skipped {name}: {reason}")
+        return '\n'.join(lines)
+
+class Inliner:
+    # Inlines calls to small, non-recursive functions.
+    #
+    # Functions whose body is a single 'return expr;' are substituted straight
+    # into the calling expression. Functions with a single exit (one return as
+    # the last statement) have their body hoisted in front of the calling
+    # statement, which is only done when the call is the whole value of a
+    # let/assignment/return/if condition so evaluation order is unchanged.
+    def __init__(self, max_size=DEFAULT_INLINE_BUDGET, report=None):
+        self.max_size = max_size
+        self.report = report or OptimizationReport()
+        self.functions = {}
+        self.inlinable = {}
+        self.counter = 0
+        self.caller = None
+        self.bound = set()
+        self.types = {}         # name -> type in the caller, None when ambiguous
+        self.global_types = {}
+
+    def optimize(self, program):
+        self.functions = {decl.name: decl for decl in program.declarations
+                          if isinstance(decl, ASTFunctionDeclaration)}
+        recursive = self.find_recursive()
+        self.global_types = declared_types(decl for decl in program.declarations
+                                           if not isinstance(decl, ASTFunctionDeclaration))
+
+        # Callees are processed before their callers so inlined bodies are
+        # already optimized and measured at their final size.
+        for name in self.bottom_up_order():
+            func = self.functions[name]
+            self.caller = name
+            self.bound = self.local_names(func)
+            self.types = self.types_in(func)
+            func.body = ASTBlock(self.rewrite_statements(func.body.statements))
+            form = self.classify(func, recursive)
+            if form:
+                self.inlinable[name] = form
+
+        self.caller = '<main>'
+        top_level = [decl for decl in program.declarations
+                     if not isinstance(decl, ASTFunctionDeclaration)]
+        # Top-level declarations are the globals themselves; only those in
+        # nested blocks can shadow one.
+        self.bound = {node.name for stmt in top_level for node in walk(stmt)
+                      if isinstance(node, ASTVariableDeclaration) and node is not stmt}
+        self.types = declared_types(top_level)
+        functions = [decl for decl in program.declarations
+                     if isinstance(decl, ASTFunctionDeclaration)]
+        program.declarations = functions + self.rewrite_statements(top_level)
+        return program
+
+    # --- call graph -------------------------------------------------------
+
+    def callees(self, func):
+        return {call.name for call in calls_in(func.body) if call.name in self.functions}
+
+    def find_recursive(self):
+        recursive = set()
+        for name, func in self.functions.items():
+            seen = set()
+            stack = list(self.callees(func))
+            while stack:
+                callee = stack.pop()
+                if callee == name:
+                    recursive.add(name)
+                    break
+                if callee not in seen:
+                    seen.add(callee)
+                    stack.extend(self.callees(self.functions[callee]))
+        return recursive
+
+    def bottom_up_order(self):
+        order = []
+        visited = set()
+
+        def visit(name):
+            if name in visited:
+                return
+            visited.add(name)
+            for callee in sorted(self.callees(self.functions[name])):
+                visit(callee)
+            order.append(name)
+
+        for name in self.functions:
+            visit(name)
+        return order
+
+    # --- eligibility ------------------------------------------------------
+
+    def classify(self, func, recursive):
+        if func.name in recursive:
+            self.report.skipped.append((func.name, "recursive"))
+            return None
+        size = node_count(func.body)
+        if size > self.max_size:
+            self.report.skipped.append((func.name, f"size {size} exceeds budget {self.max_size}"))
+            return None
+
+        statements = func.body.statements
+        if not statements or not isinstance(statements[-1], ASTReturnStatement):
+            return None
+        returns = [n for n in walk(func.body) if isinstance(n, ASTReturnStatement)]
+        if len(returns) != 1:
+            self.report.skipped.append((func.name, "multiple exits"))
+            return None
+
+        # Writes to names the function does not own would alias the caller's
+        # variables once the body is spliced into it.
+        local_names = self.local_names(func)
+        for node in walk(func.body):
+            if isinstance(node, ASTAssignment) and node.name not in local_names:
+                self.report.skipped.append((func.name, f"assigns non-local '{node.name}'"))
+                return None
+
+        return 'expression' if len(statements) == 1 else 'single-exit'
+
+    def local_names(self, func):
+        names = {param.name for param in func.parameters}
+        for node in walk(func.body):
+            if isinstance(node, ASTVariableDeclaration):
+                names.add(node.name)
+        return names
+
+    def captured(self, callee):
+        # A global the callee reads would resolve to the caller's own
+        # variable of the same name once the body is spliced in.
+        names = free_names(callee) & self.bound
+        if names:
+            self.report.skipped.append(
+                (callee.name, f"'{sorted(names)[0]}' is shadowed in {self.caller}"))
+        return bool(names)
+
+    def arrays_by_name(self, callee, args):
+        # Arrays are passed by reference, and a let would copy one, so an
+        # array parameter can only be replaced by the caller's variable
+        for param, arg in zip(callee.parameters, args):
+            if element_type(param.type) is not None and name_of(arg) is None:
+                self.report.skipped.append(
+                    (callee.name, f"array argument for '{param.name}' is not a variable"))
+                return False
+        return True
+
+    def types_in(self, func):
+        types = dict(self.global_types)
+        for name in self.local_names(func):
+            types.pop(name, None)
+        types.update(declared_types([func.body], func.parameters))
+        return types
+
+    def static_type(self, expr, types):
+        # The type the backend will give expr, where it can be told
+        name = name_of(expr)
+        if name is not None:
+            return types.get(name)
+        if isinstance(expr, ASTLiteral):
+            return 'colour' if expr.value.startswith('#') else type(literal_value(expr.value)).__name__
+        if isinstance(expr, ASTCast):
+            return expr.target_type
+        if isinstance(expr, ASTUnaryOp):
+            return 'bool' if expr.operator == 'not' else self.static_type(expr.operand, types)
+        if isinstance(expr, ASTBinaryOp):
+            if expr.operator in ('<', '<=', '>', '>=', '==', '!=', 'and', 'or'):
+                return 'bool'
+            left, right = self.static_type(expr.left, types), self.static_type(expr.right, types)
+            if None in (left, right):
+                return None
+            return 'float' if 'float' in (left, right) else left
+        if isinstance(expr, ASTFunctionCall) and expr.name in self.functions:
+            return self.functions[expr.name].return_type
+        return None
+
+    def converted(self, expr, type_, types):
+        # Parameters and results keep their declared type once inlined: the
+        # backend chooses between // and / from static types
+        if element_type(type_) is not None or self.static_type(expr, types) == type_:
+            return expr
+        return ASTCast(expr, type_)
+
+    def assigned_names(self, func):
+        return {node.name for node in walk(func.body) if isinstance(node, ASTAssignment)}
+
+    # --- rewriting --------------------------------------------------------
+
+    def rewrite_statements(self, statements):
+        result = []
+        for stmt in statements:
+            result.extend(self.rewrite_statement(stmt))
+        return result
+
+    def rewrite_statement(self, stmt):
+        # Returns the replacement statement list; hoisted code comes first
+        pre = []
+        if isinstance(stmt, ASTVariableDeclaration):
+            stmt.value = self.inline_root(stmt.value, pre)
+        elif isinstance(stmt, ASTAssignment):
+            stmt.value = self.inline_root(stmt.value, pre)
+        elif isinstance(stmt, ASTReturnStatement):
+            stmt.expression = self.inline_root(stmt.expression, pre)
+        elif isinstance(stmt, ASTExpressionStatement):
+            stmt.expression = self.inline_root(stmt.expression, pre)
+        elif isinstance(stmt, ASTBuiltinCall):
+            stmt.args = [self.inline_expr(arg) for arg in stmt.args]
+        elif isinstance(stmt, ASTIfStatement):
+            stmt.condition = self.inline_root(stmt.condition, pre)
+            stmt.then_block = ASTBlock(self.rewrite_statements(stmt.then_block.statements))
+            if stmt.else_block:
+                stmt.else_block = ASTBlock(self.rewrite_statements(stmt.else_block.statements))
+        elif isinstance(stmt, ASTWhileStatement):
+            # The condition is re-evaluated every iteration, so nothing may be
+            # hoisted out of it.
+            stmt.condition = self.inline_expr(stmt.condition)
+            stmt.body = ASTBlock(self.rewrite_statements(stmt.body.statements))
+        elif isinstance(stmt, ASTForStatement):
+            stmt.init.value = self.inline_root(stmt.init.value, pre)
+            stmt.condition = self.inline_expr(stmt.condition)
+            stmt.update.value = self.inline_expr(stmt.update.value)
+            stmt.body = ASTBlock(self.rewrite_statements(stmt.body.statements))
+        return pre + [stmt]
+
+    def inline_root(self, expr, pre):
+        # expr is evaluated exactly once, before anything else in its statement
+        if isinstance(expr, ASTFunctionCall) and expr.name in self.inlinable:
+            args = [self.inline_expr(arg) for arg in expr.args]
+            callee = self.functions[expr.name]
+            if (len(args) == len(callee.parameters) and not self.captured(callee)
+                    and self.arrays_by_name(callee, args)):
+                return self.splice(callee, args, pre)
+        return self.inline_expr(expr)
+
+    def inline_expr(self, expr):
+        # Substitution-only inlining for calls in arbitrary expression position
+        if expr is None:
+            return expr
+        for field, value in vars(expr).items():
+            if isinstance(value, ASTNode):
+                setattr(expr, field, self.inline_expr(value))
+            elif isinstance(value, list):
+                setattr(expr, field, [self.inline_expr(v) if isinstance(v, ASTNode) else v
+                                      for v in value])
+        if (isinstance(expr, ASTFunctionCall)
+                and self.inlinable.get(expr.name) == 'expression'):
+            callee = self.functions[expr.name]
+            if (len(expr.args) == len(callee.parameters)
+                    and self.substitutable(callee, expr.args) and not self.captured(callee)):
+                self.counter += 1
+                mapping = self.rename_map(callee)
+                for param, arg in zip(callee.parameters, expr.args):
+                    mapping[param.name] = self.converted(arg, param.type, self.types)
+                self.report.inlined.append((self.caller, callee.name, 'expression'))
+                result = self.converted(callee.body.statements[0].expression,
+                                        callee.return_type, self.types_in(callee))
+                return substitute(clone(result), mapping)
+        return expr
+
+    def substitutable(self, callee, args):
+        # Arguments are copied into the body, so they must be plain names or
+        # constants and the parameter must never be written to.
+        assigned = self.assigned_names(callee)
+        for param, arg in zip(callee.parameters, args):
+            if param.name in assigned:
+                return False
+            if not isinstance(arg, (ASTLiteral, ASTIdentifier)):
+                return False
+        return True
+
+    def splice(self, callee, args, pre):
+        self.counter += 1
+        mapping = self.rename_map(callee)
+        assigned = self.assigned_names(callee)
+
+        for param, arg in zip(callee.parameters, args):
+            arg = self.converted(arg, param.type, self.types)
+            if element_type(param.type) is not None:
+                # Writes through the parameter have to reach the caller's array
+                mapping[param.name] = arg
+            elif isinstance(arg, (ASTLiteral, ASTIdentifier)) and param.name not in assigned:
+                mapping[param.name] = arg
+            else:
+                temp = mapping[param.name].value
+                pre.append(ASTVariableDeclaration(temp, param.type, arg))
+                self.types[temp] = param.type
+
+        result = self.converted(callee.body.statements[-1].expression,
+                                callee.return_type, self.types_in(callee))
+        body = [substitute(clone(stmt), mapping) for stmt in callee.body.statements[:-1]]
+        pre.extend(body)
+        form = self.inlinable[callee.name]
+        self.report.inlined.append((self.caller, callee.name, form))
+        return substitute(clone(result), mapping)
+
+    def rename_map(self, callee):
+        prefix = f"_inl{self.counter}_"
+        return {name: ASTLiteral(prefix + name) for name in self.local_names(callee)}
+
+def declared_types(statements, parameters=()):
+    # name -> declared type; None for a name declared with different types
+    types = {param.name: param.type for param in parameters}
+    for stmt in statements:
+        for node in walk(stmt):
+            if isinstance(node, ASTVariableDeclaration):
+                types[node.name] = node.type if types.get(node.name, node.type) == node.type else None
+    return types
+
+def substitute(node, mapping):
+    # Replace references to mapped names with the mapped expression (or name)
+    if isinstance(node, (ASTLiteral, ASTIdentifier)):
+        name = name_of(node)
+        if name in mapping:
+            return clone(mapping[name])
+        return node
+    if isinstance(node, (ASTVariableDeclaration, ASTAssignment)) and node.name in mapping:
+        target = name_of(mapping[node.name])
+        if target is not None:
+            node.name = target
+    for field, value in vars(node).items():
+        if isinstance(value, ASTNode):
+            setattr(node, field, substitute(value, mapping))
+        elif isinstance(value, list):
+            setattr(node, field, [substitute(v, mapping) if isinstance(v, ASTNode) else v
+                                  for v in value])
+    return node
+
+class TailCallEliminator:
+    # Turns self-recursive 'return f(...);' statements into parameter updates
+    # inside a 'while (true)' loop around the function body.
+    def __init__(self, report=None):
+        self.report = report or OptimizationReport()
+        self.counter = 0
+
+    def optimize(self, program):
+        for decl in program.declarations:
+            if isinstance(decl, ASTFunctionDeclaration):
+                self.optimize_function(decl)
+        return program
+
+    def optimize_function(self, func):
+        tail_calls = [n for n in walk(func.body) if self.is_tail_call(func, n)]
+        if not tail_calls:
+            return
+        # Without break/continue a call inside a loop cannot jump back to the
+        # top of the function body.
+        for loop in walk(func.body):
+            if isinstance(loop, (ASTWhileStatement, ASTForStatement)):
+                if any(self.is_tail_call(func, n) for n in walk(loop.body)):
+                    self.report.skipped.append((func.name, "tail call inside loop"))
+                    return
+        if self.completes(func.body.statements):
+            self.report.skipped.append((func.name, "body can fall off the end"))
+            return
+
+        statements, _ = self.rewrite(func, func.body.statements)
+        loop = ASTWhileStatement(ASTLiteral('true'), ASTBlock(statements))
+        func.body = ASTBlock([loop])
+        self.report.tail_calls.append((func.name, len(tail_calls)))
+
+    def is_tail_call(self, func, node):
+        return (isinstance(node, ASTReturnStatement)
+                and isinstance(node.expression, ASTFunctionCall)
+                and node.expression.name == func.name
+                and len(node.expression.args) == len(func.parameters))
+
+    def completes(self, statements):
+        # True if control can reach the end of the statement list
+        for stmt in statements:
+            if isinstance(stmt, ASTReturnStatement):
+                return False
+            if isinstance(stmt, ASTIfStatement) and stmt.else_block:
+                if not self.completes(stmt.then_block.statements) and \
+                        not self.completes(stmt.else_block.statements):
+                    return False
+        return True
+
+    def rewrite(self, func, statements):
+        # Returns (statements, completes normally)
+        result = []
+        for i, stmt in enumerate(statements):
+            if self.is_tail_call(func, stmt):
+                result.extend(self.rebind(func, stmt.expression.args))
+                return result, False
+            if isinstance(stmt, ASTIfStatement) and \
+                    any(self.is_tail_call(func, n) for n in walk(stmt)):
+                # The rest of the block moves into every branch that can
+                # fall through, since a rebound branch must skip it.
+                rest = statements[i + 1:]
+                then_src = list(stmt.then_block.statements)
+                else_src = list(stmt.else_block.statements) if stmt.else_block else []
+                if self.completes(then_src):
+                    then_src += [clone(s) for s in rest]
+                if self.completes(else_src):
+                    else_src += [clone(s) for s in rest]
+                then_stmts, then_falls = self.rewrite(func, then_src)
+                else_stmts, else_falls = self.rewrite(func, else_src)
+                else_block = ASTBlock(else_stmts) if else_stmts else None
+                result.append(ASTIfStatement(stmt.condition, ASTBlock(then_stmts), else_block))
+                return result, then_falls or else_falls
+            result.append(stmt)
+            if isinstance(stmt, ASTReturnStatement):
+                return result, False
+        return result, True
+
+    def rebind(self, func, args):
+        # All new argument values are computed before any parameter changes
+        self.counter += 1
+        temps = []
+        updates = []
+        for param, arg in zip(func.parameters, args):
+            if name_of(arg) == param.name:
+                continue
+            temp = f"_tc{self.counter}_{param.name}"
+            temps.append(ASTVariableDeclaration(temp, param.type, arg))
+            updates.append(ASTAssignment(param.name, ASTLiteral(temp)))
+        return temps + updates
+
+def optimize(program, max_inline_size=DEFAULT_INLINE_BUDGET):
+    # Tail calls are eliminated first; the rewritten functions end in a loop
+    # rather than a return, so the inliner leaves them alone.
+    report = OptimizationReport()
+    TailCallEliminator(report).optimize(program)
+    Inliner(max_inline_size, report).optimize(program)
+    return program, report
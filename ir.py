@@ -0,0 +1,881 @@
+# ir.py - Three-address SSA intermediate representation for PArL functions
+#
+# Every instruction lives in a set of parallel arrays owned by its IRFunction
+# and the value an instruction produces is named by its own index, so an
+# operand is simply the index of the instruction that defined it. Basic blocks
+# are arrays of instruction indices; phi nodes are kept in a separate list per
+# block so they always come first.
+#
+# SSA form is built directly while lowering the AST, following Braun et al.,
+# "Simple and Efficient Construction of Static Single Assignment Form" (2013).
+from array import array
+from ast_nodes import *
+from ast_utils import name_of, free_names, literal_value, element_type
+from lexer import PAD_BUILTINS
+from semantic_analysis import BUILTIN_TYPES, INTEGRAL_TYPES
+
+class IRError(Exception):
+    pass
+
+# Opcodes
+NOP, CONST, PARAM, COPY, PHI = 0, 1, 2, 3, 4
+# Division is IDIV or FDIV when the operand types say which; DIV is left for
+# operands whose types are only known at run time
+ADD, SUB, MUL, IDIV, FDIV, DIV, LT, LE, GT, GE, EQ, NE = range(5, 17)
+NEG, NOT, CAST = 17, 18, 19
+CALL, BUILTIN, GLOAD, GSTORE = 20, 21, 22, 23
+JUMP, BRANCH, RET = 24, 25, 26
+# Arrays: a fresh array from element values, a copy of an array, an element
+# load and store, and copying one array's elements into another
+ARRAY, ACOPY, ALOAD, ASTORE, AFILL = 27, 28, 29, 30, 31
+
+OP_NAMES = [
+    'nop', 'const', 'param', 'copy', 'phi',
+    'add', 'sub', 'mul', 'idiv', 'fdiv', 'div', 'lt', 'le', 'gt', 'ge', 'eq', 'ne',
+    'neg', 'not', 'cast', 'call', 'builtin', 'gload', 'gstore',
+    'jump', 'branch', 'ret',
+    'array', 'acopy', 'aload', 'astore', 'afill',
+]
+
+BINARY_OPS = {
+    '+': ADD, '-': SUB, '*': MUL, '/': DIV, '<': LT, '<=': LE, '>': GT,
+    '>=': GE, '==': EQ, '!=': NE,
+}
+# 'and' and 'or' have no opcodes: they short-circuit, so they lower to
+# branches and a phi
+UNARY_OPS = {'-': NEG, 'not': NOT}
+COMMUTATIVE = {ADD, MUL, EQ, NE}
+TERMINATORS = {JUMP, BRANCH, RET}
+
+# Operations without side effects whose result depends only on their operands.
+# Divisions are pure but may trap, so unless the divisor is a non-zero constant
+# they are neither moved out of a loop speculatively nor removed when unused.
+# Array operations read or write memory (or allocate it) and are never pure.
+PURE_OPS = {CONST, COPY, ADD, SUB, MUL, IDIV, FDIV, DIV, LT, LE, GT, GE, EQ, NE,
+            NEG, NOT, CAST}
+DIVISIONS = (IDIV, FDIV, DIV)
+
+# Which of the a/b/c fields hold value operands
+VALUE_FIELDS = {
+    COPY: 'a', ADD: 'ab', SUB: 'ab', MUL: 'ab', IDIV: 'ab', FDIV: 'ab', DIV: 'ab',
+    LT: 'ab', LE: 'ab', GT: 'ab', GE: 'ab', EQ: 'ab', NE: 'ab',
+    NEG: 'a', NOT: 'a', CAST: 'a', GSTORE: 'b', BRANCH: 'a', RET: 'a',
+    ACOPY: 'a', ALOAD: 'ab', ASTORE: 'abc', AFILL: 'ab',
+}
+# Instructions whose operands are a list in the extra pool
+LIST_OPS = (CALL, BUILTIN, ARRAY)
+
+class IRFunction:
+    def __init__(self, name, params):
+        self.name = name
+        self.params = params
+        # Instruction storage
+        self.op = array('B')
+        self.a = array('i')
+        self.b = array('i')
+        self.c = array('i')
+        self.block_of = array('i')
+        self.extra = array('i')     # call arguments and phi (block, value) pairs
+        self.alias = array('i')     # forwarding for values replaced by a pass
+        # Pools
+        self.consts = []
+        self.const_index = {}
+        self.names = []
+        self.name_index = {}
+        # Control flow graph
+        self.blocks = []
+        self.phis = []
+        self.preds = []
+
+    # --- construction -------------------------------------------------------
+
+    def new_block(self):
+        self.blocks.append(array('i'))
+        self.phis.append([])
+        self.preds.append([])
+        return len(self.blocks) - 1
+
+    def new_instr(self, block, op, a=-1, b=-1, c=-1):
+        index = len(self.op)
+        self.op.append(op)
+        self.a.append(a)
+        self.b.append(b)
+        self.c.append(c)
+        self.block_of.append(block)
+        self.alias.append(-1)
+        return index
+
+    def emit(self, block, op, a=-1, b=-1, c=-1):
+        index = self.new_instr(block, op, a, b, c)
+        self.blocks[block].append(index)
+        return index
+
+    def add_const(self, value):
+        key = (type(value), value)
+        if key not in self.const_index:
+            self.const_index[key] = len(self.consts)
+            self.consts.append(value)
+        return self.const_index[key]
+
+    def add_name(self, name):
+        if name not in self.name_index:
+            self.name_index[name] = len(self.names)
+            self.names.append(name)
+        return self.name_index[name]
+
+    def add_extra(self, values):
+        start = len(self.extra)
+        self.extra.extend(values)
+        return start
+
+    # --- queries ------------------------------------------------------------
+
+    def resolve(self, value):
+        root = value
+        while root >= 0 and self.alias[root] != -1:
+            root = self.alias[root]
+        # Path compression keeps repeated lookups cheap
+        while value >= 0 and self.alias[value] != -1:
+            self.alias[value], value = root, self.alias[value]
+        return root
+
+    def replace(self, value, replacement):
+        self.alias[value] = replacement
+        self.op[value] = NOP
+
+    def terminator(self, block):
+        instrs = self.blocks[block]
+        if instrs and self.op[instrs[-1]] in TERMINATORS:
+            return instrs[-1]
+        return None
+
+    def successors(self, block):
+        term = self.terminator(block)
+        if term is None:
+            return []
+        if self.op[term] == JUMP:
+            return [self.a[term]]
+        if self.op[term] == BRANCH:
+            return [self.b[term], self.c[term]]
+        return []
+
+    def operands(self, index):
+        # Value operands of an instruction, after forwarding
+        op = self.op[index]
+        if op in LIST_OPS:
+            start = self.b[index]
+            return [self.resolve(v) for v in self.extra[start:start + self.c[index]]]
+        if op == PHI:
+            start = self.b[index]
+            return [self.resolve(self.extra[start + 2 * i + 1]) for i in range(self.c[index])]
+        values = []
+        for field in VALUE_FIELDS.get(op, ''):
+            value = getattr(self, field)[index]
+            if value >= 0:
+                values.append(self.resolve(value))
+        return values
+
+    def instructions(self):
+        for block in range(len(self.blocks)):
+            yield from self.phis[block]
+            yield from self.blocks[block]
+
+    def instruction_count(self):
+        return sum(1 for i in self.instructions() if self.op[i] != NOP)
+
+    # --- maintenance --------------------------------------------------------
+
+    def resolve_operands(self):
+        # Rewrite every operand through the alias table so passes can assume
+        # they see final values.
+        for index in self.instructions():
+            op = self.op[index]
+            if op in LIST_OPS:
+                start = self.b[index]
+                for i in range(start, start + self.c[index]):
+                    self.extra[i] = self.resolve(self.extra[i])
+            elif op == PHI:
+                start = self.b[index]
+                for i in range(self.c[index]):
+                    slot = start + 2 * i + 1
+                    self.extra[slot] = self.resolve(self.extra[slot])
+            else:
+                for field in VALUE_FIELDS.get(op, ''):
+                    column = getattr(self, field)
+                    if column[index] >= 0:
+                        column[index] = self.resolve(column[index])
+
+    def compact(self):
+        # Drop NOPs from the block lists
+        for block in range(len(self.blocks)):
+            self.blocks[block] = array('i', (i for i in self.blocks[block] if self.op[i] != NOP))
+            self.phis[block] = [i for i in self.phis[block] if self.op[i] != NOP]
+
+    def dump(self):
+        lines = [f"function {self.name}({', '.join(self.params)})"]
+        for block in range(len(self.blocks)):
+            if not self.blocks[block] and not self.phis[block]:
+                continue
+            preds = ', '.join(f"b{p}" for p in self.preds[block])
+            lines.append(f"  b{block}:" + (f"  ; preds {preds}" if preds else ''))
+            for index in list(self.phis[block]) + list(self.blocks[block]):
+                if self.op[index] != NOP:
+                    lines.append('    ' + self.format(index))
+        return '\n'.join(lines)
+
+    def format(self, index):
+        op = self.op[index]
+        name = OP_NAMES[op]
+        a, b, c = self.a[index], self.b[index], self.c[index]
+        v = lambda value: f"v{self.resolve(value)}"
+        if op == CONST:
+            return f"v{index} = const {self.consts[a]!r}"
+        if op == PARAM:
+            return f"v{index} = param {self.params[a]}"
+        if op == PHI:
+            pairs = [(self.extra[b + 2 * i], self.extra[b + 2 * i + 1]) for i in range(c)]
+            return f"v{index} = phi " + ', '.join(f"[b{blk}: {v(val)}]" for blk, val in pairs)
+        if op in (CALL, BUILTIN):
+            args = ', '.join(v(arg) for arg in self.extra[b:b + c])
+            return f"v{index} = {name} {self.names[a]}({args})"
+        if op == ARRAY:
+            items = ', '.join(v(item) for item in self.extra[b:b + c])
+            return f"v{index} = array {self.names[a]} [{items}]"
+        if op == ALOAD:
+            return f"v{index} = aload {v(a)}[{v(b)}]"
+        if op == ASTORE:
+            return f"astore {v(a)}[{v(b)}], {v(c)}"
+        if op == AFILL:
+            return f"afill {v(a)}, {v(b)}"
+        if op == CAST:
+            return f"v{index} = cast {v(a)} as {self.names[b]}"
+        if op == GLOAD:
+            return f"v{index} = gload {self.names[a]}"
+        if op == GSTORE:
+            return f"gstore {self.names[a]}, {v(b)}"
+        if op == JUMP:
+            return f"jump b{a}"
+        if op == BRANCH:
+            return f"branch {v(a)}, b{b}, b{c}"
+        if op == RET:
+            return "ret" if a < 0 else f"ret {v(a)}"
+        operands = ', '.join(v(x) for x in (a, b) if x >= 0)
+        return f"v{index} = {name} {operands}"
+
+class IRModule:
+    def __init__(self):
+        self.functions = {}
+        self.globals = []
+
+    def dump(self):
+        return '\n\n'.join(fn.dump() for fn in self.functions.values())
+
+# --- lowering ---------------------------------------------------------------
+
+class Lowering:
+    # Lowers one function body to SSA form as it is walked
+    def __init__(self, fn, functions, global_names, global_types=None):
+        self.fn = fn
+        self.functions = functions      # name -> return type
+        self.global_names = global_names
+        # Declared types of globals and of every declared variable, which
+        # tell array assignment (an element copy) from plain assignment and
+        # integer from float division
+        self.global_types = global_types or {}
+        self.types = {}
+        self.scopes = [{}]
+        self.var_count = 0
+        self.current_def = {}
+        self.sealed = set()
+        self.incomplete = {}
+        self.block = fn.new_block()
+        self.seal(self.block)
+
+    # --- SSA construction ---------------------------------------------------
+
+    def declare(self, name, type_=None):
+        self.var_count += 1
+        self.scopes[-1][name] = self.var_count
+        self.types[self.var_count] = type_
+        return self.var_count
+
+    def lookup(self, name):
+        for scope in reversed(self.scopes):
+            if name in scope:
+                return scope[name]
+        return None
+
+    def write_variable(self, var, block, value):
+        self.current_def[(var, block)] = value
+
+    def read_variable(self, var, block):
+        value = self.current_def.get((var, block))
+        if value is not None:
+            return value
+        fn = self.fn
+        if block not in self.sealed:
+            value = self.new_phi(block)
+            self.incomplete.setdefault(block, {})[var] = value
+        elif len(fn.preds[block]) == 1:
+            value = self.read_variable(var, fn.preds[block][0])
+        elif not fn.preds[block]:
+            # Only reachable in dead code following a return
+            value = fn.emit(block, CONST, fn.add_const(None))
+        else:
+            value = self.new_phi(block)
+            self.write_variable(var, block, value)
+            self.add_phi_operands(var, value)
+        self.write_variable(var, block, value)
+        return value
+
+    def new_phi(self, block):
+        value = self.fn.new_instr(block, PHI)
+        self.fn.phis[block].append(value)
+        return value
+
+    def add_phi_operands(self, var, phi):
+        fn = self.fn
+        block = fn.block_of[phi]
+        pairs = []
+        for pred in fn.preds[block]:
+            pairs.extend((pred, self.read_variable(var, pred)))
+        fn.b[phi] = fn.add_extra(pairs)
+        fn.c[phi] = len(fn.preds[block])
+
+    def seal(self, block):
+        for var, phi in self.incomplete.pop(block, {}).items():
+            self.add_phi_operands(var, phi)
+        self.sealed.add(block)
+
+    # --- control flow -------------------------------------------------------
+
+    def terminated(self):
+        return self.fn.terminator(self.block) is not None
+
+    def jump(self, target):
+        if not self.terminated():
+            self.fn.emit(self.block, JUMP, target)
+            self.fn.preds[target].append(self.block)
+
+    def branch(self, cond, then_block, else_block):
+        self.fn.emit(self.block, BRANCH, cond, then_block, else_block)
+        self.fn.preds[then_block].append(self.block)
+        self.fn.preds[else_block].append(self.block)
+
+    # --- statements ---------------------------------------------------------
+
+    def lower_block(self, statements):
+        self.scopes.append({})
+        for stmt in statements:
+            self.lower_statement(stmt)
+        self.scopes.pop()
+
+    def lower_statement(self, stmt):
+        fn = self.fn
+        if self.terminated():
+            # Code after a return: give it a block of its own with no
+            # predecessors, removed again once lowering is done.
+            self.block = fn.new_block()
+            self.seal(self.block)
+
+        if isinstance(stmt, ASTVariableDeclaration):
+            value = self.lower_initialiser(stmt.type, stmt.value)
+            if len(self.scopes) == 1 and stmt.name in self.global_names:
+                fn.emit(self.block, GSTORE, fn.add_name(stmt.name), value)
+            else:
+                self.write_variable(self.declare(stmt.name, stmt.type), self.block, value)
+        elif isinstance(stmt, ASTAssignment):
+            value = self.lower_expr(stmt.value)
+            if element_type(self.type_of(stmt.name)) is not None:
+                fn.emit(self.block, AFILL, self.lower_expr(ASTLiteral(stmt.name)), value)
+            else:
+                self.assign(stmt.name, value)
+        elif isinstance(stmt, ASTIndexAssignment):
+            target = self.lower_expr(stmt.array)
+            index = self.lower_expr(stmt.index)
+            fn.emit(self.block, ASTORE, target, index, self.lower_expr(stmt.value))
+        elif isinstance(stmt, ASTReturnStatement):
+            value = self.lower_expr(stmt.expression) if stmt.expression else -1
+            fn.emit(self.block, RET, value)
+        elif isinstance(stmt, ASTExpressionStatement):
+            self.lower_expr(stmt.expression)
+        elif isinstance(stmt, ASTBuiltinCall):
+            args = [self.lower_expr(arg) for arg in stmt.args]
+            fn.emit(self.block, BUILTIN, fn.add_name(stmt.name), fn.add_extra(args), len(args))
+        elif isinstance(stmt, ASTBlock):
+            self.lower_block(stmt.statements)
+        elif isinstance(stmt, ASTIfStatement):
+            self.lower_if(stmt)
+        elif isinstance(stmt, ASTWhileStatement):
+            self.lower_loop(None, stmt.condition, None, stmt.body)
+        elif isinstance(stmt, ASTForStatement):
+            self.lower_loop(stmt.init, stmt.condition, stmt.update, stmt.body)
+        else:
+            raise IRError(f"Cannot lower statement {type(stmt).__name__}")
+
+    def type_of(self, name):
+        var = self.lookup(name)
+        return self.global_types.get(name) if var is None else self.types.get(var)
+
+    def lower_initialiser(self, type_, value):
+        # Array declarations always get storage of their own
+        if element_type(type_) is None:
+            return self.lower_expr(value)
+        if isinstance(value, ASTArrayLiteral):
+            return self.lower_array(value, type_)
+        return self.fn.emit(self.block, ACOPY, self.lower_expr(value))
+
+    def lower_array(self, literal, type_):
+        items = [self.lower_expr(item) for item in literal.elements]
+        return self.fn.emit(self.block, ARRAY, self.fn.add_name(type_), self.fn.add_extra(items), len(items))
+
+    def assign(self, name, value):
+        var = self.lookup(name)
+        if var is None:
+            self.fn.emit(self.block, GSTORE, self.fn.add_name(name), value)
+        else:
+            self.write_variable(var, self.block, value)
+
+    def lower_if(self, stmt):
+        fn = self.fn
+        cond = self.lower_expr(stmt.condition)
+        then_block = fn.new_block()
+        join = fn.new_block()
+        else_block = fn.new_block() if stmt.else_block else join
+        self.branch(cond, then_block, else_block)
+        self.seal(then_block)
+
+        self.block = then_block
+        self.lower_block(stmt.then_block.statements)
+        self.jump(join)
+
+        if stmt.else_block:
+            self.seal(else_block)
+            self.block = else_block
+            self.lower_block(stmt.else_block.statements)
+            self.jump(join)
+
+        self.seal(join)
+        self.block = join
+
+    def lower_loop(self, init, condition, update, body):
+        fn = self.fn
+        self.scopes.append({})
+        if init is not None:
+            self.lower_statement(init)
+        # The block that jumps into the header is its only entry from outside
+        # the loop, which makes it the preheader for loop-invariant motion.
+        header = fn.new_block()
+        self.jump(header)
+
+        self.block = header
+        cond = self.lower_expr(condition)
+        body_block = fn.new_block()
+        exit_block = fn.new_block()
+        self.branch(cond, body_block, exit_block)
+        self.seal(body_block)
+
+        self.block = body_block
+        self.lower_block(body.statements)
+        if update is not None and not self.terminated():
+            self.lower_statement(update)
+        self.jump(header)
+
+        self.seal(header)
+        self.seal(exit_block)
+        self.block = exit_block
+        self.scopes.pop()
+
+    # --- expressions --------------------------------------------------------
+
+    def lower_expr(self, expr):
+        return self.lower_typed(expr)[0]
+
+    def lower_typed(self, expr):
+        # Returns (value, PArL type of expr or None when it cannot be told);
+        # the types are the declared ones the backends go by
+        fn = self.fn
+        block = self.block
+        if isinstance(expr, ASTBinaryOp):
+            # A flat chain is a long left spine; lower it bottom-up in a loop
+            spine = []
+            while isinstance(expr, ASTBinaryOp):
+                spine.append(expr)
+                expr = expr.left
+            value, value_type = self.lower_typed(expr)
+            for node in reversed(spine):
+                if node.operator in ('and', 'or'):
+                    value, value_type = self.lower_logical(node, value), 'bool'
+                else:
+                    value, value_type = self.lower_binary(node, value, value_type)
+            return value, value_type
+        if isinstance(expr, ASTUnaryOp):
+            operand, operand_type = self.lower_typed(expr.operand)
+            result = 'bool' if expr.operator == 'not' else operand_type
+            return fn.emit(self.block, UNARY_OPS[expr.operator], operand), result
+        if isinstance(expr, ASTCast):
+            value = self.lower_expr(expr.expression)
+            return fn.emit(self.block, CAST, value, fn.add_name(expr.target_type)), expr.target_type
+        if isinstance(expr, ASTIndex):
+            target, array_type = self.lower_typed(expr.array)
+            value = fn.emit(self.block, ALOAD, target, self.lower_expr(expr.index))
+            return value, element_type(array_type)
+        if isinstance(expr, ASTArrayLiteral):
+            return self.lower_array(expr, '[]'), None
+        if isinstance(expr, ASTFunctionCall):
+            args = [self.lower_expr(arg) for arg in expr.args]
+            op = BUILTIN if expr.name in PAD_BUILTINS else CALL
+            result = BUILTIN_TYPES.get(expr.name) if op == BUILTIN else self.functions.get(expr.name)
+            return fn.emit(self.block, op, fn.add_name(expr.name), fn.add_extra(args), len(args)), result
+        name = name_of(expr)
+        if name is not None:
+            var = self.lookup(name)
+            if var is not None:
+                return self.read_variable(var, block), self.types.get(var)
+            if name in PAD_BUILTINS:
+                return fn.emit(block, BUILTIN, fn.add_name(name), fn.add_extra([]), 0), BUILTIN_TYPES.get(name)
+            return fn.emit(block, GLOAD, fn.add_name(name)), self.global_types.get(name)
+        if isinstance(expr, ASTLiteral):
+            value = literal_value(expr.value)
+            result = 'colour' if expr.value.startswith('#') else type(value).__name__
+            return fn.emit(block, CONST, fn.add_const(value)), result
+        raise IRError(f"Cannot lower expression {type(expr).__name__}")
+
+    def lower_binary(self, expr, left, left_type):
+        # left is the already lowered left operand
+        right, right_type = self.lower_typed(expr.right)
+        op = BINARY_OPS[expr.operator]
+        if op in (LT, LE, GT, GE, EQ, NE):
+            result = 'bool'
+        elif op == DIV and left_type in INTEGRAL_TYPES and right_type in INTEGRAL_TYPES:
+            op, result = IDIV, 'int'
+        elif op == DIV and 'float' in (left_type, right_type):
+            op, result = FDIV, 'float'
+        elif op == DIV:
+            result = None
+        else:
+            result = 'float' if 'float' in (left_type, right_type) else left_type
+        return self.fn.emit(self.block, op, left, right), result
+
+    def lower_logical(self, expr, left):
+        # 'and' and 'or' short-circuit: the right operand is evaluated in a
+        # block of its own and a phi in the join block picks the result
+        fn = self.fn
+        left_end = self.block
+        right_block = fn.new_block()
+        join = fn.new_block()
+        if expr.operator == 'and':
+            self.branch(left, right_block, join)
+        else:
+            self.branch(left, join, right_block)
+        self.seal(right_block)
+
+        self.block = right_block
+        right = self.lower_expr(expr.right)
+        right_end = self.block
+        self.jump(join)
+        self.seal(join)
+
+        self.block = join
+        phi = self.new_phi(join)
+        fn.b[phi] = fn.add_extra([left_end, left, right_end, right])
+        fn.c[phi] = 2
+        return phi
+
+    def finish(self):
+        if not self.terminated():
+            self.fn.emit(self.block, RET, -1)
+        remove_unreachable(self.fn)
+        simplify_phis(self.fn)
+        self.fn.resolve_operands()
+        self.fn.compact()
+        return self.fn
+
+def lower(program):
+    module = IRModule()
+    functions = [d for d in program.declarations if isinstance(d, ASTFunctionDeclaration)]
+    top_level = [d for d in program.declarations if not isinstance(d, ASTFunctionDeclaration)]
+
+    # Top-level variables only live in memory when a function refers to them;
+    # otherwise they are ordinary SSA values of the .main function.
+    shared = set()
+    for func in functions:
+        shared |= free_names(func)
+    module.globals = [d.name for d in top_level
+                      if isinstance(d, ASTVariableDeclaration) and d.name in shared]
+    global_names = set(module.globals)
+    global_types = {d.name: d.type for d in top_level if isinstance(d, ASTVariableDeclaration)}
+    return_types = {func.name: func.return_type for func in functions}
+
+    for func in functions:
+        fn = IRFunction(func.name, [p.name for p in func.parameters])
+        lowering = Lowering(fn, return_types, global_names, global_types)
+        for i, param in enumerate(func.parameters):
+            var = lowering.declare(param.name, param.type)
+            lowering.write_variable(var, lowering.block, fn.emit(lowering.block, PARAM, i))
+        lowering.lower_block(func.body.statements)
+        module.functions[func.name] = lowering.finish()
+
+    fn = IRFunction('.main', [])
+    lowering = Lowering(fn, return_types, global_names, global_types)
+    for stmt in top_level:
+        lowering.lower_statement(stmt)
+    module.functions['.main'] = lowering.finish()
+    return module
+
+# --- analyses ---------------------------------------------------------------
+
+def reverse_postorder(fn):
+    order = []
+    seen = {0}
+    stack = [(0, iter(fn.successors(0)))]
+    while stack:
+        block, succs = stack[-1]
+        for succ in succs:
+            if succ not in seen:
+                seen.add(succ)
+                stack.append((succ, iter(fn.successors(succ))))
+                break
+        else:
+            stack.pop()
+            order.append(block)
+    order.reverse()
+    return order
+
+def remove_unreachable(fn):
+    reachable = set(reverse_postorder(fn))
+    for block in range(len(fn.blocks)):
+        if block not in reachable:
+            for index in list(fn.phis[block]) + list(fn.blocks[block]):
+                fn.op[index] = NOP
+            fn.blocks[block] = array('i')
+            fn.phis[block] = []
+            fn.preds[block] = []
+            continue
+        fn.preds[block] = [p for p in fn.preds[block] if p in reachable]
+        for phi in fn.phis[block]:
+            start = fn.b[phi]
+            pairs = [(fn.extra[start + 2 * i], fn.extra[start + 2 * i + 1])
+                     for i in range(fn.c[phi])]
+            pairs = [pair for pair in pairs if pair[0] in reachable]
+            for i, (pred, value) in enumerate(pairs):
+                fn.extra[start + 2 * i] = pred
+                fn.extra[start + 2 * i + 1] = value
+            fn.c[phi] = len(pairs)
+
+def simplify_phis(fn):
+    # Remove phis whose operands are all the same value (or the phi itself),
+    # revisiting the users of every phi that gets removed.
+    users = {}
+    for index in fn.instructions():
+        for value in fn.operands(index):
+            users.setdefault(value, []).append(index)
+    worklist = [phi for block in fn.phis for phi in block]
+    while worklist:
+        phi = worklist.pop()
+        if fn.op[phi] != PHI:
+            continue
+        distinct = {v for v in fn.operands(phi) if v != phi}
+        if len(distinct) != 1:
+            continue
+        fn.replace(phi, distinct.pop())
+        worklist.extend(u for u in users.get(phi, ()) if fn.op[u] == PHI)
+
+def dominators(fn):
+    # Cooper, Harvey and Kennedy, "A Simple, Fast Dominance Algorithm"
+    order = reverse_postorder(fn)
+    position = {block: i for i, block in enumerate(order)}
+    idom = {0: 0}
+    changed = True
+    while changed:
+        changed = False
+        for block in order[1:]:
+            new_idom = None
+            for pred in fn.preds[block]:
+                if pred not in idom:
+                    continue
+                if new_idom is None:
+                    new_idom = pred
+                    continue
+                x, y = pred, new_idom
+                while x != y:
+                    while position[x] > position[y]:
+                        x = idom[x]
+                    while position[y] > position[x]:
+                        y = idom[y]
+                new_idom = x
+            if idom.get(block) != new_idom:
+                idom[block] = new_idom
+                changed = True
+    return idom, order
+
+def dominator_tree(idom):
+    children = {}
+    for block, parent in idom.items():
+        if block != parent:
+            children.setdefault(parent, []).append(block)
+    return children
+
+# --- optimizations ----------------------------------------------------------
+
+def copy_propagate(fn):
+    count = 0
+    for index in fn.instructions():
+        if fn.op[index] == COPY:
+            fn.replace(index, fn.resolve(fn.a[index]))
+            count += 1
+    simplify_phis(fn)
+    fn.resolve_operands()
+    fn.compact()
+    return count
+
+def eliminate_common_subexpressions(fn):
+    # Dominator-scoped value numbering: an expression computed in a block is
+    # available in every block that block dominates.
+    idom, _ = dominators(fn)
+    children = dominator_tree(idom)
+    available = {}
+    count = 0
+    stack = [(0, None)]
+    while stack:
+        block, undo = stack.pop()
+        if undo is not None:
+            for key, previous in undo:
+                if previous is None:
+                    del available[key]
+                else:
+                    available[key] = previous
+            continue
+        log = []
+        for index in fn.blocks[block]:
+            op = fn.op[index]
+            if op not in PURE_OPS or op == COPY:
+                continue
+            operands = fn.operands(index)
+            if op in COMMUTATIVE:
+                operands.sort()
+            if op == CONST:
+                key = (op, fn.a[index])
+            elif op == CAST:
+                key = (op, operands[0], fn.b[index])
+            else:
+                key = (op, *operands)
+            existing = available.get(key)
+            if existing is not None:
+                fn.replace(index, existing)
+                count += 1
+            else:
+                log.append((key, None))
+                available[key] = index
+        stack.append((block, log))
+        for child in children.get(block, ()):
+            stack.append((child, None))
+    fn.resolve_operands()
+    fn.compact()
+    return count
+
+def natural_loops(fn):
+    # Returns (header, body blocks) for each loop, innermost first
+    idom, order = dominators(fn)
+
+    # Number the dominator tree so dominance is an interval check
+    children = dominator_tree(idom)
+    enter, leave = {}, {}
+    clock = 0
+    stack = [(0, False)]
+    while stack:
+        block, done = stack.pop()
+        clock += 1
+        if done:
+            leave[block] = clock
+            continue
+        enter[block] = clock
+        stack.append((block, True))
+        stack.extend((child, False) for child in children.get(block, ()))
+
+    def dominates(a, b):
+        return enter[a] <= enter[b] and leave[b] <= leave[a]
+
+    loops = {}
+    for block in order:
+        for succ in fn.successors(block):
+            if succ in idom and dominates(succ, block):
+                body = loops.setdefault(succ, {succ})
+                stack = [block]
+                while stack:
+                    node = stack.pop()
+                    if node not in body:
+                        body.add(node)
+                        stack.extend(fn.preds[node])
+    return sorted(loops.items(), key=lambda item: len(item[1]))
+
+def hoist_loop_invariants(fn):
+    count = 0
+    position = {block: i for i, block in enumerate(reverse_postorder(fn))}
+    for header, body in natural_loops(fn):
+        outside = [p for p in fn.preds[header] if p not in body]
+        if len(outside) != 1 or fn.successors(outside[0]) != [header]:
+            continue
+        preheader = outside[0]
+        hoisted = []
+        for block in sorted(body, key=position.__getitem__):
+            kept = array('i')
+            for index in fn.blocks[block]:
+                if invariant(fn, index, body):
+                    fn.block_of[index] = preheader
+                    hoisted.append(index)
+                else:
+                    kept.append(index)
+            fn.blocks[block] = kept
+        if hoisted:
+            instrs = fn.blocks[preheader]
+            fn.blocks[preheader] = instrs[:-1] + array('i', hoisted) + instrs[-1:]
+            count += len(hoisted)
+    return count
+
+def invariant(fn, index, body):
+    op = fn.op[index]
+    if op not in PURE_OPS or may_trap(fn, index):
+        return False
+    # Operands hoisted earlier in this pass already have their new block
+    return all(fn.block_of[v] not in body for v in fn.operands(index))
+
+def may_trap(fn, index):
+    if fn.op[index] not in DIVISIONS:
+        return False
+    divisor = fn.resolve(fn.b[index])
+    return fn.op[divisor] != CONST or not fn.consts[fn.a[divisor]]
+
+def eliminate_dead_code(fn):
+    # A division that may trap is kept even when its result is unused
+    live = set()
+    worklist = [i for i in fn.instructions()
+                if fn.op[i] != NOP and fn.op[i] != PHI
+                and (fn.op[i] not in PURE_OPS or may_trap(fn, i))]
+    while worklist:
+        index = worklist.pop()
+        if index in live:
+            continue
+        live.add(index)
+        worklist.extend(fn.operands(index))
+    count = 0
+    for index in fn.instructions():
+        if fn.op[index] != NOP and index not in live:
+            fn.op[index] = NOP
+            count += 1
+    fn.compact()
+    return count
+
+PASSES = [
+    ('copy propagation', copy_propagate),
+    ('common subexpression elimination', eliminate_common_subexpressions),
+    ('loop-invariant code motion', hoist_loop_invariants),
+    ('dead code elimination', eliminate_dead_code),
+]
+
+def optimize(module):
+    # Returns {function name: {pass name: number of instructions changed}}
+    stats = {}
+    for fn in module.functions.values():
+        stats[fn.name] = {name: run(fn) for name, run in PASSES}
+    return stats
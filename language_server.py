@@ -0,0 +1,442 @@
+# language_server.py - Language Server Protocol front end for PArL (JSON-RPC over stdio)
+#
+# Run as `python language_server.py`. Every open document keeps its tokens,
+# AST, symbol table and a position index in memory. Edits are debounced and
+# analysed on a background worker; an analysis that is overtaken by a newer
+# edit stops at the next phase boundary and its results are thrown away.
+# Hover and go-to-definition are answered from the last finished index with a
+# binary search, so they never wait for the analysis.
+import json
+import os
+import re
+import sys
+import threading
+import time
+import urllib.parse
+from bisect import bisect_right
+
+from token_types import TokenType
+from lexer import Lexer
+from parser import Parser, ParserError
+from semantic_analysis import SemanticAnalyzer, SemanticAnalysisError
+from workspace_index import WorkspaceIndex
+
+DEBOUNCE_SECONDS = 0.15
+
+# LSP constants
+SYNC_FULL = 1
+SEVERITY_ERROR = 1
+MESSAGE_ERROR = 1
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+SERVER_NOT_INITIALIZED = -32002
+
+class AnalysisCancelled(Exception):
+    pass
+
+class Definition:
+    def __init__(self, name, kind, line, column, detail):
+        self.name = name
+        self.kind = kind
+        self.line = line
+        self.column = column
+        self.detail = detail
+
+class SymbolIndex:
+    # Maps every identifier token to the declaration it refers to. Built from
+    # the token stream alone so it stays available while the file does not
+    # parse.
+    def __init__(self, tokens):
+        self.definitions = []
+        self.starts = []        # (line, column) of each indexed token, sorted
+        self.ends = []          # column just past each indexed token
+        self.targets = []       # index into definitions, or -1
+        self.functions = {}
+        self.build(tokens)
+
+    def define(self, name, kind, tok, detail):
+        self.definitions.append(Definition(name, kind, tok.line, tok.column, detail))
+        return len(self.definitions) - 1
+
+    def record(self, tok, target):
+        self.starts.append((tok.line, tok.column))
+        self.ends.append(tok.column + len(tok.lexeme))
+        self.targets.append(target)
+
+    def build(self, tokens):
+        # Functions are visible everywhere, so collect them first
+        for i, tok in enumerate(tokens):
+            if tok.lexeme == 'fun' and tok.type == TokenType.KEYWORD \
+                    and i + 1 < len(tokens) and tokens[i + 1].type == TokenType.IDENTIFIER:
+                name_tok = tokens[i + 1]
+                self.functions.setdefault(name_tok.lexeme, self.define(
+                    name_tok.lexeme, 'function', name_tok, function_signature(tokens, i)))
+
+        scopes = [{}]
+        # Scope depths at which a 'fun' or 'for' header scope ends; their
+        # parameters / loop variable outlive the header but not the body
+        header_scopes = []
+        in_header = False
+        for i, tok in enumerate(tokens):
+            lexeme = tok.lexeme
+            following = tokens[i + 1] if i + 1 < len(tokens) else None
+            if tok.type == TokenType.KEYWORD and lexeme in ('fun', 'for'):
+                scopes.append({})
+                header_scopes.append(len(scopes))
+                in_header = lexeme == 'fun'
+            elif lexeme == '{' and tok.type == TokenType.SEPARATOR:
+                in_header = False
+                scopes.append({})
+            elif lexeme == '}' and tok.type == TokenType.SEPARATOR:
+                if len(scopes) > 1:
+                    scopes.pop()
+                while header_scopes and len(scopes) == header_scopes[-1]:
+                    scopes.pop()
+                    header_scopes.pop()
+            elif tok.type == TokenType.IDENTIFIER:
+                previous = tokens[i - 1].lexeme if i else None
+                if previous == 'fun':
+                    self.record(tok, self.functions.get(lexeme, -1))
+                elif previous == 'let' or (in_header and following is not None and following.lexeme == ':'):
+                    type_name = tokens[i + 2].lexeme if i + 2 < len(tokens) else '?'
+                    kind = 'variable' if previous == 'let' else 'parameter'
+                    detail = f"let {lexeme}: {type_name}" if kind == 'variable' else f"{lexeme}: {type_name}"
+                    target = self.define(lexeme, kind, tok, detail)
+                    scopes[-1][lexeme] = target
+                    self.record(tok, target)
+                elif following is not None and following.lexeme == '(':
+                    self.record(tok, self.functions.get(lexeme, -1))
+                else:
+                    self.record(tok, resolve(scopes, lexeme))
+
+    def lookup(self, line, column):
+        i = bisect_right(self.starts, (line, column)) - 1
+        if i >= 0 and self.starts[i][0] == line and column < self.ends[i]:
+            target = self.targets[i]
+            return self.definitions[target] if target >= 0 else None
+        return None
+
+def resolve(scopes, name):
+    for scope in reversed(scopes):
+        if name in scope:
+            return scope[name]
+    return -1
+
+def function_signature(tokens, start):
+    # Rebuilds "fun Name(a: int, b: float) -> int" from the header tokens,
+    # tolerating a header that is still being typed
+    token = lambda i: tokens[i] if i < len(tokens) else tokens[-1]
+    params = []
+    i = start + 3
+    while token(i).type == TokenType.IDENTIFIER and token(i + 1).lexeme == ':':
+        params.append(f"{token(i).lexeme}: {token(i + 2).lexeme}")
+        i += 3
+        if token(i).lexeme == ',':
+            i += 1
+    return_type = token(i + 2).lexeme if token(i + 1).lexeme == '->' else '?'
+    return f"fun {token(start + 1).lexeme}({', '.join(params)}) -> {return_type}"
+
+class Document:
+    def __init__(self, uri, text, version):
+        self.uri = uri
+        self.text = text
+        self.version = version
+        self.tokens = []
+        self.program = None
+        self.symbol_table = None
+        self.index = SymbolIndex([])
+
+def analyze(text, still_current, workspace=None):
+    # Returns (tokens, program, symbol_table, index, diagnostics); raises
+    # AnalysisCancelled as soon as still_current() turns false. Calls to
+    # functions declared in other files resolve through workspace.
+    diagnostics = []
+    tokens = Lexer(text, verbose=False).tokenize()
+    for tok in tokens:
+        if tok.type == TokenType.ERROR:
+            diagnostics.append(diagnostic(tok.line, tok.column, len(tok.lexeme),
+                                          f"Unexpected character '{tok.lexeme}'"))
+    if not still_current():
+        raise AnalysisCancelled()
+
+    index = SymbolIndex(tokens)
+    if not still_current():
+        raise AnalysisCancelled()
+
+    program = symbol_table = None
+    parser = Parser([t for t in tokens if t.type != TokenType.ERROR], verbose=False)
+    try:
+        program = parser.parse_program()
+    except (ParserError, IndexError) as error:
+        tok = parser.peek()
+        diagnostics.append(diagnostic(tok.line, tok.column, len(tok.lexeme), str(error) or "Unexpected end of input"))
+    if not still_current():
+        raise AnalysisCancelled()
+
+    if program is not None:
+        analyzer = SemanticAnalyzer(workspace)
+        try:
+            analyzer.analyze(program)
+        except SemanticAnalysisError as error:
+            diagnostics.append(locate_semantic_error(tokens, error.message))
+        symbol_table = analyzer.symbol_table
+    return tokens, program, symbol_table, index, diagnostics
+
+def locate_semantic_error(tokens, message):
+    # Semantic errors carry no position; point at the first occurrence of the
+    # name they quote, falling back to the top of the file.
+    match = re.search(r"'([^']*)'", message)
+    if match:
+        for tok in tokens:
+            if tok.lexeme == match.group(1):
+                return diagnostic(tok.line, tok.column, len(tok.lexeme), message)
+    return diagnostic(1, 1, 0, message)
+
+def diagnostic(line, column, length, message):
+    start = {'line': line - 1, 'character': column - 1}
+    end = {'line': line - 1, 'character': column - 1 + length}
+    return {'range': {'start': start, 'end': end}, 'severity': SEVERITY_ERROR,
+            'source': 'parl', 'message': message}
+
+def lsp_range(line, column, length):
+    return {'start': {'line': line - 1, 'character': column - 1},
+            'end': {'line': line - 1, 'character': column - 1 + length}}
+
+def uri_to_path(uri):
+    if not uri.startswith('file://'):
+        return None
+    return urllib.parse.unquote(urllib.parse.urlparse(uri).path)
+
+class LanguageServer:
+    def __init__(self, reader, writer, debounce=DEBOUNCE_SECONDS):
+        self.reader = reader
+        self.writer = writer
+        self.debounce = debounce
+        self.documents = {}
+        self.workspace = WorkspaceIndex()
+        self.initialized = False
+        self.running = True
+        self.write_lock = threading.Lock()
+        self.pending = {}           # uri -> time the analysis may start
+        self.busy = False
+        self.condition = threading.Condition()
+        self.worker = threading.Thread(target=self.work, name='parl-analysis', daemon=True)
+        self.worker.start()
+
+    # --- transport ----------------------------------------------------------
+
+    def read_message(self):
+        length = None
+        while True:
+            line = self.reader.readline()
+            if not line:
+                return None
+            line = line.strip()
+            if not line:
+                break
+            name, _, value = line.decode('ascii').partition(':')
+            if name.lower() == 'content-length':
+                length = int(value)
+        if length is None:
+            return None
+        return json.loads(self.reader.read(length).decode('utf-8'))
+
+    def send(self, message):
+        message['jsonrpc'] = '2.0'
+        body = json.dumps(message).encode('utf-8')
+        with self.write_lock:
+            self.writer.write(f"Content-Length: {len(body)}\r\n\r\n".encode('ascii') + body)
+            self.writer.flush()
+
+    def serve_forever(self):
+        while self.running:
+            try:
+                message = self.read_message()
+            except (ValueError, UnicodeDecodeError):
+                self.send({'id': None, 'error': {'code': PARSE_ERROR, 'message': 'Invalid message'}})
+                continue
+            if message is None:
+                break
+            if not isinstance(message, dict):
+                self.send({'id': None, 'error': {'code': INVALID_REQUEST, 'message': 'Invalid request'}})
+                continue
+            self.handle(message)
+        self.stop()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+    def log_error(self, text):
+        self.send({'method': 'window/logMessage', 'params': {'type': MESSAGE_ERROR, 'message': text}})
+
+    # --- dispatch -----------------------------------------------------------
+
+    def handle(self, message):
+        # A failing handler never takes the server down: requests get an
+        # error reply and failed notifications are logged to the client
+        method = message.get('method')
+        handler = getattr(self, 'on_' + str(method or '').replace('/', '_').replace('$', ''), None)
+        if 'id' not in message:
+            if handler is not None:
+                try:
+                    handler(message.get('params') or {})
+                except Exception as error:
+                    self.log_error(f"{method} failed: {error!r}")
+            return
+        if handler is None:
+            self.send({'id': message['id'], 'error': {'code': METHOD_NOT_FOUND, 'message': f"Unknown method {method}"}})
+        elif not self.initialized and method != 'initialize':
+            self.send({'id': message['id'], 'error': {'code': SERVER_NOT_INITIALIZED, 'message': 'Not initialized'}})
+        else:
+            try:
+                result = handler(message.get('params') or {})
+            except (KeyError, TypeError) as error:
+                # Handlers index straight into params, so missing or
+                # mistyped fields surface as these
+                self.send({'id': message['id'], 'error': {'code': INVALID_PARAMS, 'message': f"Invalid params: {error!r}"}})
+            except Exception as error:
+                self.send({'id': message['id'], 'error': {'code': INTERNAL_ERROR, 'message': f"{method} failed: {error!r}"}})
+            else:
+                self.send({'id': message['id'], 'result': result})
+
+    def on_initialize(self, params):
+        self.initialized = True
+        root = uri_to_path(params.get('rootUri') or '')
+        if root and os.path.isdir(root):
+            self.workspace.refresh(root)
+        return {'capabilities': {'textDocumentSync': SYNC_FULL, 'hoverProvider': True,
+                                 'definitionProvider': True},
+                'serverInfo': {'name': 'parl-language-server'}}
+
+    def on_shutdown(self, params):
+        return None
+
+    def on_exit(self, params):
+        self.running = False
+
+    def on_textDocument_didOpen(self, params):
+        item = params['textDocument']
+        self.documents[item['uri']] = Document(item['uri'], item['text'], item.get('version', 0))
+        self.schedule(item['uri'])
+
+    def on_textDocument_didChange(self, params):
+        document = self.documents.get(params['textDocument']['uri'])
+        if document is None or not params.get('contentChanges'):
+            return
+        # Full synchronisation: the last change holds the whole text
+        document.text = params['contentChanges'][-1]['text']
+        document.version = params['textDocument'].get('version', document.version + 1)
+        self.schedule(document.uri)
+
+    def on_textDocument_didClose(self, params):
+        uri = params['textDocument']['uri']
+        self.documents.pop(uri, None)
+        # The worker, which owns workspace updates, puts the saved file back
+        # in place of the unsaved buffer
+        self.schedule(uri)
+        self.send({'method': 'textDocument/publishDiagnostics', 'params': {'uri': uri, 'diagnostics': []}})
+
+    def on_textDocument_hover(self, params):
+        definition = self.definition_at(params)
+        if definition is None:
+            return None
+        return {'contents': {'kind': 'markdown', 'value': f"```parl\n{definition.detail}\n```"}}
+
+    def on_textDocument_definition(self, params):
+        definition = self.definition_at(params)
+        if definition is None:
+            return None
+        return {'uri': params['textDocument']['uri'],
+                'range': lsp_range(definition.line, definition.column, len(definition.name))}
+
+    def definition_at(self, params):
+        document = self.documents.get(params['textDocument']['uri'])
+        if document is None:
+            return None
+        position = params['position']
+        return document.index.lookup(position['line'] + 1, position['character'] + 1)
+
+    # --- background analysis ------------------------------------------------
+
+    def schedule(self, uri):
+        with self.condition:
+            self.pending[uri] = time.monotonic() + self.debounce
+            self.condition.notify_all()
+
+    def work(self):
+        while True:
+            with self.condition:
+                while self.running:
+                    now = time.monotonic()
+                    due = [uri for uri, start in self.pending.items() if start <= now]
+                    if due:
+                        break
+                    timeout = min(self.pending.values()) - now if self.pending else None
+                    self.condition.wait(timeout)
+                if not self.running:
+                    return
+                uri = due[0]
+                del self.pending[uri]
+                document = self.documents.get(uri)
+                self.busy = True
+            try:
+                if document is not None:
+                    self.run_analysis(document)
+                else:
+                    self.reindex_saved(uri)
+            except Exception as error:
+                # One bad analysis must not stop the worker serving the rest
+                self.log_error(f"Analysis of {uri} failed: {error!r}")
+            finally:
+                with self.condition:
+                    self.busy = False
+                    self.condition.notify_all()
+
+    def reindex_saved(self, uri):
+        path = uri_to_path(uri)
+        if not path:
+            return
+        if os.path.isfile(path):
+            self.workspace.update_file(path)
+        else:
+            self.workspace.remove_file(path)
+
+    def run_analysis(self, document):
+        text, version = document.text, document.version
+        still_current = lambda: self.running and document.version == version \
+            and self.documents.get(document.uri) is document
+        try:
+            path = uri_to_path(document.uri)
+            if path:
+                self.workspace.update_file(path, text)
+            tokens, program, symbol_table, index, diagnostics = analyze(text, still_current, self.workspace)
+        except AnalysisCancelled:
+            return
+        if not still_current():
+            return
+        document.tokens, document.program = tokens, program
+        document.symbol_table, document.index = symbol_table, index
+        self.send({'method': 'textDocument/publishDiagnostics',
+                   'params': {'uri': document.uri, 'version': version, 'diagnostics': diagnostics}})
+
+    def wait_idle(self, timeout=None):
+        # Blocks until no analysis is queued or running (used by tests)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while self.pending or self.busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining if remaining is not None else 0.05)
+        return True
+
+def main():
+    LanguageServer(sys.stdin.buffer, sys.stdout.buffer).serve_forever()
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 # lexer.py (fully table-driven DFA implementation)
 from token_types import TokenType
 from token1 import Token
+from limits import LimitExceeded
 
 CHAR_CLASSES = {
     'LETTER': 0,
@@ -14,41 +15,86 @@ CHAR_CLASSES = {
     'OTHER': 8
 }
 
-PAD_BUILTINS = {
+PAD_BUILTINS = frozenset({
     '__width', '__height', '__read', '__random_int', '__delay', '__write', '__write_box', '__print'
-}
+})
 
-MULTI_CHAR_OPERATORS = {
+MULTI_CHAR_OPERATORS = frozenset({
     '==', '!=', '<=', '>=', '->'
-}
+})
+
+KEYWORDS = frozenset({
+    'fun', 'let', 'return', 'if', 'else', 'while', 'for',
+    'true', 'false', 'as', 'int', 'float', 'bool', 'colour'
+})
+OPERATORS = frozenset({
+    '+', '-', '*', '/', '==', '!=', '=', '<', '<=', '>', '>=',
+    'and', 'or', 'not', '->'
+})
+SEPARATORS = frozenset({'(', ')', '{', '}', '[', ']', ';', ',', ':'})
+HEX_DIGITS = frozenset('0123456789abcdefABCDEF')
+
+# Token kind of every reserved word, so an identifier-shaped lexeme is
+# classified with a single dict probe. Keywords win over operators, which win
+# over builtins, matching the order the sets used to be checked in.
+RESERVED_WORDS = {}
+for word in PAD_BUILTINS:
+    RESERVED_WORDS[word] = TokenType.BUILTIN
+for word in OPERATORS:
+    if word.isalpha():
+        RESERVED_WORDS[word] = TokenType.OPERATOR
+for word in KEYWORDS:
+    RESERVED_WORDS[word] = TokenType.KEYWORD
+del word
+
+CHECKPOINT_TOKENS = 4096
+CHECK_TIME_TOKENS = 256
 
 class Lexer:
-    def __init__(self, source_code):
+    def __init__(self, source_code, verbose=True, names=None, checkpoint=None, limits=None):
         self.source = source_code
+        self.verbose = verbose
         self.position = 0
         self.line = 1
         self.column = 1
         self.start_column = 1
 
-        self.keywords = {
-            'fun', 'let', 'return', 'if', 'else', 'while', 'for',
-            'true', 'false', 'as', 'int', 'float', 'bool', 'colour'
-        }
-        self.operators = {
-            '+', '-', '*', '/', '==', '!=', '=', '<', '<=', '>', '>=',
-            'and', 'or', 'not', '->'
-        }
-        self.separators = {'(', ')', '{', '}', '[', ']', ';', ',', ':'}
+        self.keywords = KEYWORDS
+        self.operators = OPERATORS
+        self.separators = SEPARATORS
+        # Identifier intern table: every occurrence of a name yields the same
+        # string object, so symbol tables built from the tokens compare names
+        # by identity. Pass a shared dict to intern across several sources.
+        self.names = {} if names is None else names
+        # Called every CHECKPOINT_TOKENS tokens; may raise to abandon the work
+        self.checkpoint = checkpoint
+        # Optional limits.Limits for untrusted source
+        if limits is not None and limits.time_budget is not None and limits.deadline is None:
+            limits = limits.start()
+        self.limits = limits
+        if limits is not None and limits.max_source_size is not None \
+                and len(source_code) > limits.max_source_size:
+            raise LimitExceeded('source_size', limits.max_source_size)
 
     def tokenize(self):
         tokens = []
+        limits = self.limits
+        max_tokens = limits.max_tokens if limits is not None else None
         while True:
             token = self.get_next_token()
-            print(f"{token}")
+            if self.verbose:
+                print(f"{token}")
 
             tokens.append(token)
             if token.type == TokenType.EOF:
                 break
+            if limits is not None:
+                if max_tokens is not None and len(tokens) > max_tokens:
+                    raise LimitExceeded('tokens', max_tokens, token.line)
+                if len(tokens) % CHECK_TIME_TOKENS == 0:
+                    limits.check_time(token.line)
+            if self.checkpoint is not None and len(tokens) % CHECKPOINT_TOKENS == 0:
+                self.checkpoint()
         return tokens
 
     def get_next_token(self):
@@ -67,11 +113,11 @@ class Lexer:
             self.advance()
             return Token(TokenType.OPERATOR, two_char, self.line, self.start_column)
 
-        # DFA processing
+        # DFA processing; the lexeme is sliced out of the source once the
+        # longest match is known rather than built up one character at a time
+        start = self.position
         current_state = 0
-        lexeme = ''
         last_accepting_state = None
-        last_accepting_lexeme = ''
         last_accepting_pos = self.position
         hex_count = 0
 
@@ -82,8 +128,11 @@ class Lexer:
             next_state = DFA_TRANSITIONS.get(current_state, {}).get(char_class, -1)
             if next_state == -1:
                 break
+            # The DFA's letter class is wider than hex digits
+            if current_state == 3 and char not in HEX_DIGITS:
+                break
 
-            lexeme += self.advance()
+            self.advance()
             current_state = next_state
 
             if current_state == 3:
@@ -91,30 +140,30 @@ class Lexer:
                     hex_count += 1
                 if hex_count == 6:
                     last_accepting_state = current_state
-                    last_accepting_lexeme = lexeme
                     last_accepting_pos = self.position
                 elif hex_count > 6:
                     break
             elif current_state in DFA_ACCEPTING_STATES:
                 last_accepting_state = current_state
-                last_accepting_lexeme = lexeme
                 last_accepting_pos = self.position
 
         if last_accepting_state is not None:
+            lexeme = self.source[start:last_accepting_pos]
             self.position = last_accepting_pos
-            self.column = self.start_column + len(last_accepting_lexeme)
+            self.column = self.start_column + len(lexeme)
             token_type = DFA_ACCEPTING_STATES[last_accepting_state]
 
             if token_type == TokenType.IDENTIFIER:
-                if last_accepting_lexeme in self.keywords:
-                    token_type = TokenType.KEYWORD
-                elif last_accepting_lexeme in self.operators:
-                    token_type = TokenType.OPERATOR
-                elif last_accepting_lexeme in PAD_BUILTINS:
-                    token_type = TokenType.BUILTIN
+                token_type = RESERVED_WORDS.get(lexeme, TokenType.IDENTIFIER)
+                if token_type == TokenType.IDENTIFIER:
+                    lexeme = self.names.setdefault(lexeme, lexeme)
 
-            return Token(token_type, last_accepting_lexeme, self.line, self.start_column)
+            return Token(token_type, lexeme, self.line, self.start_column)
 
+        # No match: report the first character and lex again right after it
+        # (the DFA may have run ahead, e.g. over the 'ab' of '#ab')
+        self.position = start
+        self.column = self.start_column
         error_char = self.advance()
         return Token(TokenType.ERROR, error_char, self.line, self.start_column)
 
@@ -124,17 +173,25 @@ class Lexer:
             if ch in ' \t\r\n':
                 self.advance()
             elif ch == '/' and self.peek(1) == '/':
-                while self.peek() and self.peek() != '\n':
-                    self.advance()
+                end = self.source.find('\n', self.position)
+                self.skip_to(len(self.source) if end == -1 else end)
             elif ch == '/' and self.peek(1) == '*':
-                self.advance(); self.advance()
-                while self.peek() and not (self.peek() == '*' and self.peek(1) == '/'):
-                    self.advance()
-                if self.peek():
-                    self.advance(); self.advance()
+                # An unterminated comment runs to the end of the source
+                end = self.source.find('*/', self.position + 2)
+                self.skip_to(len(self.source) if end == -1 else end + 2)
             else:
                 break
 
+    def skip_to(self, end):
+        # Jump over source[position:end], which may span lines, in one step
+        newlines = self.source.count('\n', self.position, end)
+        if newlines:
+            self.line += newlines
+            self.column = end - self.source.rfind('\n', self.position, end)
+        else:
+            self.column += end - self.position
+        self.position = end
+
     def get_char_class(self, ch):
         if ch.isalpha():
             return CHAR_CLASSES['LETTER']
@@ -0,0 +1,63 @@
+# limits.py - Resource limits for compiling untrusted PArL source
+#
+# A Limits instance is handed to the Lexer and the Parser; every limit is
+# optional and a breach raises LimitExceeded straight away instead of letting
+# the front end run out of memory, time or Python stack.
+#
+#   limits = Limits(max_depth=64, time_budget=0.5).start()
+#   tokens = Lexer(source, verbose=False, limits=limits).tokenize()
+#   program = Parser(tokens, verbose=False, limits=limits).parse_program()
+#
+# start() fixes the deadline for the time budget; passing the same started
+# instance to several phases makes them share one budget.
+import time
+
+DEFAULT_MAX_SOURCE_SIZE = 4 * 1024 * 1024
+DEFAULT_MAX_TOKENS = 1_000_000
+# Each level of parenthesised expression costs about ten Python frames in the
+# parser, so this keeps well inside the default recursion limit
+DEFAULT_MAX_DEPTH = 75
+# A flat run like 1 + 1 + ... + 1 is parsed by a loop and walked iteratively
+# along its left spine, so its length is bounded separately and far higher
+DEFAULT_MAX_CHAIN = 500
+
+DESCRIPTIONS = {
+    'source_size': "Source size",
+    'tokens': "Token count",
+    'depth': "Nesting depth",
+    'chain': "Operator chain length",
+    'time': "Compilation time",
+}
+
+class LimitExceeded(Exception):
+    def __init__(self, limit, maximum, line=None):
+        # limit: one of DESCRIPTIONS; maximum: the configured value
+        self.limit = limit
+        self.maximum = maximum
+        self.line = line
+        unit = " seconds" if limit == 'time' else ""
+        where = f" at line {line}" if line is not None else ""
+        super().__init__(f"{DESCRIPTIONS[limit]} exceeds the limit of {maximum}{unit}{where}")
+
+class Limits:
+    def __init__(self, max_source_size=DEFAULT_MAX_SOURCE_SIZE, max_tokens=DEFAULT_MAX_TOKENS,
+                 max_depth=DEFAULT_MAX_DEPTH, time_budget=None, max_chain=DEFAULT_MAX_CHAIN):
+        # None disables a limit; time_budget is in seconds
+        self.max_source_size = max_source_size
+        self.max_tokens = max_tokens
+        self.max_depth = max_depth
+        self.time_budget = time_budget
+        self.max_chain = max_chain
+        self.deadline = None
+
+    def start(self):
+        # A copy whose time budget starts counting now
+        started = Limits(self.max_source_size, self.max_tokens, self.max_depth, self.time_budget,
+                         self.max_chain)
+        if self.time_budget is not None:
+            started.deadline = time.monotonic() + self.time_budget
+        return started
+
+    def check_time(self, line=None):
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise LimitExceeded('time', self.time_budget, line)
@@ -0,0 +1,124 @@
+# parlc.py - Command line entry point for the PArL compiler
+#
+#   python parlc.py [--check | --run] [--cache-dir DIR | --no-cache] FILE...
+#   python parlc.py --run [--seed N] [--record LOG | --replay LOG] [--profile OUT] FILE
+#
+# Compiles each FILE to a cached code object (the default), only runs the
+# front end over them (--check), or compiles and runs a single program
+# (--run). When running, --seed fixes __random_int, --record logs the results
+# of the non-deterministic builtins to LOG and --replay plays such a log back
+# with __delay taking no time (see replay.py). --profile (which implies --run)
+# samples the run, writes folded stacks to OUT and prints the hottest PArL
+# lines to stderr. Hooks call this on one small file at a time, so start-up is
+# what matters: arguments are read by hand rather than through argparse, and
+# each mode imports only the modules it uses. bench_startup.py measures it.
+import sys
+
+USAGE = ("usage: parlc.py [--check | --run] [--cache-dir DIR | --no-cache] FILE...\n"
+         "       parlc.py --run [--seed N] [--record LOG | --replay LOG] [--profile OUT] FILE")
+
+def check(source):
+    from lexer import Lexer
+    from parser import Parser
+    from semantic_analysis import SemanticAnalyzer
+    program = Parser(Lexer(source, verbose=False).tokenize(), verbose=False).parse_program()
+    SemanticAnalyzer().analyze(program)
+
+def make_runtime(seed, record_path, replay_path):
+    if replay_path is not None:
+        from replay import ReplayRuntime
+        with open(replay_path, 'rb') as f:
+            return ReplayRuntime(f.read())
+    if record_path is not None:
+        from replay import RecordingRuntime
+        return RecordingRuntime(seed=seed)
+    if seed is not None:
+        from runtime import Runtime
+        return Runtime(seed=seed)
+    return None
+
+def run(functions, source, runtime, record_path, profile_path):
+    profiler = None
+    if profile_path is not None:
+        from profiler import Profiler
+        profiler = Profiler(functions['.lines']).start()
+    try:
+        functions['.main']()
+    except Exception as error:
+        import pybackend
+        raise pybackend.attribute(error, functions['.lines']) from error
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            with open(profile_path, 'w', encoding='utf-8') as out:
+                profiler.write_folded(out)
+            print(profiler.line_report(source), file=sys.stderr)
+        if record_path is not None:
+            # Written even when the run fails, so the failure can be replayed
+            with open(record_path, 'wb') as out:
+                out.write(runtime.log())
+    if hasattr(runtime, 'finish'):
+        runtime.finish()
+
+def main(argv=None):
+    args = sys.argv[1:] if argv is None else list(argv)
+    mode = 'compile'
+    cache_dir = '__parlcache__'
+    files = []
+    seed = record_path = replay_path = profile_path = None
+    while args:
+        arg = args.pop(0)
+        if arg in ('--check', '--run'):
+            mode = arg[2:]
+        elif arg == '--profile' and args:
+            mode = 'run'
+            profile_path = args.pop(0)
+        elif arg == '--seed' and args and args[0].lstrip('-').isdigit():
+            seed = int(args.pop(0))
+        elif arg == '--record' and args:
+            record_path = args.pop(0)
+        elif arg == '--replay' and args:
+            replay_path = args.pop(0)
+        elif arg == '--no-cache':
+            cache_dir = None
+        elif arg == '--cache-dir' and args:
+            cache_dir = args.pop(0)
+        elif arg in ('-h', '--help'):
+            print(USAGE)
+            return 0
+        elif arg.startswith('-'):
+            print(USAGE, file=sys.stderr)
+            return 2
+        else:
+            files.append(arg)
+    running = (seed, record_path, replay_path) != (None, None, None)
+    if (not files or (mode == 'run' and len(files) != 1) or (running and mode != 'run')
+            or (record_path is not None and replay_path is not None)):
+        print(USAGE, file=sys.stderr)
+        return 2
+
+    status = 0
+    for path in files:
+        try:
+            with open(path, encoding='utf-8') as f:
+                source = f.read()
+            if mode == 'check':
+                check(source)
+            else:
+                import pybackend
+                code = pybackend.compile_source(source, cache_dir)
+                if mode == 'run':
+                    runtime = make_runtime(seed, record_path, replay_path)
+                    run(pybackend.load(code, runtime), source, runtime, record_path, profile_path)
+        except OSError as error:
+            print(f"{path}: {error.strerror}", file=sys.stderr)
+            status = 1
+        except Exception as error:
+            # Lexer, parser, analyzer and backend errors all end up here;
+            # their classes are not imported up front to keep start-up lean
+            print(f"{path}: {type(error).__name__}: {error}", file=sys.stderr)
+            status = 1
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
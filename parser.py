@@ -2,22 +2,71 @@
 from token_types import TokenType
 from token1 import Token
 import ast_nodes as ast
+from limits import LimitExceeded
 
 class ParserError(Exception):
     pass
 
+def make_node(cls, *args):
+    return cls(*args)
+
 class Parser:
-    def __init__(self, tokens):
+    def __init__(self, tokens, verbose=True, checkpoint=None, limits=None, interner=None):
         self.tokens = tokens
         self.current = 0
+        self.verbose = verbose
+        # Expression nodes are built through make(); with a hashcons.InternTable
+        # equal expressions come back as one shared node
+        self.make = interner.make if interner is not None else make_node
+        # Called after every top-level declaration; may raise to abandon the parse
+        self.checkpoint = checkpoint
+        # Optional limits.Limits for untrusted source. The depth counts nested
+        # blocks, bracketed and unary expressions and casts, i.e. roughly the
+        # height of the tree later passes will recurse over. Binary operators
+        # open along the way are counted separately against a much higher
+        # limit: a flat run like 1 + 1 + ... costs later passes about one
+        # frame per operator, not the ten a bracket costs here.
+        if limits is not None and limits.time_budget is not None and limits.deadline is None:
+            limits = limits.start()
+        self.limits = limits
+        self.depth = 0
+        self.chain = 0
+        self.max_depth = limits.max_depth if limits is not None else None
+        self.max_chain = limits.max_chain if limits is not None else None
+        if limits is not None and limits.max_tokens is not None and len(tokens) > limits.max_tokens + 1:
+            raise LimitExceeded('tokens', limits.max_tokens)
+
+    def at(self, tok, node):
+        # Record where a construct starts. An interned node is shared by all
+        # its occurrences and keeps the position of the first one.
+        if node.line is None:
+            node.line = tok.line
+            node.column = tok.column
+        return node
+
+    def enter(self, levels=1):
+        self.depth += levels
+        if self.max_depth is not None and self.depth > self.max_depth:
+            raise LimitExceeded('depth', self.max_depth, self.peek().line)
+
+    def check_chain(self):
+        self.chain += 1
+        if self.max_chain is not None and self.chain > self.max_chain:
+            raise LimitExceeded('chain', self.max_chain, self.peek().line)
+
+    def debug(self, message):
+        if self.verbose:
+            print(f"[DEBUG] {message}")
 
     def peek(self):
         return self.tokens[self.current]
 
     def advance(self):
+        # Returns the token being consumed, not the one after it
+        tok = self.peek()
         if self.current < len(self.tokens) - 1:
             self.current += 1
-        return self.peek()
+        return tok
 
     def match(self, *expected):
         if self.peek().type in expected or self.peek().lexeme in expected:
@@ -31,58 +80,80 @@ class Parser:
         raise ParserError(f"Expected {expected}, got {tok.lexeme} at line {tok.line}")
 
     def parse_program(self):
+        start = self.peek()
         functions = []
         statements = []
 
         while self.peek().type != TokenType.EOF:
             if self.peek().lexeme == 'fun':
                 functions.append(self.parse_function())
-            elif self.peek().lexeme == 'let':
-                statements.append(self.parse_variable_decl())
             else:
-                raise ParserError(f"Unexpected top-level token {self.peek().lexeme} at line {self.peek().line}")
+                # Execution starts at the first statement that is not a
+                # function declaration
+                statements.append(self.parse_statement())
+            if self.checkpoint is not None:
+                self.checkpoint()
 
-        return ast.ASTProgram(functions + statements)
+        return self.at(start, ast.ASTProgram(functions + statements))
 
     def parse_function(self):
-        print(f"[DEBUG] Parsing function at line {self.peek().line}")
-        self.expect('fun')
+        self.debug(f"Parsing function at line {self.peek().line}")
+        func = self.parse_function_header()
+        func.body = self.parse_block()
+        return func
+
+    def parse_function_header(self):
+        # Everything up to the body; the declaration comes back with body None
+        start = self.expect('fun')
         name = self.expect(TokenType.IDENTIFIER)
         self.expect('(')
         params = self.parse_parameters()
         self.expect(')')
         self.expect('->')
-        return_type = self.expect(TokenType.KEYWORD)
-        body = self.parse_block()
-        return ast.ASTFunctionDeclaration(name.lexeme, params, return_type.lexeme, body)
+        return_type = self.parse_type()
+        return self.at(start, ast.ASTFunctionDeclaration(name.lexeme, params, return_type, None))
 
     def parse_parameters(self):
         params = []
         if self.peek().lexeme == ')':
             return params
         while True:
-            print(f"[DEBUG] Parsing parameter at line {self.peek().line}")
+            self.debug(f"Parsing parameter at line {self.peek().line}")
             name = self.expect(TokenType.IDENTIFIER)
             self.expect(':')
-            typ = self.expect(TokenType.KEYWORD)
-            params.append(ast.ASTParameter(name.lexeme, typ.lexeme))
+            typ = self.parse_type()
+            params.append(self.at(name, ast.ASTParameter(name.lexeme, typ)))
             if self.peek().lexeme == ')':
                 break
             self.expect(',')
         return params
 
+    def parse_type(self):
+        # A type name, or an array type written 'int[4]', or 'int[]' when the
+        # length comes from the initialiser (or, for a parameter, the caller)
+        typ = self.expect(TokenType.KEYWORD).lexeme
+        if self.match('['):
+            size = self.match(TokenType.INT_LITERAL)
+            self.expect(']')
+            typ = f"{typ}[{size.lexeme if size else ''}]"
+        return typ
+
     def parse_block(self):
-        self.expect('{')
+        start = self.expect('{')
+        self.enter()
         statements = []
         while self.peek().lexeme != '}':
-            print(f"[DEBUG] Parsing statement at line {self.peek().line}")
+            self.debug(f"Parsing statement at line {self.peek().line}")
             statements.append(self.parse_statement())
         self.expect('}')
-        return ast.ASTBlock(statements)
+        self.depth -= 1
+        return self.at(start, ast.ASTBlock(statements))
 
     def parse_statement(self):
         tok = self.peek()
-        print(f"[DEBUG] Entering parse_statement with token {tok.lexeme} at line {tok.line}")
+        if self.limits is not None:
+            self.limits.check_time(tok.line)
+        self.debug(f"Entering parse_statement with token {tok.lexeme} at line {tok.line}")
         if tok.type == TokenType.KEYWORD:
             if tok.lexeme == 'let':
                 return self.parse_variable_decl()
@@ -103,39 +174,39 @@ class Parser:
         raise ParserError(f"Unexpected token {tok.lexeme} at line {tok.line}")
 
     def parse_variable_decl(self):
-        print(f"[DEBUG] Parsing variable declaration at line {self.peek().line}")
-        self.expect('let')
+        self.debug(f"Parsing variable declaration at line {self.peek().line}")
+        start = self.expect('let')
         name = self.expect(TokenType.IDENTIFIER)
         self.expect(':')
-        typ = self.expect(TokenType.KEYWORD)
+        typ = self.parse_type()
         self.expect('=')
         expr = self.parse_expression()
         self.expect(';')
-        return ast.ASTVariableDeclaration(name.lexeme, typ.lexeme, expr)
+        return self.at(start, ast.ASTVariableDeclaration(name.lexeme, typ, expr))
 
     def parse_assignment_statement(self):
-        print(f"[DEBUG] Parsing assignment statement at line {self.peek().line}")
+        self.debug(f"Parsing assignment statement at line {self.peek().line}")
         name = self.expect(TokenType.IDENTIFIER)
         self.expect('=')
         expr = self.parse_expression()
         self.expect(';')
-        return ast.ASTAssignment(name.lexeme, expr)
+        return self.at(name, ast.ASTAssignment(name.lexeme, expr))
 
     def parse_assignment(self):
         name = self.expect(TokenType.IDENTIFIER)
         self.expect('=')
         expr = self.parse_expression()
-        return ast.ASTAssignment(name.lexeme, expr)
+        return self.at(name, ast.ASTAssignment(name.lexeme, expr))
 
     def parse_return(self):
-        print(f"[DEBUG] Parsing return statement at line {self.peek().line}")
-        self.expect('return')
+        self.debug(f"Parsing return statement at line {self.peek().line}")
+        start = self.expect('return')
         expr = self.parse_expression()
         self.expect(';')
-        return ast.ASTReturnStatement(expr)
+        return self.at(start, ast.ASTReturnStatement(expr))
 
     def parse_if(self):
-        self.expect('if')
+        start = self.expect('if')
         self.expect('(')
         condition = self.parse_expression()
         self.expect(')')
@@ -144,18 +215,18 @@ class Parser:
         if self.peek().lexeme == 'else':
             self.advance()
             else_block = self.parse_block()
-        return ast.ASTIfStatement(condition, then_block, else_block)
+        return self.at(start, ast.ASTIfStatement(condition, then_block, else_block))
 
     def parse_while(self):
-        self.expect('while')
+        start = self.expect('while')
         self.expect('(')
         condition = self.parse_expression()
         self.expect(')')
         body = self.parse_block()
-        return ast.ASTWhileStatement(condition, body)
+        return self.at(start, ast.ASTWhileStatement(condition, body))
 
     def parse_for(self):
-        self.expect('for')
+        start = self.expect('for')
         self.expect('(')
         init = self.parse_variable_decl()
         condition = self.parse_expression()
@@ -163,7 +234,7 @@ class Parser:
         update = self.parse_assignment()
         self.expect(')')
         body = self.parse_block()
-        return ast.ASTForStatement(init, condition, update, body)
+        return self.at(start, ast.ASTForStatement(init, condition, update, body))
 
     def parse_builtin_call(self):
         builtin = self.expect(TokenType.BUILTIN)
@@ -177,82 +248,128 @@ class Parser:
                 self.expect(',')
         self.expect(')')
         self.expect(';')
-        return ast.ASTBuiltinCall(builtin.lexeme, args)
+        return self.at(builtin, ast.ASTBuiltinCall(builtin.lexeme, args))
 
     def parse_expression_statement(self):
+        start = self.peek()
         expr = self.parse_expression()
+        if isinstance(expr, ast.ASTIndex) and self.match('='):
+            # 'a[i] = value;' only turns out to be an assignment at the '='
+            value = self.parse_expression()
+            self.expect(';')
+            return self.at(start, ast.ASTIndexAssignment(expr.array, expr.index, value))
         self.expect(';')
-        return ast.ASTExpressionStatement(expr)
+        return self.at(start, ast.ASTExpressionStatement(expr))
 
     def parse_expression(self):
-        return self.parse_as()
+        self.enter()
+        expr = self.parse_as()
+        self.depth -= 1
+        return expr
 
     def parse_as(self):
+        start = self.peek()
         expr = self.parse_or()
+        chain = 0
         while self.peek().lexeme == 'as':
             self.advance()
+            chain += 1
+            self.enter()
             type_token = self.expect(TokenType.KEYWORD)
-            expr = ast.ASTCast(expr, type_token.lexeme)
+            expr = self.at(start, self.make(ast.ASTCast, expr, type_token.lexeme))
+        self.depth -= chain
         return expr
 
     def parse_or(self):
+        start = self.peek()
         left = self.parse_and()
+        chain = 0
         while self.peek().lexeme == 'or':
             op = self.advance()
+            chain += 1
+            self.check_chain()
             right = self.parse_and()
-            left = ast.ASTBinaryOp(op.lexeme, left, right)
+            left = self.at(start, self.make(ast.ASTBinaryOp, op.lexeme, left, right))
+        self.chain -= chain
         return left
 
     def parse_and(self):
+        start = self.peek()
         left = self.parse_equality()
+        chain = 0
         while self.peek().lexeme == 'and':
             op = self.advance()
+            chain += 1
+            self.check_chain()
             right = self.parse_equality()
-            left = ast.ASTBinaryOp(op.lexeme, left, right)
+            left = self.at(start, self.make(ast.ASTBinaryOp, op.lexeme, left, right))
+        self.chain -= chain
         return left
 
     def parse_equality(self):
+        start = self.peek()
         left = self.parse_comparison()
+        chain = 0
         while self.peek().lexeme in ('==', '!='):
             op = self.advance()
+            chain += 1
+            self.check_chain()
             right = self.parse_comparison()
-            left = ast.ASTBinaryOp(op.lexeme, left, right)
+            left = self.at(start, self.make(ast.ASTBinaryOp, op.lexeme, left, right))
+        self.chain -= chain
         return left
 
     def parse_comparison(self):
+        start = self.peek()
         left = self.parse_term()
+        chain = 0
         while self.peek().lexeme in ('<', '<=', '>', '>='):
             op = self.advance()
+            chain += 1
+            self.check_chain()
             right = self.parse_term()
-            left = ast.ASTBinaryOp(op.lexeme, left, right)
+            left = self.at(start, self.make(ast.ASTBinaryOp, op.lexeme, left, right))
+        self.chain -= chain
         return left
 
     def parse_term(self):
+        start = self.peek()
         left = self.parse_factor()
+        chain = 0
         while self.peek().lexeme in ('+', '-'):
             op = self.advance()
+            chain += 1
+            self.check_chain()
             right = self.parse_factor()
-            left = ast.ASTBinaryOp(op.lexeme, left, right)
+            left = self.at(start, self.make(ast.ASTBinaryOp, op.lexeme, left, right))
+        self.chain -= chain
         return left
 
     def parse_factor(self):
+        start = self.peek()
         left = self.parse_unary()
+        chain = 0
         while self.peek().lexeme in ('*', '/'):
             op = self.advance()
+            chain += 1
+            self.check_chain()
             right = self.parse_unary()
-            left = ast.ASTBinaryOp(op.lexeme, left, right)
+            left = self.at(start, self.make(ast.ASTBinaryOp, op.lexeme, left, right))
+        self.chain -= chain
         return left
 
     def parse_unary(self):
         if self.peek().lexeme in ('-', 'not'):
             op = self.advance()
+            self.enter()
             expr = self.parse_unary()
-            return ast.ASTUnaryOp(op.lexeme, expr)
+            self.depth -= 1
+            return self.at(op, self.make(ast.ASTUnaryOp, op.lexeme, expr))
         return self.parse_primary()
 
     def parse_primary(self):
         tok = self.peek()
-        print(f"[DEBUG] Entering parse_primary with token {tok.type}: {tok.lexeme} at line {tok.line}")
+        self.debug(f"Entering parse_primary with token {tok.type}: {tok.lexeme} at line {tok.line}")
         if tok.lexeme == '(':
             self.advance()
             expr = self.parse_expression()
@@ -268,7 +385,7 @@ class Parser:
                         break
                     self.expect(',')
             self.expect(']')
-            return ast.ASTArrayLiteral(elements)
+            return self.at(tok, self.make(ast.ASTArrayLiteral, elements))
         if tok.type == TokenType.IDENTIFIER:
             identifier = self.advance()
             if self.peek().lexeme == '(':
@@ -281,8 +398,16 @@ class Parser:
                             break
                         self.expect(',')
                 self.expect(')')
-                return ast.ASTFunctionCall(identifier.lexeme, args)
-            return ast.ASTLiteral(identifier.lexeme)
+                # Never interned: two equal calls may return different values
+                return self.at(tok, ast.ASTFunctionCall(identifier.lexeme, args))
+            name = self.at(tok, self.make(ast.ASTLiteral, identifier.lexeme))
+            if self.match('['):
+                index = self.parse_expression()
+                self.expect(']')
+                # Never interned: equal index expressions may read different
+                # values, and each occurrence gets its own bounds check
+                return self.at(tok, ast.ASTIndex(name, index))
+            return name
         if tok.type == TokenType.BUILTIN:
             name = self.advance()
             if self.peek().lexeme == '(':
@@ -295,12 +420,13 @@ class Parser:
                             break
                         self.expect(',')
                 self.expect(')')
-                return ast.ASTFunctionCall(name.lexeme, args)
-            return ast.ASTLiteral(name.lexeme)
+                # Never interned: two equal calls may return different values
+                return self.at(tok, ast.ASTFunctionCall(name.lexeme, args))
+            return self.at(tok, self.make(ast.ASTLiteral, name.lexeme))
         if tok.type in (TokenType.INT_LITERAL, TokenType.FLOAT_LITERAL, TokenType.BOOLEAN_LITERAL, TokenType.COLOUR_LITERAL):
-            return ast.ASTLiteral(self.advance().lexeme)
+            return self.at(tok, self.make(ast.ASTLiteral, self.advance().lexeme))
         if tok.type == TokenType.KEYWORD and tok.lexeme in ('true', 'false'):
-            return ast.ASTLiteral(self.advance().lexeme)
+            return self.at(tok, self.make(ast.ASTLiteral, self.advance().lexeme))
 
-        print(f"[DEBUG] Unexpected token in parse_primary: {tok.type} '{tok.lexeme}' at line {tok.line}")
+        self.debug(f"Unexpected token in parse_primary: {tok.type} '{tok.lexeme}' at line {tok.line}")
         raise ParserError(f"Unexpected primary expression at line {tok.line}")
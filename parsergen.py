@@ -0,0 +1,933 @@
+# parsergen.py - LL(1) parser generator for the grammar in grammar.py
+#
+#   python parsergen.py            regenerate generated_parser.py
+#   python parsergen.py --check    fail if it is out of date
+#   python parsergen.py --table    print FIRST/FOLLOW and every decision
+#
+# The grammar is EBNF with captures and Python actions (the notation is
+# described at the top of grammar.py). Grammar() reads it, computes the
+# nullable rules and the FIRST and FOLLOW sets, and works out the predict set
+# of every decision: each choice between alternatives, and whether to enter
+# an option or go round a repetition once more. Two choices of one decision
+# predicted by the same token are an LL(1) conflict; those, left recursion and
+# undefined or unused rules are reported together as a GrammarError, so a bad
+# grammar never produces a parser.
+#
+# generate() then emits one Python function per rule with each decision
+# compiled to an if/elif over the lookahead's kind: the lexeme for keywords,
+# operators and separators and the TokenType otherwise. The token kinds are
+# listed once per parse, so a decision costs a list index and a string
+# comparison or a constant-set lookup. Tests the enclosing decision has
+# already made are not repeated: after predicting 'op=( '+' | '-' )' the
+# operator is taken without looking at it again.
+#
+# Where neither choice is predicted the generated code does what
+# parser.Parser does: an empty alternative or trailing lone rule is the
+# default, '~' enters the construct and lets it report the error, and
+# otherwise the rule's message (or "Unexpected token ...") is raised. Rule
+# functions are named parse_<rule>, as in Parser, so that rule names never
+# shadow the builtins and node classes actions use.
+import argparse
+import os
+import re
+import sys
+
+from token_types import TokenType
+from lexer import RESERVED_WORDS, OPERATORS, SEPARATORS
+
+OUTPUT = 'generated_parser.py'
+
+# Token types whose kind is the lexeme; a grammar terminal naming one of
+# these types (KEYWORD) overlaps every quoted terminal of that type
+LEXEME_TYPES = (TokenType.KEYWORD, TokenType.OPERATOR, TokenType.SEPARATOR)
+TOKEN_TYPES = {value for name, value in vars(TokenType).items() if not name.startswith('_')}
+
+DEFAULT_ERROR = "Unexpected token {lexeme} at line {line}"
+
+class GrammarError(Exception):
+    def __init__(self, problems):
+        super().__init__('\n'.join(problems))
+        self.problems = problems
+
+# --- grammar tree -----------------------------------------------------------
+
+class Terminal:
+    def __init__(self, name, quoted):
+        self.name = name            # the lexeme ('(') or the TokenType ('IDENTIFIER')
+        self.quoted = quoted
+
+    def __str__(self):
+        return f"'{self.name}'" if self.quoted else self.name
+
+class NonTerminal:
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return self.name
+
+class Item:
+    def __init__(self, element, capture=None, append=False):
+        self.element = element
+        self.capture = capture      # local the value is stored in, or None
+        self.append = append        # names+=x rather than name=x
+
+    def __str__(self):
+        if self.capture is None:
+            return str(self.element)
+        return f"{self.capture}{'+=' if self.append else '='}{self.element}"
+
+class Sequence:
+    def __init__(self, items, action=None, guard=None, predicate=None):
+        self.items = items
+        self.action = action        # Python source, or None
+        self.guard = guard          # Terminal the alternative is restricted to
+        self.predicate = predicate  # Python condition, or None
+
+    def __str__(self):
+        parts = []
+        if self.guard is not None:
+            parts.append(f"&{self.guard}")
+        if self.predicate is not None:
+            parts.append(f"&{{ {self.predicate} }}")
+        parts.extend(str(item) for item in self.items)
+        if self.action is not None:
+            parts.append(f"=> {self.action}")
+        return ' '.join(parts)
+
+class Choice:
+    def __init__(self, sequences):
+        self.sequences = sequences
+
+    def __str__(self):
+        return ' | '.join(str(seq) for seq in self.sequences)
+
+class Group(Choice):
+    def __str__(self):
+        return f"( {super().__str__()} )"
+
+class Option:
+    def __init__(self, body, until=False):
+        self.body = body            # a Choice
+        self.until = until          # entered unless the lookahead can follow it
+
+    def __str__(self):
+        return f"[ {self.body} ]{'~' if self.until else ''}"
+
+class Repetition:
+    def __init__(self, body, until=False):
+        self.body = body
+        self.until = until
+
+    def __str__(self):
+        return f"{{ {self.body} }}{'~' if self.until else ''}"
+
+class Rule:
+    def __init__(self, name, body, error=None):
+        self.name = name
+        self.body = body            # a Choice
+        self.error = error          # message when no alternative matches
+
+# --- reading the notation ---------------------------------------------------
+
+TOKEN_RE = re.compile(r"""
+    (?P<space>[ \t\r]+|\#[^\n]*)
+  | (?P<newline>\n)
+  | (?P<name>[A-Za-z_]\w*)
+  | (?P<quoted>'[^'\n]+')
+  | (?P<message>"[^"\n]*")
+  | (?P<punct>=>|\+=|&\{|[:|()\[\]{}~&=!])
+""", re.VERBOSE)
+
+CLOSERS = {'(': ')', '[': ']', '{': '}'}
+
+def scan_code(text, position, stop):
+    # Python source from position up to the first character in stop outside
+    # brackets and strings; returns (source, position of the stop character)
+    depth = 0
+    i = position
+    while i < len(text):
+        char = text[i]
+        if char in '\'"':
+            end = text.index(char, i + 1)
+            i = end + 1
+            continue
+        if depth == 0 and char in stop:
+            break
+        if char in '([{':
+            depth += 1
+        elif char in ')]}':
+            depth -= 1
+        i += 1
+    return text[position:i], i
+
+def tokenize(text):
+    tokens = []
+    position = 0
+    line = 1
+    while position < len(text):
+        match = TOKEN_RE.match(text, position)
+        if match is None:
+            raise GrammarError([f"line {line}: unexpected character {text[position]!r}"])
+        kind = match.lastgroup
+        value = match.group()
+        position = match.end()
+        if kind == 'newline':
+            line += 1
+        elif kind != 'space':
+            tokens.append((kind, value, line))
+            if value in ('=>', '&{'):
+                code, position = scan_code(text, position, '|)]}\n' if value == '=>' else '}')
+                # A bracketed action may run over several lines
+                tokens.append(('code', ' '.join(part.strip() for part in code.splitlines()).strip(), line))
+                line += code.count('\n')
+                if value == '&{':
+                    position += 1
+    tokens.append(('end', '', line))
+    return tokens
+
+class GrammarReader:
+    # Recursive descent over the notation; builds the Rule trees
+    def __init__(self, text):
+        self.tokens = tokenize(text)
+        self.position = 0
+
+    def peek(self, offset=0):
+        return self.tokens[min(self.position + offset, len(self.tokens) - 1)]
+
+    def take(self, value=None, kind=None):
+        token = self.peek()
+        if (value is not None and token[1] != value) or (kind is not None and token[0] != kind):
+            raise GrammarError([f"line {token[2]}: expected {value or kind}, found {token[1]!r}"])
+        self.position += 1
+        return token
+
+    def rules(self):
+        rules = []
+        while self.peek()[0] != 'end':
+            name = self.take(kind='name')[1]
+            self.take(':')
+            body = self.choice(Choice)
+            error = None
+            if self.peek()[1] == '!':
+                self.take('!')
+                error = self.take(kind='message')[1][1:-1]
+            rules.append(Rule(name, body, error))
+        return rules
+
+    def choice(self, cls):
+        sequences = [self.sequence()]
+        while self.peek()[1] == '|':
+            self.take('|')
+            sequences.append(self.sequence())
+        return cls(sequences)
+
+    def at_rule_start(self):
+        return self.peek()[0] == 'name' and self.peek(1)[1] == ':'
+
+    def sequence(self):
+        guard = predicate = action = None
+        if self.peek()[1] == '&':
+            self.take('&')
+            guard = self.terminal(self.take())
+        if self.peek()[1] == '&{':
+            self.take('&{')
+            predicate = self.take(kind='code')[1]
+        items = []
+        while (self.peek()[0] in ('name', 'quoted') or self.peek()[1] in ('(', '[', '{')) \
+                and not self.at_rule_start():
+            items.append(self.item())
+        if self.peek()[1] == '=>':
+            self.take('=>')
+            action = self.take(kind='code')[1]
+        return Sequence(items, action, guard, predicate)
+
+    def item(self):
+        capture = None
+        append = False
+        if self.peek()[0] == 'name' and self.peek(1)[1] in ('=', '+='):
+            capture = self.take()[1]
+            append = self.take()[1] == '+='
+        return Item(self.element(), capture, append)
+
+    def element(self):
+        token = self.take()
+        kind, value, line = token
+        if kind == 'quoted' or (kind == 'name' and value.isupper()):
+            return self.terminal(token)
+        if kind == 'name':
+            return NonTerminal(value)
+        if value in CLOSERS:
+            body = self.choice(Group if value == '(' else Choice)
+            self.take(CLOSERS[value])
+            if value == '(':
+                return body
+            until = self.peek()[1] == '~'
+            if until:
+                self.take('~')
+            return Option(body, until) if value == '[' else Repetition(body, until)
+        raise GrammarError([f"line {line}: unexpected {value!r}"])
+
+    def terminal(self, token):
+        kind, value, line = token
+        if kind == 'quoted':
+            return Terminal(value[1:-1], True)
+        if kind == 'name' and value.isupper():
+            return Terminal(value, False)
+        raise GrammarError([f"line {line}: expected a terminal after '&', found {value!r}"])
+
+def token_type(lexeme):
+    # The TokenType the lexer gives a fixed lexeme, or None
+    if lexeme in RESERVED_WORDS:
+        return RESERVED_WORDS[lexeme]
+    if lexeme in SEPARATORS:
+        return TokenType.SEPARATOR
+    if lexeme in OPERATORS:
+        return TokenType.OPERATOR
+    return None
+
+def describe(terminals):
+    return ', '.join(f"'{name}'" if token_type(name) is not None else name
+                     for name in sorted(terminals))
+
+# --- analysis ---------------------------------------------------------------
+
+class Grammar:
+    def __init__(self, text):
+        self.rules = GrammarReader(text).rules()
+        self.by_name = {}
+        self.problems = []
+        for rule in self.rules:
+            if rule.name in self.by_name:
+                self.problems.append(f"rule '{rule.name}' is defined twice")
+            self.by_name[rule.name] = rule
+        if not self.rules:
+            self.problems.append("the grammar has no rules")
+        self.start = self.rules[0].name if self.rules else None
+        self.nullable = {}          # rule name -> bool
+        self.first = {}             # rule name -> set of terminal names
+        self.follow = {}            # rule name -> set of terminal names
+        self.context = {}           # id(decision) -> terminals that may follow it
+        self.decisions = []         # (rule name, decision, [(choice, predict set)])
+        self.check_symbols()
+        if not self.problems:
+            self.compute_first()
+            self.check_left_recursion()
+        if not self.problems:
+            self.compute_follow()
+            self.check_decisions()
+
+    def raise_problems(self):
+        if self.problems:
+            raise GrammarError(self.problems)
+
+    def elements(self):
+        # Every element of the grammar in source order, with its rule
+        for rule in self.rules:
+            yield from self.walk(rule, rule.body)
+
+    def walk(self, rule, element):
+        yield rule, element
+        if isinstance(element, Choice):
+            for seq in element.sequences:
+                if seq.guard is not None:
+                    yield rule, seq.guard
+                for item in seq.items:
+                    yield from self.walk(rule, item.element)
+        elif isinstance(element, (Option, Repetition)):
+            yield from self.walk(rule, element.body)
+
+    def check_symbols(self):
+        used = {self.start}
+        for rule, element in self.elements():
+            if isinstance(element, NonTerminal):
+                used.add(element.name)
+                if element.name not in self.by_name:
+                    self.problems.append(f"rule '{rule.name}' uses undefined rule '{element.name}'")
+            elif isinstance(element, Terminal):
+                if element.quoted:
+                    kind = token_type(element.name)
+                    if kind is None:
+                        self.problems.append(f"rule '{rule.name}': '{element.name}' is not a PArL token")
+                    elif kind not in LEXEME_TYPES:
+                        self.problems.append(f"rule '{rule.name}': '{element.name}' is a {kind} "
+                                             f"token; write {kind}")
+                elif element.name not in TOKEN_TYPES:
+                    self.problems.append(f"rule '{rule.name}': {element.name} is not a TokenType")
+            elif isinstance(element, Choice):
+                for seq in element.sequences:
+                    for item in seq.items:
+                        if item.capture is not None and isinstance(item.element, Repetition):
+                            self.problems.append(f"rule '{rule.name}': a repetition has no value "
+                                                 f"to capture in {item}")
+        for rule in self.rules:
+            if rule.name not in used:
+                self.problems.append(f"rule '{rule.name}' is never used")
+
+    def compute_first(self):
+        for rule in self.rules:
+            self.nullable[rule.name] = False
+            self.first[rule.name] = set()
+        changed = True
+        while changed:
+            changed = False
+            for rule in self.rules:
+                nullable, first = self.first_of(rule.body)
+                if nullable != self.nullable[rule.name] or first != self.first[rule.name]:
+                    self.nullable[rule.name] = nullable
+                    self.first[rule.name] = first
+                    changed = True
+
+    def first_of(self, element):
+        # (nullable, FIRST) of an element under the current rule estimates
+        if isinstance(element, Terminal):
+            return False, {element.name}
+        if isinstance(element, NonTerminal):
+            return self.nullable[element.name], set(self.first[element.name])
+        if isinstance(element, Choice):
+            nullable, first = False, set()
+            for seq in element.sequences:
+                seq_nullable, seq_first = self.first_of_items(seq.items)
+                nullable = nullable or seq_nullable
+                # A guarded alternative starts with its guard only
+                first |= {seq.guard.name} if seq.guard is not None else seq_first
+            return nullable, first
+        if isinstance(element, (Option, Repetition)):
+            return True, self.first_of(element.body)[1]
+        raise TypeError(element)
+
+    def first_of_items(self, items):
+        first = set()
+        for item in items:
+            nullable, item_first = self.first_of(item.element)
+            first |= item_first
+            if not nullable:
+                return False, first
+        return True, first
+
+    def check_left_recursion(self):
+        # corner[A]: rules A can call before consuming a token
+        corner = {rule.name: self.left_corners(rule.body) for rule in self.rules}
+        for rule in self.rules:
+            seen = set()
+            stack = list(corner[rule.name])
+            while stack:
+                name = stack.pop()
+                if name == rule.name:
+                    self.problems.append(f"rule '{rule.name}' is left recursive")
+                    break
+                if name not in seen:
+                    seen.add(name)
+                    stack.extend(corner[name])
+
+    def left_corners(self, element):
+        if isinstance(element, NonTerminal):
+            return {element.name}
+        if isinstance(element, Choice):
+            names = set()
+            for seq in element.sequences:
+                for item in seq.items:
+                    names |= self.left_corners(item.element)
+                    if not self.first_of(item.element)[0]:
+                        break
+            return names
+        if isinstance(element, (Option, Repetition)):
+            return self.left_corners(element.body)
+        return set()
+
+    def compute_follow(self):
+        for rule in self.rules:
+            self.follow[rule.name] = set()
+        self.follow[self.start].add(TokenType.EOF)
+        self.changed = True
+        while self.changed:
+            self.changed = False
+            for rule in self.rules:
+                self.propagate(rule.body, set(self.follow[rule.name]))
+
+    def propagate(self, element, follow):
+        # Pushes the terminals that can follow element into the rules it uses
+        if isinstance(element, NonTerminal):
+            if not follow <= self.follow[element.name]:
+                self.follow[element.name] |= follow
+                self.changed = True
+        elif isinstance(element, Choice):
+            self.context[id(element)] = follow
+            for seq in element.sequences:
+                after = follow
+                for item in reversed(seq.items):
+                    self.propagate(item.element, after)
+                    nullable, first = self.first_of(item.element)
+                    after = first | after if nullable else first
+        elif isinstance(element, Option):
+            self.context[id(element)] = follow
+            self.propagate(element.body, follow)
+        elif isinstance(element, Repetition):
+            self.context[id(element)] = follow
+            self.propagate(element.body, follow | self.first_of(element.body)[1])
+
+    def predict(self, seq, follow):
+        # The lookaheads that select seq within a choice followed by follow
+        if seq.guard is not None:
+            return {seq.guard.name}
+        nullable, first = self.first_of_items(seq.items)
+        return first | follow if nullable else first
+
+    def check_decisions(self):
+        for rule, element in self.elements():
+            if isinstance(element, Choice):
+                follow = self.context[id(element)]
+                choices = [(seq, self.predict(seq, follow)) for seq in element.sequences]
+                self.decisions.append((rule.name, element, choices))
+                for i, (seq, predict) in enumerate(choices):
+                    if seq.guard is not None and seq.guard.name not in self.first_of_items(seq.items)[1]:
+                        self.problems.append(f"rule '{rule.name}': {seq.guard} cannot start {seq}")
+                    for j in range(i):
+                        earlier, earlier_predict = choices[j]
+                        if earlier.predicate is None:
+                            shared = overlap(earlier_predict, predict)
+                            if shared:
+                                self.problems.append(
+                                    f"conflict in rule '{rule.name}': alternatives {j + 1} and "
+                                    f"{i + 1} of {label(element)} are both predicted by {describe(shared)}")
+            elif isinstance(element, (Option, Repetition)):
+                follow = self.context[id(element)]
+                nullable, first = self.first_of(element.body)
+                if nullable:
+                    self.problems.append(f"rule '{rule.name}': {element} can match nothing")
+                    continue
+                self.decisions.append((rule.name, element, [(element.body, first), (None, follow)]))
+                shared = overlap(first, follow)
+                if shared:
+                    what = 'option' if isinstance(element, Option) else 'repetition'
+                    self.problems.append(
+                        f"conflict in rule '{rule.name}': {describe(shared)} can both start and "
+                        f"follow the {what} {element}")
+
+    def table(self):
+        # Human-readable FIRST/FOLLOW sets and predict sets of every decision
+        lines = []
+        for rule in self.rules:
+            lines.append(f"{rule.name}")
+            lines.append(f"    FIRST   {describe(self.first[rule.name])}"
+                         + ("  (nullable)" if self.nullable[rule.name] else ""))
+            lines.append(f"    FOLLOW  {describe(self.follow[rule.name])}")
+        for name, element, choices in self.decisions:
+            if len(choices) < 2:
+                continue
+            lines.append(f"{name}: {label(element)}")
+            for choice, predict in choices:
+                what = 'exit' if choice is None else str(choice)
+                lookahead = describe(predict)
+                if choice is not None and getattr(element, 'until', False):
+                    lookahead = 'anything else'
+                lines.append(f"    {lookahead:<40} -> {what}")
+        return '\n'.join(lines)
+
+def label(element):
+    text = str(element)
+    return text if len(text) <= 60 else text[:57] + '...'
+
+def overlap(a, b):
+    # Terminals of a and b that the same token can match: shared names, and
+    # quoted terminals against a terminal naming their TokenType
+    shared = a & b
+    for x, y in ((a, b), (b, a)):
+        for name in x:
+            kind = token_type(name)
+            if kind is not None and kind in y:
+                shared.add(name)
+    return shared
+
+# --- code generation --------------------------------------------------------
+
+AST_CALL = re.compile(r'\bAST\w+\s*\(')
+ASSIGNMENT = re.compile(r'^\w+\s*=(?!=)')
+
+def stamp(code):
+    # Wraps every node constructor call in an action with at(start, ...)
+    out = []
+    position = 0
+    for match in AST_CALL.finditer(code):
+        if match.start() < position:
+            continue
+        out.append(code[position:match.start()])
+        inner, end = scan_code(code, match.end(), ')')
+        out.append(f"at(start, {match.group()}{stamp(inner)}))")
+        position = end + 1
+    out.append(code[position:])
+    return ''.join(out)
+
+HEADER = '''\
+# generated_parser.py - Generated by parsergen.py from grammar.py; do not edit
+#
+#   program = generated_parser.parse(Lexer(source, verbose=False).tokenize())
+#
+# Builds the same trees, positions included, as parser.Parser and raises the
+# same ParserErrors. It has no limits, checkpoints, interning or debug output;
+# use parser.Parser where those are needed.
+from ast_nodes import *
+from parser import ParserError
+
+LEXEME_TYPES = frozenset({lexeme_types})
+
+def at(tok, node):
+    node.line = tok.line
+    node.column = tok.column
+    return node
+
+def expected(name, tok):
+    return ParserError(f"Expected {{name}}, got {{tok.lexeme}} at line {{tok.line}}")
+
+def parse(tokens):
+    # Kind of each token: its lexeme for keywords, operators and separators,
+    # else its type
+    kinds = [tok.lexeme if tok.type in LEXEME_TYPES else tok.type for tok in tokens]
+    pos = 0
+'''
+
+class Emitter:
+    def __init__(self, grammar):
+        self.grammar = grammar
+        self.lines = []
+        self.indent = 0
+        self.moves = False          # whether the current rule advances pos
+        self.error = DEFAULT_ERROR  # message of the current rule
+
+    def emit(self, line):
+        self.lines.append('    ' * self.indent + line)
+
+    def source(self):
+        out = [HEADER.format(lexeme_types=tuple(sorted(LEXEME_TYPES))).rstrip('\n')]
+        for rule in self.grammar.rules:
+            out.append('')
+            out.extend(self.rule(rule))
+        out.append('')
+        out.append(f"    return parse_{self.grammar.start}()")
+        return '\n'.join(out) + '\n'
+
+    def rule(self, rule):
+        self.lines = []
+        self.indent = 2
+        self.moves = False
+        self.error = rule.error or DEFAULT_ERROR
+        self.choice(rule.body, ('return',), None, set(), '')
+        header = [f"    def parse_{rule.name}():"]
+        if self.moves:
+            header.append("        nonlocal pos")
+        if any(AST_CALL.search(seq.action or '') for seq in sequences_in(rule.body)):
+            header.append("        start = tokens[pos]")
+        return header + self.lines
+
+    # Tests on the lookahead. checked is the set the enclosing decision has
+    # already confined it to, or None.
+
+    def test(self, terminals, kind='kinds[pos]'):
+        kinds = sorted(name for name in terminals if name not in LEXEME_TYPES)
+        parts = []
+        if len(kinds) == 1:
+            parts.append(f"{kind} == {kinds[0]!r}")
+        elif kinds:
+            parts.append(f"{kind} in {{{', '.join(map(repr, kinds))}}}")
+        for name in sorted(set(terminals) & set(LEXEME_TYPES)):
+            parts.append(f"tokens[pos].type == {name!r}")
+        return ' or '.join(parts)
+
+    def negated(self, terminals):
+        test = self.test(terminals)
+        if ' or ' not in test:
+            return test.replace(' == ', ' != ').replace(' in {', ' not in {')
+        return f"not ({test})"
+
+    def raise_unexpected(self):
+        message = self.error.replace('{lexeme}', '{tokens[pos].lexeme}').replace('{line}', '{tokens[pos].line}')
+        self.emit(f"raise ParserError(f{message!r})")
+
+    def deliver(self, target, value):
+        if target is None:
+            if ASSIGNMENT.match(value):
+                self.emit(value)
+        elif target[0] == 'return':
+            self.emit(f"return {value}")
+        elif target[0] == 'assign':
+            self.emit(f"{target[1]} = {value}")
+        else:
+            self.emit(f"{target[1]}.append({value})")
+
+    def match(self, names, target, checked):
+        # Consumes one token that must be one of names
+        if checked is None or not checked <= names:
+            if len(names) > 1:
+                self.emit(f"if {self.negated(names)}:")
+                self.indent += 1
+                self.raise_unexpected()
+            else:
+                name, = names
+                if token_type(name) is not None:
+                    self.emit(f"if kinds[pos] != {name!r}:")
+                else:
+                    # As Parser.expect, a TokenType also matches a token
+                    # spelt like it
+                    kind = 'tokens[pos].type' if name in LEXEME_TYPES else 'kinds[pos]'
+                    self.emit(f"if {kind} != {name!r} and tokens[pos].lexeme != {name!r}:")
+                self.indent += 1
+                self.emit(f"raise expected({name!r}, tokens[pos])")
+            self.indent -= 1
+        self.moves = True
+        if target is None:
+            self.emit("pos += 1")
+        elif target[0] == 'return':
+            self.emit("pos += 1")
+            self.emit("return tokens[pos - 1]")
+        else:
+            self.deliver(target, "tokens[pos]")
+            self.emit("pos += 1")
+
+    # target says what to do with a value: None, ('return',), ('assign',
+    # name) or ('append', name). ready holds the captures already bound, and
+    # outside the code that runs after the element and may read them.
+
+    def element(self, element, target, checked, ready, outside):
+        if isinstance(element, Terminal):
+            self.match({element.name}, target, checked)
+        elif isinstance(element, NonTerminal):
+            if target is None:
+                self.emit(f"parse_{element.name}()")
+            else:
+                self.deliver(target, f"parse_{element.name}()")
+        elif isinstance(element, Choice):
+            self.choice(element, target, checked, ready, outside)
+        elif isinstance(element, Option):
+            self.option(element, target, ready, outside)
+        else:
+            self.repetition(element, ready, outside)
+
+    def choice(self, choice, target, checked, ready, outside):
+        seqs = choice.sequences
+        if all(len(seq.items) == 1 and isinstance(seq.items[0].element, Terminal)
+               and seq.items[0].capture is None and seq.action is None
+               and seq.guard is None and seq.predicate is None for seq in seqs):
+            # ( '+' | '-' ): the value is the token
+            self.match({seq.items[0].element.name for seq in seqs}, target, checked)
+            return
+        if len(seqs) == 1:
+            self.sequence(seqs[0], target, checked, ready, outside)
+            return
+        follow = self.grammar.context[id(choice)]
+        branches = [(seq, self.grammar.predict(seq, follow)) for seq in seqs]
+        default = None
+        for seq in seqs:
+            if self.grammar.first_of_items(seq.items)[0] and seq.guard is None and seq.predicate is None:
+                default = seq
+        last = seqs[-1]
+        if (default is None and len(last.items) == 1 and isinstance(last.items[0].element, NonTerminal)
+                and last.guard is None and last.predicate is None):
+            # A trailing lone rule reports its own error
+            default = last
+        tested = [(seq, predict) for seq, predict in branches
+                  if seq is not default and (checked is None or overlap(predict, checked))]
+        if (checked is not None and default is None and len(tested) == 1
+                and checked <= tested[0][1] and tested[0][0].predicate is None):
+            self.sequence(tested[0][0], target, checked, ready, outside)
+            return
+        kind = 'kinds[pos]'
+        if len(tested) > 1:
+            self.emit("k = kinds[pos]")
+            kind = 'k'
+        keyword = 'if'
+        for seq, predict in tested:
+            condition = self.test(predict, kind)
+            if seq.predicate is not None:
+                if ' or ' in condition:
+                    condition = f"({condition})"
+                condition = f"{condition} and ({seq.predicate})"
+            self.emit(f"{keyword} {condition}:")
+            self.indent += 1
+            self.sequence(seq, target, predict, ready, outside)
+            self.indent -= 1
+            keyword = 'elif'
+        if tested:
+            self.emit("else:")
+            self.indent += 1
+        if default is not None:
+            self.sequence(default, target, None, ready, outside)
+        else:
+            self.raise_unexpected()
+        if tested:
+            self.indent -= 1
+
+    def option(self, option, target, ready, outside):
+        # Captures made inside the option that later code reads are None
+        # when it is skipped
+        for name in captures(option.body):
+            if name not in ready and re.search(rf'\b{name}\b', outside):
+                self.emit(f"{name} = None")
+        if target is not None and target[0] == 'assign':
+            self.deliver(target, "None")
+        follow = self.grammar.context[id(option)]
+        first = self.grammar.first_of(option.body)[1]
+        if option.until:
+            condition, checked = self.negated(follow), None
+        else:
+            condition, checked = self.test(first), first
+        seqs = option.body.sequences
+        if len(seqs) == 1 and seqs[0].predicate is not None:
+            if ' or ' in condition:
+                condition = f"({condition})"
+            condition = f"{condition} and ({seqs[0].predicate})"
+        self.emit(f"if {condition}:")
+        self.indent += 1
+        self.choice(option.body, target, checked, ready, outside)
+        self.indent -= 1
+        if target is not None and target[0] != 'assign':
+            self.emit("else:")
+            self.indent += 1
+            self.deliver(target, "None")
+            self.indent -= 1
+
+    def repetition(self, repetition, ready, outside):
+        follow = self.grammar.context[id(repetition)]
+        first = self.grammar.first_of(repetition.body)[1]
+        if repetition.until:
+            condition, checked = self.negated(follow), None
+        else:
+            condition, checked = self.test(first), first
+        self.emit(f"while {condition}:")
+        self.indent += 1
+        self.choice(repetition.body, None, checked, ready, outside)
+        self.indent -= 1
+
+    def sequence(self, seq, target, checked, ready, outside):
+        ready = set(ready)
+        # Lists start empty where they are first needed: here, unless all
+        # their appends sit in one alternative of a single group
+        for name in list_captures(seq):
+            if name in ready:
+                continue
+            holders = [item for item in seq.items if name in list_captures_in(item)]
+            if len(holders) > 1 or not isinstance(holders[0].element, Group) or holders[0].capture == name:
+                self.emit(f"{name} = []")
+                ready.add(name)
+        valued = seq.action is None and len(seq.items) == 1
+        for i, item in enumerate(seq.items):
+            if item.capture is not None:
+                item_target = ('append' if item.append else 'assign', item.capture)
+            elif valued:
+                item_target = target
+            else:
+                item_target = None
+            later = [code for other in seq.items[i + 1:] for code in codes(other.element)]
+            later += [seq.action or '', outside]
+            self.element(item.element, item_target, checked, ready, ' '.join(later))
+            if item.capture is not None and not item.append:
+                ready.add(item.capture)
+            checked = self.known_after(item.element)
+        if seq.action is not None:
+            self.deliver(target, stamp(seq.action))
+        elif valued and seq.items[0].capture is not None and target is not None:
+            self.deliver(target, seq.items[0].capture)
+        elif not valued and target is not None:
+            self.deliver(target, "None")
+
+    def known_after(self, element):
+        # The set the lookahead is known to be in once element has been
+        # parsed, or None: a '~' repetition only stops at its FOLLOW set
+        if isinstance(element, Repetition) and element.until:
+            return self.grammar.context[id(element)]
+        if isinstance(element, Option) and element.until:
+            follow = self.grammar.context[id(element)]
+            after = self.known_after(element.body)
+            return follow if after is not None and after <= follow else None
+        if isinstance(element, Choice):
+            known = set()
+            for seq in element.sequences:
+                after = self.known_after(seq.items[-1].element) if seq.items else None
+                if after is None:
+                    return None
+                known |= after
+            return known
+        return None
+
+def sequences_in(element):
+    if isinstance(element, Choice):
+        for seq in element.sequences:
+            yield seq
+            for item in seq.items:
+                yield from sequences_in(item.element)
+    elif isinstance(element, (Option, Repetition)):
+        yield from sequences_in(element.body)
+
+def codes(element):
+    # The actions and predicates inside element
+    for seq in sequences_in(element):
+        for code in (seq.predicate, seq.action):
+            if code is not None:
+                yield code
+
+def captures(element):
+    # Names captured with '=' anywhere inside element
+    names = []
+    for seq in sequences_in(element):
+        for item in seq.items:
+            if item.capture is not None and not item.append and item.capture not in names:
+                names.append(item.capture)
+    return names
+
+def list_captures(seq):
+    names = []
+    for item in seq.items:
+        for name in list_captures_in(item):
+            if name not in names:
+                names.append(name)
+    return names
+
+def list_captures_in(item):
+    names = [item.capture] if item.append else []
+    for seq in sequences_in(item.element):
+        for inner in seq.items:
+            if inner.append and inner.capture not in names:
+                names.append(inner.capture)
+    return names
+
+def generate(text):
+    # Python source of a parser for the grammar; raises GrammarError
+    grammar = Grammar(text)
+    grammar.raise_problems()
+    return Emitter(grammar).source()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate generated_parser.py from grammar.py")
+    parser.add_argument('--check', action='store_true', help="fail if the generated parser is out of date")
+    parser.add_argument('--table', action='store_true', help="print FIRST/FOLLOW and predict sets")
+    parser.add_argument('--output', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), OUTPUT))
+    args = parser.parse_args(argv)
+
+    from grammar import GRAMMAR
+    try:
+        if args.table:
+            grammar = Grammar(GRAMMAR)
+            grammar.raise_problems()
+            print(grammar.table())
+            return 0
+        source = generate(GRAMMAR)
+    except GrammarError as error:
+        print(f"grammar.py: {len(error.problems)} problem(s)", file=sys.stderr)
+        for problem in error.problems:
+            print(f"  {problem}", file=sys.stderr)
+        return 1
+    if args.check:
+        try:
+            with open(args.output, encoding='utf-8') as f:
+                current = f.read()
+        except OSError:
+            current = None
+        if current != source:
+            print(f"{args.output} is out of date; run parsergen.py", file=sys.stderr)
+            return 1
+        return 0
+    with open(args.output, 'w', encoding='utf-8') as f:
+        f.write(source)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,495 @@
+# pybackend.py - Ahead-of-time translation of PArL programs to CPython code
+#
+# Each PArL function becomes a nested Python function inside a generated
+# factory, _p_module(). The builtins and conversion helpers are keyword
+# parameters of the factory, so the generated functions reach them (and each
+# other) through closure cells instead of global lookups, and every PArL
+# variable is a fast local. Compiled code objects are cached with marshal,
+# keyed by a hash of the PArL source, so later runs skip the front end.
+#
+# The generated module also carries a line table (see source_map.py) mapping
+# each generated line to the PArL statement it came from, which load() hands
+# back as functions['.lines'] and run() uses to report runtime errors against
+# PArL lines.
+#
+# Float and bool arrays are array.array buffers of unboxed values; int and
+# colour arrays are lists, since PArL ints are unbounded and a fixed-width
+# buffer would overflow where a scalar does not. Element accesses call
+# _p_load/_p_store, which check the index, except where bounds.py proves the
+# index stays in range and the access compiles to a plain subscript.
+# Declaring an array from another array copies it, assigning one array to
+# another copies its elements into the existing buffer, and arrays passed to
+# functions are shared with the caller.
+#
+# A cached run should cost little more than interpreter start-up, so the
+# front end, the runtime and hashlib are imported only when first needed.
+import builtins
+import keyword
+import marshal
+import os
+import sys
+from array import array
+
+from ast_nodes import *
+from ast_utils import walk, name_of, free_names, literal_value, element_type, array_length
+from lexer import PAD_BUILTINS
+import bounds
+import source_map
+
+BACKEND_VERSION = 7
+# The cache tag and exact interpreter version stand in for
+# importlib.util.MAGIC_NUMBER, which costs several milliseconds to import
+CACHE_MAGIC = (b'PArL' + sys.implementation.cache_tag.encode('ascii')
+               + sys.hexversion.to_bytes(4, 'little') + bytes([BACKEND_VERSION]))
+DEFAULT_CACHE_DIR = '__parlcache__'
+
+BUILTIN_VALUES = {'__width', '__height'}
+CONVERSIONS = {'int': '_p_int', 'float': '_p_float', 'bool': '_p_bool', 'colour': '_p_int'}
+INTEGRAL_TYPES = ('int', 'colour')
+# array.array type codes of the element types; bools are stored as bytes and
+# None means a list
+TYPECODES = {'int': None, 'colour': None, 'float': 'd', 'bool': 'b'}
+ARRAY_HELPERS = ('_p_array', '_p_load', '_p_store', '_p_fill')
+COMPARISONS = ('<', '<=', '>', '>=', '==', '!=')
+# Python precedence of the generated operators; '-x' is unary minus and
+# calls, subscripts, names and literals bind tightest of all
+PRECEDENCE = {'or': 1, 'and': 2, 'not': 3, **dict.fromkeys(COMPARISONS, 4),
+              '+': 5, '-': 5, '*': 6, '/': 6, '-x': 7}
+ATOM = 8
+
+class BackendError(Exception):
+    pass
+
+def parenthesise(code, rank, minimum):
+    return code if rank >= minimum else f"({code})"
+
+def helper_name(builtin):
+    # '__write_box' -> '_p_write_box'
+    return '_p_' + builtin.lstrip('_')
+
+def py_name(name):
+    # Generated helpers all start with '_p_', so PArL names that would clash
+    # with them (or with Python keywords) are pushed into that namespace too.
+    if keyword.iskeyword(name) or name.startswith('_p_'):
+        return '_p_' + name
+    return name
+
+class CodeGenerator:
+    def __init__(self, program, checkpoint=None):
+        self.program = program
+        # Called after each function is generated; may raise to abandon the work
+        self.checkpoint = checkpoint
+        self.lines = []
+        self.origins = []       # PArL line of each generated line
+        self.source_line = None
+        self.indent = 0
+        self.functions = {}
+        self.scopes = []
+        self.reserved = set()
+        self.counter = 0
+        self.unchecked = set()  # ids of accesses bounds.py proved in range
+
+    def emit(self, line):
+        self.lines.append('    ' * self.indent + line)
+        self.origins.append(self.source_line)
+
+    def generate(self):
+        functions = [d for d in self.program.declarations if isinstance(d, ASTFunctionDeclaration)]
+        top_level = [d for d in self.program.declarations if not isinstance(d, ASTFunctionDeclaration)]
+        self.functions = {func.name: func for func in functions}
+        self.unchecked = bounds.safe_accesses(self.program)
+
+        shared = set()
+        for func in functions:
+            shared |= free_names(func)
+        # PArL keeps functions and variables apart, Python does not: a global
+        # sharing a function's name gets a name of its own
+        self.globals = {d.name: (py_name(d.name) if d.name not in self.functions
+                                 else f"_p_{d.name}_g", d.type)
+                        for d in top_level
+                        if isinstance(d, ASTVariableDeclaration) and d.name in shared}
+
+        helpers = sorted({helper_name(b) for b in PAD_BUILTINS} | set(CONVERSIONS.values())
+                         | {'_p_div'} | set(ARRAY_HELPERS))
+        self.emit("# Generated from PArL source; do not edit")
+        self.emit(f"def _p_module(*, {', '.join(helpers)}):")
+        self.indent += 1
+        for target, _ in self.globals.values():
+            self.emit(f"{target} = None")
+        for func in functions:
+            self.function(func)
+            if self.checkpoint is not None:
+                self.checkpoint()
+        self.main(top_level)
+        exported = ', '.join(f"{func.name!r}: {py_name(func.name)}" for func in functions)
+        self.source_line = None
+        self.emit(f"return {{{exported}{', ' if functions else ''}'.main': _p_main}}")
+        self.indent -= 1
+        self.emit(f"_p_line_table = {source_map.encode(self.origins)!r}")
+        return '\n'.join(self.lines) + '\n'
+
+    # --- scopes -------------------------------------------------------------
+
+    def begin_function(self, reserved):
+        self.scopes = [{}]
+        # Locals must not hide the functions they may call
+        self.reserved = set(reserved) | {py_name(name) for name in self.functions}
+
+    def declare(self, name, type_):
+        target = py_name(name)
+        visible = {found for scope in self.scopes for found, _ in scope.values()}
+        if target in self.reserved or target in visible:
+            # Shadowing: Python locals are function-wide, so the inner
+            # declaration needs a name of its own
+            self.counter += 1
+            target = f"_p_{name}_{self.counter}"
+        self.scopes[-1][name] = (target, type_)
+        return target
+
+    def lookup(self, name):
+        for scope in reversed(self.scopes):
+            if name in scope:
+                return scope[name]
+        if name in self.globals:
+            return self.globals[name]
+        return None
+
+    def block(self, statements):
+        self.scopes.append({})
+        start = len(self.lines)
+        for stmt in statements:
+            self.statement(stmt)
+        if len(self.lines) == start:
+            self.emit("pass")
+        self.scopes.pop()
+
+    # --- declarations -------------------------------------------------------
+
+    def function(self, func):
+        # Globals this function writes must be declared nonlocal; names it only
+        # reads are picked up from the factory's cells automatically.
+        written = {node.name for node in walk(func.body)
+                   if isinstance(node, ASTAssignment) and node.name in self.globals}
+        written &= free_names(func)
+        self.begin_function(py_name(n) for n in free_names(func))
+        self.source_line = func.line
+        params = [self.declare(p.name, p.type) for p in func.parameters]
+        self.emit(f"def {py_name(func.name)}({', '.join(params)}):")
+        self.indent += 1
+        if written:
+            self.emit(f"nonlocal {', '.join(self.globals[n][0] for n in sorted(written))}")
+        self.block(func.body.statements)
+        self.indent -= 1
+
+    def main(self, statements):
+        self.begin_function(target for target, _ in self.globals.values())
+        self.source_line = None
+        self.emit("def _p_main():")
+        self.indent += 1
+        if self.globals:
+            self.emit(f"nonlocal {', '.join(target for target, _ in self.globals.values())}")
+        start = len(self.lines)
+        for stmt in statements:
+            if isinstance(stmt, ASTVariableDeclaration) and stmt.name in self.globals:
+                self.source_line = stmt.line
+                self.emit(f"{self.globals[stmt.name][0]} = {self.initialiser(stmt.type, stmt.value)}")
+            else:
+                self.statement(stmt)
+        if len(self.lines) == start:
+            self.emit("pass")
+        self.indent -= 1
+
+    # --- statements ---------------------------------------------------------
+
+    def statement(self, stmt):
+        if stmt.line is not None:
+            self.source_line = stmt.line
+        if isinstance(stmt, ASTVariableDeclaration):
+            value = self.initialiser(stmt.type, stmt.value)
+            self.emit(f"{self.declare(stmt.name, stmt.type)} = {value}")
+        elif isinstance(stmt, ASTAssignment):
+            target = self.target(stmt.name)
+            if element_type(self.lookup(stmt.name)[1]) is not None:
+                self.emit(f"_p_fill({target}, {self.expr(stmt.value)})")
+            else:
+                self.emit(f"{target} = {self.expr(stmt.value)}")
+        elif isinstance(stmt, ASTIndexAssignment):
+            target, index, value = self.expr(stmt.array), self.expr(stmt.index), self.expr(stmt.value)
+            if id(stmt) in self.unchecked:
+                self.emit(f"{target}[{index}] = {value}")
+            else:
+                self.emit(f"_p_store({target}, {index}, {value})")
+        elif isinstance(stmt, ASTReturnStatement):
+            self.emit(f"return {self.expr(stmt.expression)}")
+        elif isinstance(stmt, ASTExpressionStatement):
+            self.emit(self.expr(stmt.expression))
+        elif isinstance(stmt, ASTBuiltinCall):
+            self.emit(self.call(helper_name(stmt.name), stmt.args))
+        elif isinstance(stmt, ASTBlock):
+            self.block(stmt.statements)
+        elif isinstance(stmt, ASTIfStatement):
+            self.emit(f"if {self.expr(stmt.condition)}:")
+            self.indent += 1
+            self.block(stmt.then_block.statements)
+            self.indent -= 1
+            if stmt.else_block:
+                self.emit("else:")
+                self.indent += 1
+                self.block(stmt.else_block.statements)
+                self.indent -= 1
+        elif isinstance(stmt, ASTWhileStatement):
+            self.emit(f"while {self.expr(stmt.condition)}:")
+            self.indent += 1
+            self.block(stmt.body.statements)
+            self.indent -= 1
+        elif isinstance(stmt, ASTForStatement):
+            # PArL has no break/continue, so the update can simply close the body
+            self.scopes.append({})
+            self.statement(stmt.init)
+            self.emit(f"while {self.expr(stmt.condition)}:")
+            self.indent += 1
+            self.block(stmt.body.statements + [stmt.update])
+            self.indent -= 1
+            self.scopes.pop()
+        else:
+            raise BackendError(f"Cannot compile statement {type(stmt).__name__}")
+
+    def initialiser(self, type_, value):
+        # A declaration gets an array of its own: literals build one, anything
+        # else is copied
+        element = element_type(type_)
+        if element is None:
+            return self.expr(value)
+        if isinstance(value, ASTArrayLiteral):
+            return self.array_literal(value, element, array_length(type_))
+        return f"_p_array({TYPECODES[element]!r}, {self.expr(value)})"
+
+    def array_literal(self, literal, element, length=None):
+        items = ', '.join(self.expr(item) for item in literal.elements)
+        code = f"_p_array({TYPECODES[element]!r}, [{items}])"
+        if length is not None and len(literal.elements) == 1 and length > 1:
+            # 'let a: int[64] = [0];' fills the whole array
+            code = f"({code} * {length})"
+        return code
+
+    def target(self, name):
+        found = self.lookup(name)
+        if found is None:
+            raise BackendError(f"Assignment to undeclared variable '{name}'")
+        return found[0]
+
+    # --- expressions --------------------------------------------------------
+
+    def expr(self, expr):
+        return self.typed(expr)[0]
+
+    def typed(self, expr):
+        # Returns (python source, PArL type or None when it cannot be told)
+        return self.ranked(expr)[:2]
+
+    def ranked(self, expr):
+        # Also returns the Python precedence of the source, so operands are
+        # only parenthesised where Python would otherwise group them
+        # differently; CPython rejects deeply nested parentheses.
+        if isinstance(expr, ASTBinaryOp):
+            return self.binary(expr)
+        if isinstance(expr, ASTUnaryOp):
+            operand, operand_type, rank = self.ranked(expr.operand)
+            if expr.operator == 'not':
+                return f"not {parenthesise(operand, rank, PRECEDENCE['not'])}", 'bool', PRECEDENCE['not']
+            return f"-{parenthesise(operand, rank, PRECEDENCE['-x'])}", operand_type, PRECEDENCE['-x']
+        code, type_ = self.operand(expr)
+        return code, type_, (PRECEDENCE['-x'] if code.startswith('-') else ATOM)
+
+    def binary(self, expr):
+        # Left-associative chains such as 1 + 1 + ... + 1 are walked along
+        # their left spine iteratively, as they may be longer than the
+        # recursion limit allows.
+        spine = []
+        while isinstance(expr, ASTBinaryOp):
+            spine.append(expr)
+            expr = expr.left
+        left, left_type, left_rank = self.ranked(expr)
+        for node in reversed(spine):
+            right, right_type, right_rank = self.ranked(node.right)
+            op = node.operator
+            if op == '/':
+                if left_type in INTEGRAL_TYPES and right_type in INTEGRAL_TYPES:
+                    op, result = '//', 'int'
+                elif 'float' in (left_type, right_type):
+                    result = 'float'
+                else:
+                    left, left_type, left_rank = f"_p_div({left}, {right})", None, ATOM
+                    continue
+            elif op in COMPARISONS or op in ('and', 'or'):
+                result = 'bool'
+            else:
+                result = 'float' if 'float' in (left_type, right_type) else left_type
+            rank = PRECEDENCE[node.operator]
+            # Python chains comparisons, so neither side of one may be another
+            left_minimum = rank + 1 if op in COMPARISONS else rank
+            left = f"{parenthesise(left, left_rank, left_minimum)} {op} {parenthesise(right, right_rank, rank + 1)}"
+            left_type, left_rank = result, rank
+        return left, left_type, left_rank
+
+    def operand(self, expr):
+        if isinstance(expr, ASTCast):
+            value = self.expr(expr.expression)
+            return f"{CONVERSIONS[expr.target_type]}({value})", expr.target_type
+        if isinstance(expr, ASTIndex):
+            target, array_type = self.typed(expr.array)
+            element = element_type(array_type)
+            index = self.expr(expr.index)
+            code = f"{target}[{index}]" if id(expr) in self.unchecked else f"_p_load({target}, {index})"
+            if element == 'bool':
+                code = f"_p_bool({code})"
+            return code, element
+        if isinstance(expr, ASTArrayLiteral):
+            types = [self.typed(item)[1] for item in expr.elements]
+            element = ('float' if 'float' in types else 'bool' if types and all(t == 'bool' for t in types)
+                       else 'colour' if types and all(t == 'colour' for t in types) else 'int')
+            return self.array_literal(expr, element), f"{element}[{len(expr.elements)}]"
+        if isinstance(expr, ASTFunctionCall):
+            if expr.name in PAD_BUILTINS:
+                result = 'colour' if expr.name == '__read' else 'int'
+                return self.call(helper_name(expr.name), expr.args), result
+            if expr.name not in self.functions:
+                raise BackendError(f"Call to undeclared function '{expr.name}'")
+            return self.call(py_name(expr.name), expr.args), self.functions[expr.name].return_type
+        name = name_of(expr)
+        if name is not None:
+            if name in BUILTIN_VALUES:
+                return helper_name(name), 'int'
+            found = self.lookup(name)
+            if found is None:
+                raise BackendError(f"Use of undeclared variable '{name}'")
+            return found
+        if isinstance(expr, ASTLiteral):
+            value = literal_value(expr.value)
+            if expr.value.startswith('#'):
+                return f"0x{value:06x}", 'colour'
+            return repr(value), type(value).__name__
+        raise BackendError(f"Cannot compile expression {type(expr).__name__}")
+
+    def call(self, callee, args):
+        return f"{callee}({', '.join(self.expr(arg) for arg in args)})"
+
+# --- compilation and caching ------------------------------------------------
+
+def transpile(program, checkpoint=None):
+    return CodeGenerator(program, checkpoint).generate()
+
+def front_end(source):
+    from lexer import Lexer
+    from parser import Parser
+    from semantic_analysis import SemanticAnalyzer
+    tokens = Lexer(source, verbose=False).tokenize()
+    program = Parser(tokens, verbose=False).parse_program()
+    SemanticAnalyzer().analyze(program)
+    return program
+
+def source_hash(source):
+    import hashlib
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+def compile_program(program, filename='<parl>', checkpoint=None):
+    return compile(transpile(program, checkpoint), filename, 'exec')
+
+def read_cache(path):
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    if not data.startswith(CACHE_MAGIC):
+        return None
+    try:
+        return marshal.loads(data[len(CACHE_MAGIC):])
+    except (EOFError, ValueError, TypeError):
+        return None
+
+def write_cache(path, code):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp = f"{path}.{os.getpid()}.tmp"
+    with open(temp, 'wb') as f:
+        f.write(CACHE_MAGIC + marshal.dumps(code))
+    # Atomic, so concurrent compilers never observe a half-written file
+    os.replace(temp, path)
+
+def compile_source(source, cache_dir=DEFAULT_CACHE_DIR):
+    digest = source_hash(source)
+    path = os.path.join(cache_dir, digest[:32] + '.parlc') if cache_dir else None
+    if path:
+        code = read_cache(path)
+        if code is not None:
+            return code
+    code = compile_program(front_end(source), f"<parl:{digest[:12]}>")
+    if path:
+        write_cache(path, code)
+    return code
+
+def divide(left, right):
+    if isinstance(left, int) and isinstance(right, int):
+        return left // right
+    return left / right
+
+def checked_load(values, index):
+    if 0 <= index < len(values):
+        return values[index]
+    raise index_error(values, index)
+
+def checked_store(values, index, value):
+    if 0 <= index < len(values):
+        values[index] = value
+    else:
+        raise index_error(values, index)
+
+def new_array(typecode, values):
+    return list(values) if typecode is None else array(typecode, values)
+
+def fill(target, source):
+    if len(source) != len(target):
+        from runtime import PArLRuntimeError
+        raise PArLRuntimeError(f"Cannot assign an array of length {len(source)} "
+                               f"to one of length {len(target)}")
+    if isinstance(target, array) and getattr(source, 'typecode', None) != target.typecode:
+        source = array(target.typecode, source)
+    target[:] = source
+
+def index_error(values, index):
+    from runtime import PArLRuntimeError
+    return PArLRuntimeError(f"Index {index} is outside an array of length {len(values)}")
+
+def load(code, runtime=None):
+    # Returns the compiled functions keyed by PArL name, plus '.main' and the
+    # module's source_map.LineTable as '.lines'
+    if runtime is None:
+        from runtime import Runtime
+        runtime = Runtime()
+    helpers = {helper_name(name): value for name, value in runtime.builtins().items()}
+    helpers.update(_p_int=int, _p_float=float, _p_bool=bool, _p_div=divide,
+                   _p_array=new_array, _p_load=checked_load, _p_store=checked_store, _p_fill=fill)
+    namespace = {'__builtins__': builtins}
+    exec(code, namespace)
+    functions = namespace['_p_module'](**helpers)
+    functions['.lines'] = source_map.LineTable(namespace['_p_line_table'], code.co_filename)
+    return functions
+
+def run(source, runtime=None, cache_dir=DEFAULT_CACHE_DIR):
+    functions = load(compile_source(source, cache_dir), runtime)
+    try:
+        return functions['.main']()
+    except Exception as error:
+        raise attribute(error, functions['.lines']) from error
+
+def attribute(error, table):
+    # A PArLRuntimeError naming the PArL line (and function) that failed;
+    # .stack holds every PArL frame, outermost first
+    from runtime import PArLRuntimeError
+    stack = source_map.parl_stack(error.__traceback__, table)
+    function, line = stack[-1] if stack else (None, None)
+    message = str(error) if isinstance(error, PArLRuntimeError) else f"{type(error).__name__}: {error}"
+    where = f" at line {line} in {function}" if line is not None else ""
+    wrapped = PArLRuntimeError(message + where)
+    wrapped.line, wrapped.function, wrapped.stack = line, function, stack
+    return wrapped
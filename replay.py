@@ -0,0 +1,129 @@
+# replay.py - Deterministic record/replay of the PArL builtins
+#
+#   recording = RecordingRuntime(seed=7)
+#   pybackend.run(source, recording)
+#   with open('run.parlrec', 'wb') as f:
+#       f.write(recording.log())
+#
+#   replaying = ReplayRuntime(open('run.parlrec', 'rb').read())
+#   pybackend.run(source, replaying)
+#   replaying.finish()
+#
+# Only the builtins whose results the program cannot predict are logged:
+# __random_int and __read results, and __delay durations. Output builtins
+# (__print, __write, __write_box) depend only on their arguments and are
+# replayed by running them. Each entry is a one-byte opcode followed by a
+# zigzag varint (a float delay is stored as a double), so most calls cost
+# two or three bytes. The header stores the pad size.
+#
+# On replay __delay sleeps for no time at all; it only advances the virtual
+# clock, so a program that animates for a minute replays in milliseconds. A
+# call that does not match the next log entry means the program (or the
+# backend) no longer behaves as it did when recorded, and raises ReplayError.
+import struct
+
+from runtime import Runtime, PArLRuntimeError, DEFAULT_WIDTH, DEFAULT_HEIGHT
+from source_map import encode_varint, decode_varint, zigzag, unzigzag
+
+LOG_MAGIC = b'PArR'
+LOG_VERSION = 1
+HEADER = struct.Struct('<4sBHH')
+DOUBLE = struct.Struct('<d')
+
+OP_RANDOM_INT = 1
+OP_READ = 2
+OP_DELAY = 3
+OP_DELAY_FLOAT = 4
+
+OP_NAMES = {OP_RANDOM_INT: '__random_int', OP_READ: '__read',
+            OP_DELAY: '__delay', OP_DELAY_FLOAT: '__delay'}
+
+class ReplayError(Exception):
+    pass
+
+class RecordingRuntime(Runtime):
+    def __init__(self, width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT, seed=None, output=None):
+        super().__init__(width, height, seed, output)
+        self.entries = bytearray()
+        self.calls = 0
+
+    def entry(self, op, value):
+        self.calls += 1
+        self.entries.append(op)
+        if op == OP_DELAY_FLOAT:
+            self.entries += DOUBLE.pack(value)
+        else:
+            encode_varint(zigzag(value), self.entries)
+
+    def delay(self, milliseconds):
+        if isinstance(milliseconds, int):
+            self.entry(OP_DELAY, milliseconds)
+        else:
+            self.entry(OP_DELAY_FLOAT, milliseconds)
+        super().delay(milliseconds)
+
+    def read(self, x, y):
+        value = super().read(x, y)
+        self.entry(OP_READ, value)
+        return value
+
+    def random_int(self, upper):
+        value = super().random_int(upper)
+        self.entry(OP_RANDOM_INT, value)
+        return value
+
+    def log(self):
+        return HEADER.pack(LOG_MAGIC, LOG_VERSION, self.width, self.height) + bytes(self.entries)
+
+class ReplayRuntime(Runtime):
+    def __init__(self, data, output=None):
+        data = bytes(data)
+        if len(data) < HEADER.size:
+            raise ReplayError("Replay log is truncated")
+        magic, version, width, height = HEADER.unpack_from(data)
+        if magic != LOG_MAGIC or version != LOG_VERSION:
+            raise ReplayError("Not a version %d PArL replay log" % LOG_VERSION)
+        super().__init__(width, height, None, output)
+        self.data = data
+        self.position = HEADER.size
+        self.calls = 0
+        self.clock = 0              # virtual milliseconds spent in __delay
+
+    def next(self, op):
+        if self.position >= len(self.data):
+            raise ReplayError(f"Replay log ended before call {self.calls + 1} ({OP_NAMES[op]})")
+        found = self.data[self.position]
+        if OP_NAMES.get(found) != OP_NAMES[op]:
+            raise ReplayError(f"Call {self.calls + 1} is {OP_NAMES[op]} but the log "
+                              f"recorded {OP_NAMES.get(found, 'an unknown call')}")
+        self.calls += 1
+        try:
+            if found == OP_DELAY_FLOAT:
+                value, = DOUBLE.unpack_from(self.data, self.position + 1)
+                self.position += 1 + DOUBLE.size
+                return value
+            value, self.position = decode_varint(self.data, self.position + 1)
+        except (IndexError, struct.error):
+            raise ReplayError(f"Replay log is truncated in call {self.calls}") from None
+        return unzigzag(value)
+
+    def delay(self, milliseconds):
+        recorded = self.next(OP_DELAY)
+        if recorded != milliseconds:
+            raise ReplayError(f"Call {self.calls} is __delay({milliseconds}) but the log "
+                              f"recorded __delay({recorded})")
+        self.clock += milliseconds
+
+    def read(self, x, y):
+        # Out-of-range reads failed before anything was logged
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            raise PArLRuntimeError(f"__read({x}, {y}) is outside the {self.width}x{self.height} pad")
+        return self.next(OP_READ)
+
+    def random_int(self, upper):
+        return self.next(OP_RANDOM_INT)
+
+    def finish(self):
+        # Raises unless the run consumed the whole log
+        if self.position != len(self.data):
+            raise ReplayError(f"Run ended after {self.calls} calls but the log has more")
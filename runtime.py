@@ -0,0 +1,70 @@
+# runtime.py - The pad device behind the PArL builtins (__print, __write, ...)
+import sys
+import time
+from array import array
+
+DEFAULT_WIDTH = 36
+DEFAULT_HEIGHT = 24
+
+class PArLRuntimeError(Exception):
+    pass
+
+def format_value(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (array, list)):
+        # Bool arrays store bytes
+        items = map(bool, value) if getattr(value, 'typecode', None) == 'b' else value
+        return '[' + ', '.join(map(format_value, items)) + ']'
+    return str(value)
+
+class Runtime:
+    def __init__(self, width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT, seed=None, output=None):
+        self.width = width
+        self.height = height
+        self.pixels = [0] * (width * height)
+        self.random = None
+        self.seed = seed
+        self.output = output if output is not None else sys.stdout
+
+    def print_value(self, value):
+        self.output.write(format_value(value) + '\n')
+
+    def delay(self, milliseconds):
+        time.sleep(milliseconds / 1000)
+
+    def write(self, x, y, colour):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            self.pixels[y * self.width + x] = colour
+
+    def write_box(self, x, y, w, h, colour):
+        for row in range(max(y, 0), min(y + h, self.height)):
+            start = row * self.width
+            for col in range(max(x, 0), min(x + w, self.width)):
+                self.pixels[start + col] = colour
+
+    def read(self, x, y):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return self.pixels[y * self.width + x]
+        raise PArLRuntimeError(f"__read({x}, {y}) is outside the {self.width}x{self.height} pad")
+
+    def random_int(self, upper):
+        # Uniform integer in [0, upper). The generator (and the random module)
+        # are only set up for programs that actually ask for a number.
+        if self.random is None:
+            import random
+            self.random = random.Random(self.seed)
+        return self.random.randrange(upper) if upper > 0 else 0
+
+    def builtins(self):
+        # Callables (or values) keyed by builtin name without the '__' prefix
+        return {
+            'print': self.print_value,
+            'delay': self.delay,
+            'write': self.write,
+            'write_box': self.write_box,
+            'read': self.read,
+            'random_int': self.random_int,
+            'width': self.width,
+            'height': self.height,
+        }
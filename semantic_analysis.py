@@ -1,4 +1,14 @@
 from ast_nodes import *
+from ast_utils import name_of, literal_value, element_type, array_length
+from lexer import PAD_BUILTINS
+
+BUILTIN_TYPES = {'__width': 'int', '__height': 'int', '__read': 'colour', '__random_int': 'int'}
+INTEGRAL_TYPES = ('int', 'colour')
+
+def may_be_array(expr):
+    # Only names, calls and array literals can have an array type, which
+    # spares the type checks a walk over every operator chain
+    return isinstance(expr, (ASTArrayLiteral, ASTFunctionCall)) or name_of(expr) is not None
 
 class SemanticAnalysisError(Exception):
     """Custom exception for semantic analysis errors."""
@@ -7,8 +17,13 @@ class SemanticAnalysisError(Exception):
         super().__init__(self.message)
 
 class SemanticAnalyzer:
-    def __init__(self):
-        self.symbol_table = SymbolTable()
+    def __init__(self, workspace=None, checkpoint=None):
+        # workspace: an optional WorkspaceIndex used to resolve calls to
+        # functions declared in other files. checkpoint: called after each
+        # function and top-level statement; may raise to abandon the analysis
+        self.symbol_table = SymbolTable(workspace)
+        self.checkpoint = checkpoint
+        self.current_function = None
 
     def analyze(self, node):
         # Start semantic analysis from the root node
@@ -18,32 +33,67 @@ class SemanticAnalyzer:
             raise SemanticAnalysisError("Unknown root node type.")
 
     def analyze_program(self, node):
+        # Register every function first so calls may precede declarations
+        for decl in node.declarations:
+            if isinstance(decl, ASTFunctionDeclaration):
+                self.symbol_table.add_function(decl.name, decl)
+
+        # Functions see every top-level variable, wherever it is declared,
+        # and may read and assign it; their own names shadow it
+        self.symbol_table.globals = {decl.name: self.global_type(decl) for decl in node.declarations
+                                     if isinstance(decl, ASTVariableDeclaration)}
+
         # Analyze function declarations
         for decl in node.declarations:
             if isinstance(decl, ASTFunctionDeclaration):
                 self.analyze_function(decl)
+                if self.checkpoint is not None:
+                    self.checkpoint()
+
+        # Analyze the top-level statements that make up the program entry point
+        self.symbol_table.globals = {}
+        for decl in node.declarations:
+            if not isinstance(decl, ASTFunctionDeclaration):
+                self.analyze_statement(decl)
+                if self.checkpoint is not None:
+                    self.checkpoint()
+
+    def global_type(self, decl):
+        # 'int[]' takes its length from a literal initialiser
+        element = element_type(decl.type)
+        if element is not None and array_length(decl.type) is None and isinstance(decl.value, ASTArrayLiteral):
+            return f"{element}[{len(decl.value.elements)}]"
+        return decl.type
 
     def analyze_function(self, func):
-        # Add function to the symbol table
-        self.symbol_table.add_function(func.name)
-        
+        # Each function gets its own variables; nothing leaks between functions
+        self.symbol_table.push_scope(fresh=True)
+        self.current_function = func
+
         # Analyze parameters of the function
         for param in func.parameters:
+            self.check_array_type(param.type, param.name)
             self.symbol_table.add_variable(param.name, param.type)
 
         # Analyze function body
         self.analyze_block(func.body)
+        self.current_function = None
+        self.symbol_table.pop_scope()
 
     def analyze_block(self, block):
-        # Process each statement in the block
+        # Process each statement in the block; its declarations end with it
+        self.symbol_table.push_scope()
         for statement in block.statements:
             self.analyze_statement(statement)
+        self.symbol_table.pop_scope()
 
     def analyze_statement(self, stmt):
         if isinstance(stmt, ASTVariableDeclaration):
             self.analyze_variable_declaration(stmt)
         elif isinstance(stmt, ASTAssignment):
             self.analyze_assignment(stmt)
+        elif isinstance(stmt, ASTIndexAssignment):
+            self.analyze_index_assignment(stmt)
         elif isinstance(stmt, ASTIfStatement):
             self.analyze_if_statement(stmt)
         elif isinstance(stmt, ASTWhileStatement):
@@ -52,16 +102,32 @@ class SemanticAnalyzer:
             self.analyze_for_statement(stmt)
         elif isinstance(stmt, ASTFunctionCall):
             self.analyze_function_call(stmt)
+        elif isinstance(stmt, ASTReturnStatement):
+            self.analyze_expression(stmt.expression)
+            if self.current_function is not None:
+                self.check_assignable(self.current_function.return_type, stmt.expression,
+                                      f"return value of '{self.current_function.name}'")
+        elif isinstance(stmt, ASTExpressionStatement):
+            self.analyze_expression(stmt.expression)
+        elif isinstance(stmt, ASTBuiltinCall):
+            for arg in stmt.args:
+                self.analyze_expression(arg)
 
     def analyze_variable_declaration(self, decl):
-        # Ensure variable is not redeclared
-        if self.symbol_table.lookup_variable(decl.name):
+        # Ensure variable is not redeclared (a global may be shadowed)
+        if decl.name in self.symbol_table.variables:
             raise SemanticAnalysisError(f"Variable '{decl.name}' already declared.")
         
         # Add variable to the symbol table
         self.symbol_table.add_variable(decl.name, decl.type)
         # Analyze the expression assigned to the variable
         self.analyze_expression(decl.value)
+        self.check_array_type(decl.type, decl.name)
+        if element_type(decl.type) is not None:
+            # 'int[]' takes its length from the initialiser
+            self.symbol_table.variables[decl.name] = self.array_initialiser(decl)
+        else:
+            self.check_assignable(decl.type, decl.value, f"variable '{decl.name}'")
 
     def analyze_assignment(self, stmt):
         # Ensure variable is declared before assignment
@@ -70,25 +136,194 @@ class SemanticAnalyzer:
         
         # Analyze the expression being assigned
         self.analyze_expression(stmt.value)
+        self.check_assignable(self.symbol_table.variable_type(stmt.name), stmt.value,
+                              f"variable '{stmt.name}'")
+
+    def analyze_index_assignment(self, stmt):
+        array_type = self.analyze_index(stmt.array, stmt.index)
+        self.analyze_expression(stmt.value)
+        self.check_element(element_type(array_type), stmt.value,
+                           f"an element of '{name_of(stmt.array)}'")
+
+    def analyze_index(self, array, index):
+        # Checks an 'a[i]' access and returns the type of a
+        name = name_of(array)
+        if name is None or not self.symbol_table.lookup_variable(name):
+            raise SemanticAnalysisError(f"Variable '{name or array}' is not declared.")
+        array_type = self.symbol_table.variable_type(name)
+        if element_type(array_type) is None:
+            raise SemanticAnalysisError(f"Variable '{name}' is not an array.")
+        self.analyze_expression(index)
+        index_type = self.expression_type(index)
+        if index_type is not None and index_type != 'int':
+            raise SemanticAnalysisError(f"Array index of '{name}' must be an int, not {index_type}.")
+        return array_type
+
+    # --- array types --------------------------------------------------------
+
+    def check_array_type(self, type_, name):
+        length = array_length(type_)
+        if length is not None and length < 1:
+            raise SemanticAnalysisError(f"Array '{name}' must have at least one element.")
+
+    def array_initialiser(self, decl):
+        # The full type of an array variable, length included when it is known
+        element, length = element_type(decl.type), array_length(decl.type)
+        value = decl.value
+        if isinstance(value, ASTArrayLiteral):
+            if not value.elements:
+                raise SemanticAnalysisError(f"Array '{decl.name}' must have at least one element.")
+            # A single element fills an array of declared length
+            if length is not None and len(value.elements) not in (1, length):
+                raise SemanticAnalysisError(
+                    f"Array '{decl.name}' has length {length} but is given {len(value.elements)} elements.")
+            for item in value.elements:
+                self.check_element(element, item, f"an element of '{decl.name}'")
+            return f"{element}[{length or len(value.elements)}]"
+        value_type = self.expression_type(value)
+        if value_type is None:
+            return decl.type
+        self.check_assignable(decl.type, value, f"variable '{decl.name}'")
+        return f"{element}[{length or array_length(value_type) or ''}]"
+
+    def check_assignable(self, target, expr, what):
+        # Raises if a value of expr's type cannot be stored in a target of the
+        # given type. Array-ness, element type and length are checked, and a
+        # float never goes where an int or colour is declared: the backends
+        # choose integer or float division from declared types. Other
+        # scalars keep converting freely as they always have. An array of
+        # unknown length does not fit a fixed-length target, whose declared
+        # length bounds.py relies on.
+        if target is None:
+            return
+        source = self.expression_type(expr)
+        if source is None:
+            return
+        target_element, source_element = element_type(target), element_type(source)
+        if target_element is None and source_element is None:
+            if source == 'float' and target in INTEGRAL_TYPES:
+                raise SemanticAnalysisError(f"Cannot assign {source} to {what} of type {target}.")
+            return
+        if (target_element is None) != (source_element is None):
+            raise SemanticAnalysisError(f"Cannot assign {source} to {what} of type {target}.")
+        target_length, source_length = array_length(target), array_length(source)
+        if (target_element != source_element
+                or target_length is not None and target_length != source_length):
+            raise SemanticAnalysisError(f"Cannot assign {source} to {what} of type {target}.")
+
+    def check_element(self, element, expr, what):
+        # Array elements live in typed storage: ints and colours are
+        # interchangeable and both widen to float, nothing else converts
+        source = self.expression_type(expr)
+        if source is None or source == element:
+            return
+        if source in INTEGRAL_TYPES and element in INTEGRAL_TYPES + ('float',):
+            return
+        raise SemanticAnalysisError(f"Cannot store {source} in {what} of type {element}.")
+
+    def check_scalar(self, expr, operator):
+        # Arrays only take part in indexing, assignment and calls
+        if not may_be_array(expr):
+            return
+        expr_type = self.expression_type(expr)
+        if element_type(expr_type) is not None:
+            raise SemanticAnalysisError(f"Operator '{operator}' cannot be applied to {expr_type}.")
+
+    def expression_type(self, expr):
+        # The PArL type of an expression where it can be told without a full
+        # type checker, else None
+        if isinstance(expr, ASTArrayLiteral):
+            known = [t for t in map(self.expression_type, expr.elements) if t is not None]
+            return f"{known[0]}[{len(expr.elements)}]" if known else None
+        if isinstance(expr, ASTIndex):
+            return element_type(self.expression_type(expr.array))
+        if isinstance(expr, ASTCast):
+            return expr.target_type
+        if isinstance(expr, ASTFunctionCall):
+            if expr.name in BUILTIN_TYPES:
+                return BUILTIN_TYPES[expr.name]
+            signature = self.symbol_table.function_signature(expr.name)
+            return signature[1] if signature is not None else None
+        if isinstance(expr, ASTBinaryOp):
+            # Along the left spine iteratively, like analyze_expression
+            spine = []
+            while isinstance(expr, ASTBinaryOp):
+                spine.append(expr)
+                expr = expr.left
+            result = self.expression_type(expr)
+            for node in reversed(spine):
+                if node.operator in ('<', '<=', '>', '>=', '==', '!=', 'and', 'or'):
+                    result = 'bool'
+                elif result != 'float' and self.expression_type(node.right) == 'float':
+                    result = 'float'
+            return result
+        if isinstance(expr, ASTUnaryOp):
+            return 'bool' if expr.operator == 'not' else self.expression_type(expr.operand)
+        name = name_of(expr)
+        if name is not None:
+            if name in BUILTIN_TYPES:
+                return BUILTIN_TYPES[name]
+            return self.symbol_table.variable_type(name)
+        if isinstance(expr, ASTLiteral):
+            if expr.value.startswith('#'):
+                return 'colour'
+            return type(literal_value(expr.value)).__name__
+        return None
 
     def analyze_function_call(self, call):
         # Check if function exists in the symbol table
-        if not self.symbol_table.lookup_function(call.name):
+        if call.name not in PAD_BUILTINS and not self.symbol_table.lookup_function(call.name):
             raise SemanticAnalysisError(f"Function '{call.name}' is not declared.")
-        
+
+        # Functions from other files come with a known signature
+        external = self.symbol_table.external_functions.get(call.name)
+        if external is not None and len(call.args) != len(external.parameters):
+            raise SemanticAnalysisError(
+                f"Function '{call.name}' expects {len(external.parameters)} arguments, got {len(call.args)}.")
+
         # Analyze the arguments of the function call
         for arg in call.args:
             self.analyze_expression(arg)
 
+        # Array arguments must match array parameters; the array is passed by
+        # reference, so a length the callee relies on has to be right
+        signature = self.symbol_table.function_signature(call.name)
+        if signature is not None:
+            for (param, param_type), arg in zip(signature[0], call.args):
+                self.check_assignable(param_type, arg, f"parameter '{param}' of '{call.name}'")
+
     def analyze_expression(self, expr):
         # Handle expressions such as binary operations, literals, and identifiers
         if isinstance(expr, ASTBinaryOp):
-            self.analyze_expression(expr.left)
-            self.analyze_expression(expr.right)
+            # Walk the left spine iteratively: chains like 1 + 1 + ... + 1
+            # can be longer than the recursion limit allows
+            spine = []
+            while isinstance(expr, ASTBinaryOp):
+                spine.append(expr)
+                expr = expr.left
+            self.analyze_expression(expr)
+            for node in reversed(spine):
+                self.analyze_expression(node.right)
+                self.check_scalar(node.left, node.operator)
+                self.check_scalar(node.right, node.operator)
         elif isinstance(expr, ASTUnaryOp):
             self.analyze_expression(expr.operand)
+            self.check_scalar(expr.operand, expr.operator)
+        elif isinstance(expr, ASTCast):
+            self.analyze_expression(expr.expression)
+        elif isinstance(expr, ASTFunctionCall):
+            self.analyze_function_call(expr)
+        elif isinstance(expr, ASTIndex):
+            self.analyze_index(expr.array, expr.index)
+        elif isinstance(expr, ASTArrayLiteral):
+            for item in expr.elements:
+                self.analyze_expression(item)
+                self.check_scalar(item, '[]')
         elif isinstance(expr, ASTLiteral):
-            pass  # No need to analyze literals
+            # The parser stores identifiers as literals too
+            name = name_of(expr)
+            if name is not None and name not in BUILTIN_TYPES and not self.symbol_table.lookup_variable(name):
+                raise SemanticAnalysisError(f"Variable '{name}' is not declared.")
         elif isinstance(expr, ASTIdentifier):
             # Check if identifier is declared
             if not self.symbol_table.lookup_variable(expr.name):
@@ -110,20 +345,35 @@ class SemanticAnalyzer:
 
     def analyze_for_statement(self, stmt):
         # Analyze the initialization, condition, update, and body of the for loop
+        self.symbol_table.push_scope()
         self.analyze_variable_declaration(stmt.init)
         self.analyze_expression(stmt.condition)
         self.analyze_assignment(stmt.update)
         self.analyze_block(stmt.body)
+        self.symbol_table.pop_scope()
 
 class SymbolTable:
-    def __init__(self):
+    def __init__(self, workspace=None):
         self.functions = {}
         self.variables = {}
+        self.globals = {}       # top-level variables, while a function is analysed
+        self.saved_scopes = []
+        self.workspace = workspace
+        self.external_functions = {}
+
+    def push_scope(self, fresh=False):
+        # Remember the visible variables so pop_scope can drop anything
+        # declared in between
+        self.saved_scopes.append(self.variables)
+        self.variables = {} if fresh else dict(self.variables)
+
+    def pop_scope(self):
+        self.variables = self.saved_scopes.pop()
 
-    def add_function(self, name):
+    def add_function(self, name, decl=None):
         if name in self.functions:
             raise SemanticAnalysisError(f"Function '{name}' already declared.")
-        self.functions[name] = True
+        self.functions[name] = decl if decl is not None else True
 
     def add_variable(self, name, var_type):
         if name in self.variables:
@@ -131,7 +381,30 @@ class SymbolTable:
         self.variables[name] = var_type
 
     def lookup_variable(self, name):
-        return name in self.variables
+        return name in self.variables or name in self.globals
+
+    def variable_type(self, name):
+        if name in self.variables:
+            return self.variables[name]
+        return self.globals.get(name)
+
+    def function_signature(self, name):
+        # ([(param name, type)], return type) of a local or workspace function
+        decl = self.functions.get(name)
+        if isinstance(decl, ASTFunctionDeclaration):
+            return [(p.name, p.type) for p in decl.parameters], decl.return_type
+        external = self.external_functions.get(name)
+        if external is not None:
+            return external.parameters, external.return_type
+        return None
 
     def lookup_function(self, name):
-        return name in self.functions
+        if name in self.functions:
+            return True
+        # Fall back to the functions declared elsewhere in the workspace
+        if self.workspace is not None:
+            entry = self.workspace.lookup(name)
+            if entry is not None:
+                self.external_functions[name] = entry
+                return True
+        return False
@@ -0,0 +1,104 @@
+# source_map.py - Line tables from generated Python code back to PArL source
+#
+# The Python backend records, for every line of the module it generates, the
+# PArL line the code came from. Only the points where that line changes are
+# kept, as delta-encoded varints (like CPython's own line tables): one
+# unsigned delta of the generated line and one zigzag-encoded signed delta of
+# the PArL line per entry, usually two bytes. The bytes travel inside the
+# compiled module, so the marshal cache stores them for free, and they are
+# decoded into two arrays on the first lookup, after which mapping a
+# generated line to a PArL line is a binary search. PArL line 0 stands for
+# generated scaffolding with no source of its own.
+from array import array
+from bisect import bisect_right
+
+def encode_varint(value, out):
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+def decode_varint(data, position):
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+def zigzag(value):
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+def unzigzag(value):
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+def encode(lines):
+    # lines[i] is the PArL line of generated line i + 1 (0 or None for none)
+    out = bytearray()
+    previous_address = previous_line = 0
+    for address, line in enumerate(lines, 1):
+        line = line or 0
+        if line == previous_line and out:
+            continue
+        encode_varint(address - previous_address, out)
+        encode_varint(zigzag(line - previous_line), out)
+        previous_address, previous_line = address, line
+    return bytes(out)
+
+class LineTable:
+    def __init__(self, data=b'', filename=None):
+        self.data = bytes(data)
+        self.filename = filename        # co_filename of the code it describes
+        self.addresses = None
+        self.lines = None
+
+    def decode(self):
+        addresses, lines = array('l'), array('l')
+        position = address = line = 0
+        while position < len(self.data):
+            delta, position = decode_varint(self.data, position)
+            change, position = decode_varint(self.data, position)
+            address += delta
+            line += unzigzag(change)
+            addresses.append(address)
+            lines.append(line)
+        self.addresses, self.lines = addresses, lines
+
+    def lookup(self, address):
+        # PArL line for a generated line, or None
+        if self.addresses is None:
+            self.decode()
+        i = bisect_right(self.addresses, address) - 1
+        if i < 0:
+            return None
+        return self.lines[i] or None
+
+    def __iter__(self):
+        # (first generated line, PArL line) for each run
+        if self.addresses is None:
+            self.decode()
+        return zip(self.addresses, self.lines)
+
+    def __len__(self):
+        if self.addresses is None:
+            self.decode()
+        return len(self.addresses)
+
+def parl_function(code_name):
+    # Inverse of pybackend.py_name for generated function names
+    if code_name == '_p_main':
+        return '<main>'
+    return code_name[3:] if code_name.startswith('_p_') else code_name
+
+def parl_stack(traceback, table):
+    # [(PArL function, PArL line)] for the frames of a traceback that ran
+    # the code table describes, outermost first
+    stack = []
+    while traceback is not None:
+        code = traceback.tb_frame.f_code
+        if code.co_filename == table.filename and code.co_name != '_p_module':
+            stack.append((parl_function(code.co_name), table.lookup(traceback.tb_lineno)))
+        traceback = traceback.tb_next
+    return stack
@@ -0,0 +1,145 @@
+import io
+
+import bounds
+import ir
+import pybackend
+from ast_nodes import *
+from ast_utils import walk
+from lexer import Lexer
+from parser import Parser
+from semantic_analysis import SemanticAnalyzer, SemanticAnalysisError
+from runtime import Runtime, PArLRuntimeError
+
+source_code = """fun Sum(xs: int[], n: int) -> int {
+    let t: int = 0;
+    for (let i: int = 0; i < n; i = i + 1) {
+        t = t + xs[i];
+    }
+    return t;
+}
+
+fun Blur(src: float[8], dst: float[8]) -> int {
+    for (let i: int = 1; i < 7; i = i + 1) {
+        dst[i] = (src[i - 1] + src[i] + src[i + 1]) / 3.0;
+    }
+    return 0;
+}
+
+let a: int[4] = [1, 2, 3, 4];
+let f: float[8] = [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0];
+let g: float[8] = [0.0];
+let flags: bool[] = [true, false];
+let b: int[] = a;
+a[0] = a[3] * 2;
+b[1] = 20;
+__print(Sum(a, 4));
+__print(a);
+__print(b);
+__print(Blur(f, g));
+__print(g[1]);
+__print(flags);
+__print(flags[1]);
+let n: int = 4;
+let m: int = __width / 12;
+for (let k: int = 0; k <= n - 1; k = k + 1) {
+    a[k] = k * k;
+}
+for (let k: int = 0; k < m; k = k + 1) {
+    a[k + 1] = k;
+}
+__print(a);
+g = f;
+__print(g[7]);
+"""
+
+def parse(source):
+    return Parser(Lexer(source, verbose=False).tokenize(), verbose=False).parse_program()
+
+program = parse(source_code)
+SemanticAnalyzer().analyze(program)
+
+# Array types are kept as written; indexing has nodes of its own
+assert [d.type for d in program.declarations if isinstance(d, ASTVariableDeclaration)][:5] == \
+       ['int[4]', 'float[8]', 'float[8]', 'bool[]', 'int[]']
+assert program.declarations[1].parameters[0].type == 'float[8]'
+assert isinstance(program.declarations[7], ASTIndexAssignment)
+
+# Only the accesses whose index provably stays in range lose their checks:
+# constant indices, Blur's reads and store, and the first loop at the end.
+# Sum's xs has no known length and m is only known at run time.
+safe = bounds.safe_accesses(program)
+accesses = [node for node in walk(program) if isinstance(node, (ASTIndex, ASTIndexAssignment))]
+assert [node.line for node in accesses if id(node) not in safe] == [4, 36]
+assert len(safe) == 11
+
+# A constant a function may change is no constant
+changed = parse("fun Grow() -> int { n = 9; return n; }\nlet n: int = 2;\nlet a: int[2] = [0];\n"
+                "let x: int = Grow();\nfor (let i: int = 0; i < n; i = i + 1) { a[i] = 1; }\n")
+assert bounds.safe_accesses(changed) == set()
+
+output = io.StringIO()
+pybackend.run(source_code, Runtime(output=output), cache_dir=None)
+print(output.getvalue())
+assert output.getvalue().split('\n') == [
+    '17', '[8, 2, 3, 4]', '[1, 20, 3, 4]', '0', '2.0', '[true, false]', 'false',
+    '[0, 0, 1, 2]', '8.0', '']
+
+# Float storage is an unboxed array.array, not a list
+functions = pybackend.load(pybackend.compile_program(program), Runtime(output=io.StringIO()))
+source = pybackend.transpile(program)
+assert "_p_array('d', [1.0" in source and "dst[i] = " in source and "_p_load(xs, i)" in source
+assert "(_p_array('d', [0.0]) * 8)" in source
+
+# Int arrays are lists, so elements are as unbounded as int scalars
+output = io.StringIO()
+pybackend.run("let big: int = 9223372036854775807 + 1;\nlet a: int[2] = [0];\na[1] = big * big;\n"
+              "let b: int[2] = a;\nb = [big, 1];\n__print(a);\n__print(b);\n",
+              Runtime(output=output), cache_dir=None)
+assert output.getvalue().split('\n')[:2] == [f"[0, {2 ** 126}]", f"[{2 ** 63}, 1]"], output.getvalue()
+
+# Checked accesses report the PArL line
+try:
+    pybackend.run("let a: int[3] = [0];\nlet i: int = 3;\n__print(a[i]);\n",
+                  Runtime(output=io.StringIO()), cache_dir=None)
+    raise AssertionError("expected an index error")
+except PArLRuntimeError as error:
+    print(error)
+    assert error.line == 3 and "Index 3" in str(error)
+
+# Negative indices never wrap around
+try:
+    pybackend.run("let a: int[3] = [0];\na[0 - 1] = 5;\n", Runtime(output=io.StringIO()), cache_dir=None)
+    raise AssertionError("expected an index error")
+except PArLRuntimeError as error:
+    assert error.line == 2
+
+# The analyzer checks array types
+for bad, message in [
+        ('let values: int = [1, 2, 3, 4];', "Cannot assign int[4] to variable 'values' of type int."),
+        ('let a: int[3] = [1, 2];', "Array 'a' has length 3 but is given 2 elements."),
+        ('let a: int[2] = [1, 2]; let x: int = a + 1;', "Operator '+' cannot be applied to int[2]."),
+        ('let x: int = 1; x[0] = 2;', "Variable 'x' is not an array."),
+        ('let a: int[2] = [1, 2]; __print(a[true]);', "Array index of 'a' must be an int, not bool."),
+        ('let a: float[2] = [1.0, 2.0]; a[0] = true;', "Cannot store bool in an element of 'a' of type float."),
+        ('fun F(xs: int[3]) -> int { return xs[0]; } let a: int[2] = [1, 2]; __print(F(a));',
+         "Cannot assign int[2] to parameter 'xs' of 'F' of type int[3]."),
+        # A fixed length is trusted by bounds.py, so unknown lengths never meet it
+        ('fun F(xs: int[8]) -> int { for (let i: int = 0; i < 8; i = i + 1) { xs[i] = i; } return 0; }\n'
+         'fun G(ys: int[]) -> int { return F(ys); }\nlet a: int[3] = [0];\n__print(G(a));',
+         "Cannot assign int[] to parameter 'xs' of 'F' of type int[8]."),
+        ('fun F(ys: int[]) -> int { let c: int[8] = ys; return c[7]; }',
+         "Cannot assign int[] to variable 'c' of type int[8]."),
+        ]:
+    try:
+        SemanticAnalyzer().analyze(parse(bad))
+        raise AssertionError(f"accepted {bad}")
+    except SemanticAnalysisError as error:
+        assert str(error) == message, str(error)
+
+# Arrays lower to explicit loads and stores in the IR, which are never hoisted
+module = ir.lower(program)
+ir.optimize(module)
+blur = module.functions['Blur']
+ops = [blur.op[i] for i in blur.instructions()]
+assert ops.count(ir.ALOAD) == 3 and ops.count(ir.ASTORE) == 1
+assert all(blur.block_of[i] != 0 for i in blur.instructions() if blur.op[i] == ir.ALOAD)
@@ -0,0 +1,68 @@
+import os
+import tempfile
+
+from lexer import Lexer
+from parser import Parser
+from ast_nodes import *
+import ast_binary
+import pybackend
+
+source_code = """
+fun XGreaterY(x: int, y: int) -> bool {
+    let ans: bool = true;
+    if (y > x) { ans = false; }
+    return ans;
+}
+
+fun AverageOfTwo(x: int, y: int) -> float {
+    let t0: int = x + y;
+    let t1: float = t0 / 2 as float;
+    return t1;
+}
+
+let c1: colour = #00ff00;
+__print(AverageOfTwo(3, 4));
+"""
+
+lexer = Lexer(source_code)
+tokens = lexer.tokenize()
+parser = Parser(tokens)
+program = parser.parse_program()
+
+data = ast_binary.dumps(program)
+print(f"{len(data)} bytes")
+
+ast_file = ast_binary.ASTFile(data)
+signatures = list(ast_file.function_signatures())
+print(signatures)
+assert signatures == [
+    ('XGreaterY', [('x', 'int'), ('y', 'int')], 'bool'),
+    ('AverageOfTwo', [('x', 'int'), ('y', 'int')], 'float'),
+]
+
+# Lazy access decodes only what is touched
+root = ast_file.root
+assert root.node_type is ASTProgram
+assert len(root.declarations) == 4
+cast = root.declarations[1].body.statements[1].value
+assert cast.node_type is ASTCast and cast.target_type == 'float'
+assert len(ast_file.string_cache) < len(ast_file.offsets) - 1
+
+# A fully decoded tree compiles to exactly the same code as the original
+assert pybackend.transpile(ast_file.materialize()) == pybackend.transpile(program)
+
+# Files are memory-mapped and versioned
+with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, 'program.past')
+    ast_binary.dump(program, path)
+    with ast_binary.ASTFile.open(path) as mapped:
+        assert list(mapped.function_signatures()) == signatures
+
+    corrupted = bytearray(data)
+    corrupted[4] = ast_binary.FORMAT_VERSION + 1
+    try:
+        ast_binary.ASTFile(bytes(corrupted))
+    except ast_binary.ASTFormatError as error:
+        print(f"rejected: {error}")
+    else:
+        raise AssertionError("version mismatch was not detected")
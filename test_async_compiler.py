@@ -0,0 +1,93 @@
+import asyncio
+import io
+import time
+
+import pybackend
+from async_compiler import AsyncCompiler, CompilationTimeout, CompileQueueFull
+from parser import ParserError
+from runtime import Runtime
+
+small = """
+fun Square(x: int) -> int {
+    return x * x;
+}
+__print(Square(7));
+"""
+
+# Large enough to keep a worker busy for a good fraction of a second
+large = "".join(f"""
+fun F{i}(x: int) -> int {{
+    let y: int = x * {i} + 1;
+    if (y > 10) {{ return y - 1; }}
+    return y;
+}}
+""" for i in range(1500)) + "__print(F1(2));\n"
+
+async def ticker(gaps, stop):
+    # Records how long the event loop went without running this coroutine
+    last = time.perf_counter()
+    while not stop.is_set():
+        await asyncio.sleep(0.005)
+        now = time.perf_counter()
+        gaps.append(now - last)
+        last = now
+
+async def main():
+    async with AsyncCompiler(max_workers=1, max_pending=2) as compiler:
+        code = await compiler.compile(small)
+        output = io.StringIO()
+        pybackend.load(code, Runtime(output=output))['.main']()
+        assert output.getvalue() == "49\n"
+
+        try:
+            await compiler.compile("let x: int = ;")
+            raise AssertionError("expected a parse error")
+        except ParserError as e:
+            print("error:", e)
+
+        # A big compilation does not stall the event loop: compile() of the
+        # whole module, which holds the GIL, took about a tenth of the time
+        # before it moved to a process. Wall-clock numbers vary with load, so
+        # the longest stall is compared with the compile time, over several
+        # samples.
+        ratios = []
+        for _ in range(3):
+            gaps, stop = [], asyncio.Event()
+            tick = asyncio.create_task(ticker(gaps, stop))
+            start = time.perf_counter()
+            await compiler.compile(large)
+            elapsed = time.perf_counter() - start
+            stop.set()
+            await tick
+            print(f"large compile {elapsed * 1000:.0f} ms, longest loop stall {max(gaps) * 1000:.1f} ms")
+            ratios.append(max(gaps) / elapsed)
+        assert sorted(ratios)[1] < 1 / 30, ratios
+
+        # Timeouts abandon the work at the next checkpoint and free the slot
+        try:
+            await compiler.compile(large, timeout=0.02)
+            raise AssertionError("expected a timeout")
+        except CompilationTimeout as e:
+            print("timeout:", e)
+        for _ in range(200):
+            if compiler.pending == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert compiler.pending == 0
+
+        # Backpressure: with both slots taken, wait=False is refused
+        running = [asyncio.create_task(compiler.compile(large)) for _ in range(2)]
+        await asyncio.sleep(0)
+        try:
+            await compiler.compile(small, wait=False)
+            raise AssertionError("expected the queue to be full")
+        except CompileQueueFull as e:
+            print("queue full:", e)
+        # ...while waiting callers are admitted once a slot frees up
+        code = await compiler.compile(small, timeout=30)
+        assert code is not None
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+asyncio.run(main())
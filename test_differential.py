@@ -0,0 +1,36 @@
+import ast_nodes as ast
+import differential
+from ast_utils import walk
+from differential import Engine, compare, shrink, run_campaign, reference_tokenize, reference_parse
+
+# Every registered engine agrees with the reference on a batch of cases
+failures = run_campaign(150, seed=1, jobs=1)
+for failure in failures:
+    print(differential.report(failure))
+assert failures == []
+
+# Worker processes give the same answer
+assert run_campaign(40, seed=7, jobs=2) == []
+
+# A deliberately broken engine is caught and its case shrunk
+def swapped_parse(tokens):
+    program = reference_parse(tokens)
+    for node in walk(program):
+        if isinstance(node, ast.ASTBinaryOp) and node.operator == '*':
+            node.operator = '/'
+    return program
+
+broken = Engine('broken', reference_tokenize, swapped_parse)
+source = "fun F(x: int) -> int {\n    let y: int = x + 1;\n    return y * 2;\n}\n__print(F(3));\n"
+mismatches = compare(source, [broken])
+assert [(name, field) for name, field, _, _ in mismatches] == [('broken', 'ast')]
+
+small = shrink(source, lambda candidate: bool(compare(candidate, [broken])))
+print("shrunk to", repr(small))
+assert compare(small, [broken]) and "*" in small and len(small) < len(source) // 2
+
+# The canonical dump separates trees that differ anywhere
+a = reference_parse(reference_tokenize("let x: int = 1 + 2;"))
+b = reference_parse(reference_tokenize("let x: int = 1 + 3;"))
+assert differential.canonical(a) != differential.canonical(b)
+print(differential.canonical(a))
@@ -0,0 +1,91 @@
+import io
+import subprocess
+import sys
+
+import ast_binary
+import pybackend
+from ast_utils import walk
+from hashcons import InternTable, structural_hash, same, unshare
+from inliner import Inliner
+from lexer import Lexer
+from parser import Parser
+from runtime import Runtime
+from semantic_analysis import SemanticAnalyzer
+
+source_code = """
+fun Score(p1_score: int, score_max: int) -> int {
+    if (p1_score < score_max) { return (p1_score < score_max) as int; }
+    return p1_score * 2 + score_max * 2;
+}
+fun Copy(p1_score: int, score_max: int) -> int {
+    if (p1_score < score_max) { return (p1_score < score_max) as int; }
+    return p1_score * 2 + score_max * 2;
+}
+__print(Score(1, 5) + Copy(7, 5));
+"""
+
+def parse(interner=None):
+    tokens = Lexer(source_code, verbose=False).tokenize()
+    return Parser(tokens, verbose=False, interner=interner).parse_program()
+
+table = InternTable()
+program = parse(table)
+plain = parse()
+print(table.stats())
+
+# Equal expressions are one object, across functions too
+score, copy = program.declarations[0], program.declarations[1]
+condition = score.body.statements[0].condition
+assert condition is score.body.statements[0].then_block.statements[0].expression.expression
+assert condition is copy.body.statements[0].condition
+assert same(condition, copy.body.statements[0].condition)
+assert table.stats()['shared'] > 0
+
+# Calls are never shared: each one is evaluated on its own, so two draws
+# from __random_int stay two nodes, and so do the expressions around them
+tokens = Lexer("let a: int = __random_int(5) + 1;\nlet b: int = __random_int(5) + 1;", verbose=False).tokenize()
+draws = Parser(tokens, verbose=False, interner=InternTable()).parse_program().declarations
+assert draws[0].value is not draws[1].value
+assert draws[0].value.left is not draws[1].value.left
+assert draws[0].value.right is draws[1].value.right
+assert same(draws[0].value, draws[1].value)
+
+# Sharing reduces the node count without changing the shape of the tree
+def distinct(root):
+    return len({id(node) for node in walk(root)})
+assert distinct(program) < distinct(plain)
+assert len(list(walk(program))) == len(list(walk(plain)))
+
+# Whole function bodies match by structural hash, interned or not
+assert structural_hash(score.body) == structural_hash(copy.body)
+assert structural_hash(score.body) == structural_hash(plain.declarations[0].body)
+assert structural_hash(condition) != structural_hash(score.body.statements[1].expression)
+assert not same(score, copy)        # the names differ
+
+# The hash is stable across processes
+script = ("from lexer import Lexer; from parser import Parser; from hashcons import *\n"
+          "t = Lexer('let x: int = (a < b) as int;', verbose=False).tokenize()\n"
+          "p = Parser(t, verbose=False, interner=InternTable()).parse_program()\n"
+          "print(structural_hash(p.declarations[0].value).hex())")
+tokens = Lexer('let x: int = (a < b) as int;', verbose=False).tokenize()
+local = structural_hash(Parser(tokens, verbose=False).parse_program().declarations[0].value).hex()
+remote = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True)
+assert remote.stdout.strip() == local
+
+# Consumers that only read the tree behave exactly as before
+SemanticAnalyzer().analyze(program)
+assert pybackend.transpile(program) == pybackend.transpile(plain)
+output = io.StringIO()
+pybackend.load(pybackend.compile_program(program), Runtime(output=output))['.main']()
+assert output.getvalue() == "25\n"
+
+# Shared subtrees are written once in the binary format
+assert len(ast_binary.dumps(program)) < len(ast_binary.dumps(plain))
+restored = ast_binary.ASTFile(ast_binary.dumps(program)).materialize()
+assert structural_hash(restored) == structural_hash(program)
+
+# unshare() gives rewriting passes a tree with no aliasing
+thawed = unshare(program)
+assert distinct(thawed) == len(list(walk(thawed)))
+Inliner().optimize(thawed)
+assert structural_hash(program) == structural_hash(plain)
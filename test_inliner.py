@@ -0,0 +1,148 @@
+from lexer import Lexer
+from parser import Parser
+from ast_nodes import *
+from ast_utils import walk
+from inliner import optimize
+
+source_code = """
+fun XGreaterY_2(x: int, y: int) -> bool {
+    return x > y;
+}
+
+fun Max(x: int, y: int) -> int {
+    let m: int = x;
+    if (y > x) { m = y; }
+    return m;
+}
+
+fun SumTo(n: int, acc: int) -> int {
+    if (n > 0) {
+        return SumTo(n - 1, acc + n);
+    }
+    return acc;
+}
+
+fun Race(score_max: int) -> int {
+    let p1_score: int = 0;
+    while (XGreaterY_2(score_max, p1_score)) {
+        p1_score = Max(p1_score + 1, 1);
+    }
+    return SumTo(p1_score, 0);
+}
+
+let w: int = Race(10);
+"""
+
+lexer = Lexer(source_code)
+tokens = lexer.tokenize()
+parser = Parser(tokens)
+program = parser.parse_program()
+
+program, report = optimize(program, max_inline_size=24)
+print(report)
+
+functions = {decl.name: decl for decl in program.declarations
+             if isinstance(decl, ASTFunctionDeclaration)}
+
+# Both helpers disappear from Race's loop
+race_calls = [n.name for n in walk(functions['Race'].body) if isinstance(n, ASTFunctionCall)]
+assert race_calls == ['SumTo'], race_calls
+assert ('Race', 'XGreaterY_2', 'expression') in report.inlined
+assert ('Race', 'Max', 'single-exit') in report.inlined
+
+# SumTo no longer calls itself; its body loops instead
+sum_calls = [n for n in walk(functions['SumTo'].body) if isinstance(n, ASTFunctionCall)]
+assert sum_calls == []
+assert isinstance(functions['SumTo'].body.statements[0], ASTWhileStatement)
+assert ('SumTo', 1) in report.tail_calls
+
+# A zero budget disables inlining entirely
+program = Parser(Lexer(source_code).tokenize()).parse_program()
+program, report = optimize(program, max_inline_size=0)
+assert report.inlined == []
+
+# A callee's global must not be captured by a caller local of the same name
+import io
+import pybackend
+from runtime import Runtime
+
+capture_source = """
+let g: int = 100;
+fun f(x: int) -> int { return x + g; }
+fun h() -> int { let g: int = 1; return f(2); }
+fun k() -> int { return f(2); }
+"""
+
+def run_h(optimized):
+    program = Parser(Lexer(capture_source).tokenize()).parse_program()
+    report = None
+    if optimized:
+        program, report = optimize(program)
+    functions = pybackend.load(pybackend.compile_program(program), Runtime(output=io.StringIO()))
+    functions['.main']()
+    return functions['h'](), functions['k'](), report
+
+assert run_h(False)[:2] == (102, 102)
+h, k, report = run_h(True)
+assert (h, k) == (102, 102), (h, k)
+assert ('h', 'f', 'expression') not in report.inlined
+assert ('k', 'f', 'expression') in report.inlined
+assert ('f', "'g' is shadowed in h") in report.skipped, report.skipped
+
+
+# Inlined arguments and results keep their declared types, which decide
+# between integer and float division
+typed_source = """
+fun Half(x: float) -> float { return x / 2; }
+fun Twice(x: int) -> float { return x * 2; }
+fun Third(x: float) -> float { let y: float = x / 3; return y; }
+__print(Half(a));
+__print(Half(7));
+__print(Twice(7) / 4);
+let t: float = Third(a);
+__print(t);
+"""
+
+def run_typed(optimized):
+    program = Parser(Lexer("let a: int = 7;\n" + typed_source).tokenize()).parse_program()
+    if optimized:
+        program, report = optimize(program)
+        assert len(report.inlined) == 4, report
+    output = io.StringIO()
+    pybackend.load(pybackend.compile_program(program), Runtime(output=output))['.main']()
+    return output.getvalue().split()
+
+assert run_typed(False) == ['3.5', '3.5', '3.5', '2.3333333333333335'], run_typed(False)
+assert run_typed(True) == run_typed(False), run_typed(True)
+
+# Arrays are passed by reference: writes to an array parameter, whole or by
+# element, reach the caller's array after inlining too
+array_source = """
+fun Reset(a: int[3], z: int[3]) -> int { a = z; return 0; }
+fun Poke(a: int[3]) -> int { a[1] = 9; return a[1]; }
+let b: int[3] = [1, 2, 3];
+let z: int[3] = [0, 0, 0];
+let r: int = Reset(b, z);
+__print(b[0]);
+let c: int[3] = [1, 2, 3];
+let p: int = Poke(c);
+__print(c[1]);
+let q: int = Poke([4, 5, 6]);
+__print(q);
+"""
+
+def run_arrays(optimized):
+    program = Parser(Lexer(array_source).tokenize()).parse_program()
+    if optimized:
+        program, report = optimize(program)
+        assert ('<main>', 'Reset', 'single-exit') in report.inlined, report
+        assert ('<main>', 'Poke', 'single-exit') in report.inlined, report
+        assert ('Poke', "array argument for 'a' is not a variable") in report.skipped, report
+    output = io.StringIO()
+    pybackend.load(pybackend.compile_program(program), Runtime(output=output))['.main']()
+    return output.getvalue().split()
+
+assert run_arrays(False) == ['0', '9', '9'], run_arrays(False)
+assert run_arrays(True) == run_arrays(False), run_arrays(True)
+
+print("Inliner tests passed")
@@ -0,0 +1,105 @@
+from lexer import Lexer
+from parser import Parser
+import ir
+
+source_code = """
+fun Max(x: int, y: int) -> int {
+    let m: int = x;
+    if (y > x) { m = y; }
+    return m;
+}
+
+fun Race(p1_c: colour, score_max: int) -> int {
+    let p1_score: int = 0;
+    let total: int = 0;
+    while ((p1_score < score_max) and (total < score_max * 4)) {
+        let bonus: int = score_max * 2;
+        let copy: int = bonus;
+        total = total + copy + (score_max * 2);
+        p1_score = p1_score + 1;
+        __write(1, p1_score, p1_c);
+    }
+    return total;
+}
+"""
+
+lexer = Lexer(source_code)
+tokens = lexer.tokenize()
+parser = Parser(tokens)
+program = parser.parse_program()
+
+module = ir.lower(program)
+print(module.dump())
+
+# The if in Max joins through a single phi
+max_fn = module.functions['Max']
+phis = [i for block in max_fn.phis for i in block]
+assert len(phis) == 1 and max_fn.op[phis[0]] == ir.PHI
+
+stats = ir.optimize(module)
+print(stats)
+print(module.dump())
+
+race = module.functions['Race']
+assert stats['Race']['common subexpression elimination'] >= 1
+assert stats['Race']['loop-invariant code motion'] >= 1
+
+# Both multiplications by score_max now live in the entry block, outside the loop
+for index in race.instructions():
+    if race.op[index] == ir.MUL:
+        assert race.block_of[index] == 0, race.format(index)
+
+# Every operand refers to a live instruction
+for index in race.instructions():
+    for value in race.operands(index):
+        assert race.op[value] != ir.NOP, race.format(index)
+
+# 'and' and 'or' short-circuit: the right operand only runs on one path and
+# a phi joins the two results
+module = ir.lower(Parser(Lexer("""
+fun Positive(x: int) -> bool {
+    __print(x);
+    return x > 0;
+}
+
+fun Both(x: int) -> bool {
+    return (x > 1) and Positive(x);
+}
+
+fun Either(x: int) -> bool {
+    return (x > 1) or Positive(x);
+}
+""", verbose=False).tokenize(), verbose=False).parse_program())
+for name in ('Both', 'Either'):
+    fn = module.functions[name]
+    calls = [i for i in fn.instructions() if fn.op[i] == ir.CALL]
+    assert len(calls) == 1 and fn.block_of[calls[0]] != 0, fn.dump()
+    assert fn.op[fn.terminator(0)] == ir.BRANCH
+    assert [fn.op[i] for block in fn.phis for i in block] == [ir.PHI]
+
+# An unused division is only removed when it cannot trap
+module = ir.lower(Parser(Lexer("""
+fun Divide(k: int, n: int) -> int {
+    let a: int = k / 0;
+    let b: int = k / n;
+    let c: int = k / 2;
+    return k;
+}
+""", verbose=False).tokenize(), verbose=False).parse_program())
+ir.optimize(module)
+divide = module.functions['Divide']
+divisors = [divide.b[i] for i in divide.instructions() if divide.op[i] == ir.IDIV]
+assert len(divisors) == 2, divide.dump()
+assert [divide.consts[divide.a[d]] for d in divisors if divide.op[d] == ir.CONST] == [0]
+
+# Division records whether it is integer or float division
+module = ir.lower(Parser(Lexer("""
+fun Mixed(k: int, x: float) -> float {
+    let c: colour = #000010;
+    let h: float = k;
+    return k / 2 + c / k + x / k + h / 2 + (k as float) / 2;
+}
+""", verbose=False).tokenize(), verbose=False).parse_program())
+mixed = module.functions['Mixed']
+ops = [mixed.op[i] for i in mixed.instructions() if mixed.op[i] in ir.DIVISIONS]
+assert ops == [ir.IDIV, ir.IDIV, ir.FDIV, ir.FDIV, ir.FDIV], [ir.OP_NAMES[op] for op in ops]
@@ -0,0 +1,109 @@
+import io
+import json
+import time
+
+from language_server import LanguageServer
+
+source_code = """fun Max(x: int, y: int) -> int {
+    let m: int = x;
+    if (y > x) { m = y; }
+    return m;
+}
+
+fun Race(score_max: int) -> int {
+    let p1_score: int = 0;
+    while (p1_score < score_max) {
+        p1_score = Max(p1_score + 1, 1);
+    }
+    return p1_score;
+}
+
+let w: int = Race(10);
+"""
+
+def frame(message):
+    body = json.dumps(message).encode('utf-8')
+    return f"Content-Length: {len(body)}\r\n\r\n".encode('ascii') + body
+
+def messages(data):
+    while data:
+        header, _, rest = data.partition(b"\r\n\r\n")
+        length = int(header.split(b":")[1])
+        yield json.loads(rest[:length])
+        data = rest[length:]
+
+uri = 'file:///race.parl'
+requests = [
+    {'jsonrpc': '2.0', 'id': 1, 'method': 'initialize', 'params': {}},
+    {'jsonrpc': '2.0', 'method': 'textDocument/didOpen', 'params': {
+        'textDocument': {'uri': uri, 'version': 1, 'text': 'fun Max(x: int'}}},
+    {'jsonrpc': '2.0', 'method': 'textDocument/didChange', 'params': {
+        'textDocument': {'uri': uri, 'version': 2}, 'contentChanges': [{'text': source_code}]}},
+]
+writer = io.BytesIO()
+server = LanguageServer(io.BytesIO(b''.join(frame(r) for r in requests)), writer, debounce=0.01)
+while True:
+    message = server.read_message()
+    if message is None:
+        break
+    server.handle(message)
+assert server.wait_idle(timeout=10)
+
+# Only the final version was analysed; the first edit was debounced away
+replies = list(messages(writer.getvalue()))
+published = [m['params'] for m in replies if m.get('method') == 'textDocument/publishDiagnostics']
+print(published)
+assert [p['version'] for p in published] == [2] and published[0]['diagnostics'] == []
+
+# Call to Max on line 10 resolves to the declaration on line 1
+definition = server.on_textDocument_definition({'textDocument': {'uri': uri},
+                                                'position': {'line': 9, 'character': 20}})
+assert definition['range']['start'] == {'line': 0, 'character': 4}, definition
+
+hover = server.on_textDocument_hover({'textDocument': {'uri': uri},
+                                      'position': {'line': 9, 'character': 20}})
+assert 'fun Max(x: int, y: int) -> int' in hover['contents']['value'], hover
+
+# The loop variable resolves to the enclosing let, not to anything in Max
+definition = server.on_textDocument_definition({'textDocument': {'uri': uri},
+                                                'position': {'line': 8, 'character': 12}})
+assert definition['range']['start'] == {'line': 7, 'character': 8}, definition
+
+# Lookups stay fast on a large document
+big = source_code + ''.join(f"let v{i}: int = Race({i});\n" for i in range(30000))
+server.on_textDocument_didChange({'textDocument': {'uri': uri, 'version': 3}, 'contentChanges': [{'text': big}]})
+assert server.wait_idle(timeout=120)
+start = time.perf_counter()
+for line in range(15, 30000, 100):
+    server.on_textDocument_hover({'textDocument': {'uri': uri}, 'position': {'line': line, 'character': 17}})
+elapsed = (time.perf_counter() - start) / 300
+print(f"{elapsed * 1000:.3f} ms per hover")
+assert elapsed < 0.01
+server.stop()
+
+# Failing handlers and analyses are reported and the server keeps serving
+writer = io.BytesIO()
+server = LanguageServer(io.BytesIO(), writer, debounce=0.01)
+server.handle({'jsonrpc': '2.0', 'id': 1, 'method': 'initialize', 'params': {}})
+server.handle({'jsonrpc': '2.0', 'id': 2, 'method': 'textDocument/hover', 'params': {'position': {}}})
+server.handle({'jsonrpc': '2.0', 'method': 'textDocument/didChange', 'params': {'contentChanges': [{}]}})
+analyse = server.run_analysis
+def fail_once(document):
+    server.run_analysis = analyse
+    raise RuntimeError('analysis bug')
+server.run_analysis = fail_once
+server.on_textDocument_didOpen({'textDocument': {'uri': 'file:///broken.parl', 'version': 1, 'text': source_code}})
+assert server.wait_idle(timeout=10)
+server.definition_at = lambda params: 1 / 0
+server.handle({'jsonrpc': '2.0', 'id': 3, 'method': 'textDocument/definition', 'params': {}})
+server.on_textDocument_didOpen({'textDocument': {'uri': uri, 'version': 1, 'text': source_code}})
+assert server.wait_idle(timeout=10)
+
+replies = list(messages(writer.getvalue()))
+errors = {m['id']: m['error']['code'] for m in replies if 'error' in m}
+assert errors == {2: -32602, 3: -32603}, errors
+logged = [m['params']['message'] for m in replies if m.get('method') == 'window/logMessage']
+assert len(logged) == 2 and 'analysis bug' in logged[1], logged
+published = [m['params']['uri'] for m in replies if m.get('method') == 'textDocument/publishDiagnostics']
+assert published == [uri], published
+server.stop()
@@ -1,4 +1,5 @@
 from lexer import Lexer
+from token_types import TokenType
 
 test_program = """
 // Function definition with all parameter types and return
@@ -39,3 +40,13 @@ tokens = lexer.tokenize()
 
 for token in tokens:
     print(f"{token.type}: '{token.lexeme}' (Line {token.line}, Col {token.column})")
+
+# Every occurrence of an identifier is the same interned string object
+results = [token.lexeme for token in tokens if token.lexeme == 'result']
+assert len(results) > 1 and all(name is results[0] for name in results)
+
+# A colour literal takes exactly six hex digits; anything else is an error
+colour_tokens = Lexer("#zzzzzz #12345g #A0b1C2", verbose=False).tokenize()
+assert [(t.type, t.lexeme) for t in colour_tokens[:2]] == [(TokenType.ERROR, '#'), (TokenType.IDENTIFIER, 'zzzzzz')]
+assert colour_tokens[2].type == TokenType.ERROR
+assert [t.lexeme for t in colour_tokens if t.type == TokenType.COLOUR_LITERAL] == ['#A0b1C2']
@@ -0,0 +1,65 @@
+import time
+
+from lexer import Lexer
+from parser import Parser
+from limits import Limits, LimitExceeded
+
+def parse(source, limits):
+    limits = limits.start()
+    tokens = Lexer(source, verbose=False, limits=limits).tokenize()
+    return Parser(tokens, verbose=False, limits=limits).parse_program()
+
+def expect_limit(source, limits, which):
+    try:
+        parse(source, limits)
+    except LimitExceeded as e:
+        print(e)
+        assert e.limit == which, e.limit
+        return e
+    raise AssertionError(f"expected the {which} limit to trip")
+
+limits = Limits()
+
+# Ordinary programs are unaffected
+program = parse("fun F(x: int) -> int { return (x + 1) * 2; }\n__print(F(3));", limits)
+assert len(program.declarations) == 2
+
+# Deep nesting of every recursive construct fails fast instead of
+# exhausting the Python stack
+expect_limit("let x: int = " + "(" * 5000 + "1" + ")" * 5000 + ";", limits, 'depth')
+expect_limit("let x: int = " + "-" * 5000 + "1;", limits, 'depth')
+expect_limit("let x: int = " + " + ".join(["1"] * 5000) + ";", limits, 'chain')
+expect_limit("while (true) {" * 500 + "}" * 500, Limits(max_depth=20), 'depth')
+error = expect_limit("let x: int = \n" + "(" * 100 + "1" + ")" * 100 + ";", limits, 'depth')
+assert error.line == 2 and error.maximum == limits.max_depth
+
+# Within the limit is fine
+parse("let x: int = " + "(" * 60 + "1" + ")" * 60 + ";", limits)
+
+# Flat operator chains are not nesting: long ones pass, and operators open
+# across brackets and precedence levels share the chain limit
+parse("let x: int = " + " + ".join(["1"] * 80) + ";", limits)
+parse("let x: bool = " + " and ".join(["1 < 2"] * 200) + ";", limits)
+error = expect_limit("let x: int = " + " + ".join(["1"] * 300) + " + (" + " * ".join(["1"] * 300) + ");",
+                     limits, 'chain')
+assert error.maximum == limits.max_chain
+
+expect_limit("let x: int = 1;" * 10, Limits(max_tokens=20), 'tokens')
+expect_limit("x" * 100, Limits(max_source_size=50), 'source_size')
+expect_limit("let x: int = 1;\n" * 200000, Limits(time_budget=0.01), 'time')
+
+# Disabled limits really are off
+parse("let x: int = " + " + ".join(["1"] * 2000) + ";", Limits(max_chain=None))
+
+# Unterminated comments and long colour-like runs are scanned in linear time
+for source in ("/*" + "x" * 2000000, "#" + "a" * 2000000, "// " + "y" * 2000000):
+    start = time.perf_counter()
+    tokens = Lexer(source, verbose=False).tokenize()
+    assert time.perf_counter() - start < 5
+tokens = Lexer("/* a\nb */ x /* open\n\n", verbose=False).tokenize()
+assert [(t.lexeme, t.line, t.column) for t in tokens] == [('x', 2, 6), ('EOF', 4, 1)]
+
+# A half-matched colour literal reports the '#' and lexes the rest again
+tokens = Lexer("#ab 1", verbose=False).tokenize()
+assert [(t.type, t.lexeme, t.column) for t in tokens][:3] == [
+    ('ERROR', '#', 1), ('IDENTIFIER', 'ab', 2), ('INT_LITERAL', '1', 5)]
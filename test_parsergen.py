@@ -0,0 +1,95 @@
+import generated_parser
+import parsergen
+from differential import canonical, compare, engine_named, generate_case
+from grammar import GRAMMAR
+from lexer import Lexer
+from parser import Parser, ParserError
+from parsergen import Grammar, GrammarError
+
+# The checked-in parser is what the grammar generates
+with open(parsergen.OUTPUT, encoding='utf-8') as f:
+    assert f.read() == parsergen.generate(GRAMMAR), "run python parsergen.py"
+assert parsergen.main(['--check']) == 0
+
+# FIRST and FOLLOW of the PArL grammar
+grammar = Grammar(GRAMMAR)
+assert not grammar.problems, grammar.problems
+assert grammar.first['statement'] == {'let', 'return', 'if', 'while', 'for', 'BUILTIN', 'IDENTIFIER'}
+assert grammar.first['expression'] == {'-', 'not', '(', '[', 'IDENTIFIER', 'BUILTIN', 'INT_LITERAL', 'FLOAT_LITERAL',
+                                       'BOOLEAN_LITERAL', 'COLOUR_LITERAL', 'true', 'false'}
+assert grammar.follow['expression'] == {')', ']', ',', ';', '='}
+assert {'as', '*', 'or', '=='} <= grammar.follow['unary']
+assert grammar.follow['type'] == {'=', ',', ')', '{'}
+assert not any(grammar.nullable.values())
+assert 'IDENTIFIER' in grammar.table()
+print(f"{len(grammar.decisions)} decisions, no conflicts")
+
+# Conflicts and other mistakes are reported together, before any code is made
+def problems(text):
+    try:
+        parsergen.generate(text)
+    except GrammarError as error:
+        return error.problems
+    raise AssertionError(f"no GrammarError for {text!r}")
+
+found = problems("s: 'if' a | 'if' b\na: ';'\nb: ','")
+assert found == ["conflict in rule 's': alternatives 1 and 2 of 'if' a | 'if' b are both predicted by 'if'"], found
+assert problems("e: e '+' t | t\nt: INT_LITERAL") == ["rule 'e' is left recursive"]
+found = problems("s: [ ';' ] ';'")
+assert found == ["conflict in rule 's': ';' can both start and follow the option [ ';' ]"], found
+found = problems("s: KEYWORD | 'let'")
+assert "both predicted by 'let'" in found[0], found
+found = problems("s: a '__print' 'nope' NUMBER\nunused: ';'")
+assert found == ["rule 's' uses undefined rule 'a'",
+                 "rule 's': '__print' is a BUILTIN token; write BUILTIN",
+                 "rule 's': 'nope' is not a PArL token",
+                 "rule 's': NUMBER is not a TokenType",
+                 "rule 'unused' is never used"], found
+assert problems("s: { [ ';' ] } EOF")[0] == "rule 's': { [ ';' ] } can match nothing"
+
+# Same trees, positions included, as the hand-written parser
+source = """
+fun Blur(src: float[8], n: int) -> float[] {
+    let out: float[8] = [0.0];
+    for (let i: int = 1; i < n - 1; i = i + 1) {
+        out[i] = (src[i - 1] + src[i] + src[i + 1]) / 3.0;
+    }
+    return out;
+}
+let xs: float[] = [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0];
+let ys: float[8] = Blur(xs, 8);
+if (not (ys[2] > 1.5) or __width == 0) { __print(ys[2] as int); } else { ys = xs; }
+while (false) { __delay(-1); }
+__write_box(0, 0, 2, 2, ((#ff0000 as int) + 1) as colour);
+Blur(xs, __random_int(3));
+"""
+def both(text):
+    tokens = Lexer(text, verbose=False).tokenize()
+    try:
+        expected = canonical(Parser(tokens, verbose=False).parse_program())
+    except ParserError as error:
+        expected = f"ParserError: {error}"
+    try:
+        actual = canonical(generated_parser.parse(tokens))
+    except ParserError as error:
+        actual = f"ParserError: {error}"
+    return expected, actual
+
+expected, actual = both(source)
+assert expected == actual and 'ASTIndexAssignment' in actual and 'line=' in actual
+
+# ... and the same errors
+for text in ["let x: int = ;", "fun F(a: int b: int) -> int { return a; }", "x + 1 = 2;",
+             "xs[1][2] = 3;", "__width;", "let a: int[x] = [1];", "F(1, 2", "{", "else",
+             "let x: int = [1, 2;", "if (true) { let y: int = 1; ", "x = 1"]:
+    expected, actual = both(text)
+    assert expected == actual, (text, expected, actual)
+    assert expected.startswith('ParserError'), (text, expected)
+print(both("x + 1 = 2;")[1])
+
+# The differential harness compares it with the reference on random programs
+generated = engine_named('generated')
+for seed in range(300):
+    source = generate_case(seed, invalid_ratio=0.5)
+    assert not compare(source, [generated]), source
+print("generated parser agrees on 300 random cases")
@@ -0,0 +1,68 @@
+import io
+import os
+import tempfile
+
+import parlc
+import profiler
+from runtime import Runtime
+
+source_code = """fun Slow(n: int) -> int {
+    let total: int = 0;
+    for (let i: int = 0; i < n; i = i + 1) {
+        total = total + i * i;
+    }
+    return total;
+}
+
+fun Fast(n: int) -> int {
+    return n + 1;
+}
+
+fun Paint(n: int) -> int {
+    for (let i: int = 0; i < n; i = i + 1) {
+        __write_box(0, 0, __width, __height, #ff0000);
+    }
+    return n;
+}
+
+let s: int = 0;
+for (let k: int = 0; k < 40; k = k + 1) {
+    s = Slow(50000) + Fast(k);
+}
+__print(Paint(3000));
+"""
+
+output = io.StringIO()
+profile = profiler.profile(source_code, Runtime(output=output), interval=0.001)
+print(profile.line_report(source_code, limit=5))
+assert output.getvalue() == "3000\n"
+
+# Samples name PArL functions and lines, never the generated Python
+functions = profile.functions()
+assert functions['<main>'][1] == sum(profile.stacks.values())
+assert functions['Slow'][0] > 10 * functions.get('Fast', (0, 0))[0]
+assert all(function in ('<main>', 'Slow', 'Fast', 'Paint') for function, line in profile.lines)
+hot_line = max((count, line) for (function, line), count in profile.lines.items() if function == 'Slow')[1]
+assert hot_line in (3, 4)
+
+# Builtins show up as leaf frames under the PArL line that called them
+assert profile.stacks[('<main>', 'Paint', '__write_box')] > 0
+assert profile.lines['Paint', 15] > 0
+
+# Folded output is 'frame;frame count' per line, as flamegraph.pl reads it
+folded = profile.folded()
+assert '<main>;Paint;__write_box' in [line.rsplit(' ', 1)[0] for line in folded]
+assert sum(int(line.rsplit(' ', 1)[1]) for line in folded) == sum(profile.stacks.values())
+
+# parlc --profile writes the folded stacks to a file
+with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, 'prog.parl')
+    with open(path, 'w') as f:
+        f.write("fun F(n: int) -> int {\n    let t: int = 0;\n"
+                "    for (let i: int = 0; i < n; i = i + 1) { t = t + i; }\n    return t;\n}\n"
+                "let r: int = F(2000000);\n")
+    out = os.path.join(directory, 'prog.folded')
+    assert parlc.main(['--profile', out, '--no-cache', path]) == 0
+    with open(out) as f:
+        lines = f.read().split('\n')
+    assert any(line.startswith('<main>;F ') for line in lines)
@@ -0,0 +1,132 @@
+import io
+import os
+import tempfile
+
+import pybackend
+from runtime import Runtime
+from semantic_analysis import SemanticAnalysisError
+
+source_code = """
+fun XGreaterY_2(x: int, y: int) -> bool {
+    return x > y;
+}
+
+fun AverageOfTwo_2(x: int, y: int) -> float {
+    return (x + y) / 2 as float;
+}
+
+fun Max(x: int, y: int) -> int {
+    let m: int = x;
+    if (y > x) { m = y; }
+    return m;
+}
+
+fun SumTo(n: int) -> int {
+    let total: int = 0;
+    for (let i: int = 0; i < n; i = i + 1) {
+        let running: int = total + i;
+        __print(running);
+    }
+    for (let i: int = 1; i <= n; i = i + 1) {
+        total = total + i;
+    }
+    return total;
+}
+
+let c1: colour = #00ff00;
+__write(1, 2, c1);
+__print(Max(3, __height));
+__print(XGreaterY_2(2, 1));
+__print(AverageOfTwo_2(3, 5));
+__print(SumTo(3));
+__print(__read(1, 2) == #00ff00);
+"""
+
+program = pybackend.front_end(source_code)
+print(pybackend.transpile(program))
+
+output = io.StringIO()
+functions = pybackend.load(pybackend.compile_program(program), Runtime(output=output))
+functions['.main']()
+print(output.getvalue())
+assert output.getvalue().split() == ['24', 'true', '4.0', '0', '1', '2', '6', 'true']
+
+# Functions are individually callable
+assert functions['Max'](7, 2) == 7
+
+# A second compile of the same source comes straight from the cache
+with tempfile.TemporaryDirectory() as cache_dir:
+    first = pybackend.compile_source(source_code, cache_dir)
+    assert len(os.listdir(cache_dir)) == 1
+    front_end = pybackend.front_end
+    pybackend.front_end = None
+    try:
+        second = pybackend.compile_source(source_code, cache_dir)
+    finally:
+        pybackend.front_end = front_end
+    assert second.co_consts == first.co_consts
+
+def run_output(source):
+    output = io.StringIO()
+    pybackend.run(source, Runtime(output=output), cache_dir=None)
+    return output.getvalue().split()
+
+# Operators are only parenthesised where Python's grouping differs, so long
+# left-associative chains compile
+for terms in (250, 1000):
+    assert run_output(f"__print({' + '.join(['1'] * terms)});") == [str(terms)]
+assert run_output("""
+let a: int = 7;
+let b: int = 3;
+let c: bool = true;
+__print(a - (b - 1) * 2 / (a + b));
+__print(a - -b);
+__print(not c == (a < b));
+__print((a == b) == c or not (c or c));
+__print(-(a as float) / -2.0);
+""") == ['7', '10', 'true', 'false', '3.5']
+
+# Locals and globals may share a function's name without hiding it
+assert run_output("""
+fun f() -> int { return 3; }
+fun g() -> int { let f: int = 1; return f() + f; }
+fun h(f: int) -> int { if (f > 0) { return h(f - 1) + f(); } return 0; }
+__print(g());
+__print(h(2));
+""") == ['4', '6']
+assert run_output("""
+fun f() -> int { return 3; }
+let f: int = 1;
+fun g() -> int { f = f + 1; return f() + f; }
+__print(g());
+__print(f);
+""") == ['5', '2']
+
+# Division is chosen from declared types, so a float is never stored where an
+# int is declared, while an int stored as a float divides as one
+try:
+    run_output("let y: int = 7.5;\n__print(y / 2);")
+    raise AssertionError("expected a float to be refused for an int")
+except SemanticAnalysisError as error:
+    assert str(error) == "Cannot assign float to variable 'y' of type int.", error
+assert run_output("fun Half(x: float) -> float { return x / 2; }\n"
+                  "let y: float = 7;\n__print(y / 2);\n__print(Half(7));") == ['3.5', '3.5']
+
+# Functions read and assign globals, even ones declared after them, and may
+# shadow them; names are checked wherever they are read
+assert run_output("""
+fun Inc() -> int { g = g + 1; return g; }
+fun Second() -> int { return h[1]; }
+fun Shadow() -> int { let g: int = 10; return g; }
+let g: int = 1;
+let h: int[] = [4, 5];
+__print(Inc());
+__print(Inc() + Second() + Shadow());
+__print(g);
+""") == ['2', '18', '3']
+for bad in ("fun F() -> int { return q; }", "__print(z);\nlet z: int = 1;"):
+    try:
+        run_output(bad)
+        raise AssertionError(f"accepted {bad}")
+    except SemanticAnalysisError as error:
+        assert "is not declared" in str(error), error
@@ -0,0 +1,86 @@
+import io
+import os
+import tempfile
+import time
+
+import parlc
+import pybackend
+from replay import RecordingRuntime, ReplayRuntime, ReplayError
+from runtime import Runtime
+
+source_code = """
+let seen: int = 0;
+for (let i: int = 0; i < 20; i = i + 1) {
+    let r: int = __random_int(1000);
+    let x: int = __random_int(__width);
+    __write(x, i, r);
+    seen = seen + __read(x, i);
+    __delay(5);
+    __print(r);
+}
+__delay(2.5);
+__print(seen);
+"""
+code = pybackend.compile_source(source_code, None)
+
+def run(runtime):
+    pybackend.load(code, runtime)['.main']()
+    return runtime.output.getvalue()
+
+# The same seed gives the same numbers
+assert run(Runtime(seed=7, output=io.StringIO())) == run(Runtime(seed=7, output=io.StringIO()))
+assert run(Runtime(seed=7, output=io.StringIO())) != run(Runtime(seed=8, output=io.StringIO()))
+
+# Recording costs the real delays once...
+recording = RecordingRuntime(output=io.StringIO())
+start = time.perf_counter()
+recorded = run(recording)
+assert time.perf_counter() - start >= 0.1
+log = recording.log()
+print(len(log), "bytes for", recording.calls, "calls")
+assert recording.calls == 81
+assert len(log) < 8 + 3 * recording.calls + 8
+
+# ...and replay reproduces the run without sleeping
+replaying = ReplayRuntime(log, output=io.StringIO())
+start = time.perf_counter()
+assert run(replaying) == recorded
+assert time.perf_counter() - start < 0.05
+replaying.finish()
+assert replaying.clock == 20 * 5 + 2.5
+
+# A program that no longer matches the log is caught
+changed = pybackend.compile_source(source_code.replace("__delay(5);", ""), None)
+try:
+    pybackend.load(changed, ReplayRuntime(log, output=io.StringIO()))['.main']()
+    raise AssertionError("expected a replay mismatch")
+except ReplayError as error:
+    print(error)
+    assert "__delay" in str(error) and "__print" not in str(error)
+
+short = ReplayRuntime(log[:-20], output=io.StringIO())
+try:
+    pybackend.load(code, short)['.main']()
+    raise AssertionError("expected the log to run out")
+except ReplayError as error:
+    print(error)
+
+try:
+    ReplayRuntime(b'nope' + log[4:])
+    raise AssertionError("expected a bad header")
+except ReplayError:
+    pass
+
+# parlc records and replays from the command line
+with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, 'prog.parl')
+    log_path = os.path.join(directory, 'prog.parlrec')
+    with open(path, 'w') as f:
+        f.write(source_code)
+    assert parlc.main(['--run', '--seed', '3', '--record', log_path, '--no-cache', path]) == 0
+    with open(log_path, 'rb') as f:
+        replayed = ReplayRuntime(f.read(), output=io.StringIO())
+    expected = run(Runtime(seed=3, output=io.StringIO()))
+    assert run(replayed) == expected
+    assert parlc.main(['--run', '--replay', log_path, '--no-cache', path]) == 0
+    assert parlc.main(['--record', log_path, path]) == 2
@@ -0,0 +1,76 @@
+import contextlib
+import io
+import os
+import tempfile
+
+import parlc
+import pybackend
+import source_map
+from lexer import Lexer
+from parser import Parser
+from ast_utils import walk
+from runtime import Runtime, PArLRuntimeError
+
+source_code = """fun Divide(a: int, b: int) -> int {
+    let q: int = 0;
+    q = a / b;
+    return q;
+}
+
+fun Outer(n: int) -> int {
+    __print(n);
+    return Divide(10, n);
+}
+
+__print(Outer(2));
+__print(Outer(0));
+"""
+
+# Every node the parser builds knows where it starts
+program = Parser(Lexer(source_code, verbose=False).tokenize(), verbose=False).parse_program()
+assert all(node.line is not None for node in walk(program))
+divide = program.declarations[0]
+assert (divide.line, divide.column) == (1, 1)
+assert (divide.body.statements[1].line, divide.body.statements[1].value.column) == (3, 9)
+
+# Line tables round-trip and answer lookups by binary search
+lines = [0, 1, 1, 1, 2, 2, 5, 3, 0, 0, 12]
+table = source_map.LineTable(source_map.encode(lines))
+assert [table.lookup(address) for address in range(1, len(lines) + 1)] == \
+       [None, 1, 1, 1, 2, 2, 5, 3, None, None, 12]
+assert len(table) == 7 and len(table.data) == 14
+
+# Errors at run time name the PArL line and function
+output = io.StringIO()
+try:
+    pybackend.run(source_code, Runtime(output=output), cache_dir=None)
+    raise AssertionError("expected a division by zero")
+except PArLRuntimeError as error:
+    print(error)
+    assert (error.line, error.function) == (3, 'Divide')
+    assert error.stack == [('<main>', 13), ('Outer', 9), ('Divide', 3)]
+assert output.getvalue().split() == ['2', '5', '0']
+
+# Errors raised by the runtime itself are attributed too
+try:
+    pybackend.run("let x: int = 1;\n\n__print(__read(99, x));\n", Runtime(output=output), cache_dir=None)
+    raise AssertionError("expected an out-of-bounds read")
+except PArLRuntimeError as error:
+    print(error)
+    assert error.line == 3
+
+# The table travels with the compiled code: two bytes per line change here
+functions = pybackend.load(pybackend.compile_program(program))
+assert len(functions['.lines'].data) == 2 * len(functions['.lines'])
+assert functions['.lines'].lookup(3) == 1
+
+# parlc --run reports runtime errors against PArL lines as well
+with tempfile.TemporaryDirectory() as root:
+    path = os.path.join(root, 'divide.parl')
+    with open(path, 'w') as f:
+        f.write(source_code)
+    errors = io.StringIO()
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(errors):
+        assert parlc.main(['--run', '--no-cache', path]) == 1
+    print(errors.getvalue())
+    assert 'at line 3 in Divide' in errors.getvalue()
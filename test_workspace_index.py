@@ -0,0 +1,118 @@
+import io
+import os
+import tempfile
+
+from language_server import LanguageServer
+from lexer import Lexer
+from parser import Parser
+from semantic_analysis import SemanticAnalyzer, SemanticAnalysisError
+from workspace_index import WorkspaceIndex
+
+library = """
+fun Max(x: int, y: int) -> int {
+    if (y > x) { return y; }
+    return x;
+}
+
+fun Half(x: float) -> float {
+    return x / 2.0;
+}
+"""
+
+main = """
+fun Larger(a: int) -> int {
+    return Max(a, 10);
+}
+__print(Larger(3));
+"""
+
+def analyze(source, workspace=None):
+    program = Parser(Lexer(source, verbose=False).tokenize(), verbose=False).parse_program()
+    SemanticAnalyzer(workspace).analyze(program)
+
+with tempfile.TemporaryDirectory() as root:
+    lib_path = os.path.join(root, 'lib.parl')
+    main_path = os.path.join(root, 'main.parl')
+    with open(lib_path, 'w') as f:
+        f.write(library)
+    with open(main_path, 'w') as f:
+        f.write(main)
+
+    index = WorkspaceIndex(os.path.join(root, '.parlindex.json'))
+    assert sorted(index.refresh(root)) == sorted([lib_path, main_path])
+    entry = index.lookup('Max')
+    print(entry, entry.path, entry.line)
+    assert str(entry) == "fun Max(x: int, y: int) -> int"
+    assert (entry.path, entry.line) == (lib_path, 2)
+    assert index.lookup('Larger').path == main_path
+
+    # Calls into other files resolve through the index
+    analyze(main, index)
+    try:
+        analyze(main)
+        raise AssertionError("Max should be unknown without the workspace")
+    except SemanticAnalysisError as e:
+        print(e)
+    try:
+        analyze("__print(Half(1.0, 2.0));", index)
+        raise AssertionError("arity should be checked against the index")
+    except SemanticAnalysisError as e:
+        print(e)
+
+    # Nothing changed, nothing is rescanned
+    assert index.refresh(root) == []
+
+    # Editing one file only reindexes that file
+    with open(lib_path, 'w') as f:
+        f.write(library.replace('Half', 'Third'))
+    assert index.refresh(root) == [lib_path]
+    assert index.lookup('Half') is None and index.lookup('Third') is not None
+
+    # Unsaved editor contents can be indexed directly
+    index.update_file(main_path, "fun Draft(x: int) -> int { return x; }\nfun Broken(")
+    assert index.lookup('Draft') is not None and index.lookup('Larger') is None
+
+    # The index survives a restart
+    index.save()
+    reloaded = WorkspaceIndex(os.path.join(root, '.parlindex.json'))
+    assert str(reloaded.lookup('Max')) == str(entry)
+
+    os.remove(main_path)
+    assert reloaded.refresh(root) == [main_path]
+    assert reloaded.lookup('Draft') is None
+
+    # A file that is not UTF-8 is skipped rather than failing the refresh
+    binary_path = os.path.join(root, 'binary.parl')
+    with open(binary_path, 'wb') as f:
+        f.write(b"fun Bad(x: int) -> int { return x; }\xff\xfe")
+    assert reloaded.refresh(root) == [binary_path]
+    assert reloaded.lookup('Bad') is None and reloaded.lookup('Max') is not None
+    assert reloaded.refresh(root) == []
+
+# Closing an unsaved buffer puts the saved file back in the index
+
+with tempfile.TemporaryDirectory() as root:
+    lib_path = os.path.join(root, 'lib.parl')
+    with open(lib_path, 'w') as f:
+        f.write(library)
+    server = LanguageServer(io.BytesIO(), io.BytesIO(), debounce=0.01)
+    server.on_initialize({'rootUri': 'file://' + root})
+    lib_uri = 'file://' + lib_path
+    server.on_textDocument_didOpen({'textDocument': {'uri': lib_uri, 'version': 1,
+                                                     'text': "fun Draft(x: int) -> int { return x; }"}})
+    assert server.wait_idle(timeout=10)
+    assert server.workspace.lookup('Draft') is not None and server.workspace.lookup('Max') is None
+    server.on_textDocument_didClose({'textDocument': {'uri': lib_uri}})
+    assert server.wait_idle(timeout=10)
+    assert server.workspace.lookup('Draft') is None and server.workspace.lookup('Max') is not None
+
+    # An unsaved buffer for a file that was never written is dropped
+    new_uri = 'file://' + os.path.join(root, 'new.parl')
+    server.on_textDocument_didOpen({'textDocument': {'uri': new_uri, 'version': 1,
+                                                     'text': "fun Draft(x: int) -> int { return x; }"}})
+    assert server.wait_idle(timeout=10)
+    assert server.workspace.lookup('Draft') is not None
+    server.on_textDocument_didClose({'textDocument': {'uri': new_uri}})
+    assert server.wait_idle(timeout=10)
+    assert server.workspace.lookup('Draft') is None
+    server.stop()
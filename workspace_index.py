@@ -0,0 +1,185 @@
+# workspace_index.py - Persistent index of function signatures across PArL files
+#
+# Only function headers are read from each file (bodies are skipped by brace
+# matching), and a file is rescanned only when its size, mtime and finally
+# its content hash say it changed. The semantic analyzer resolves calls to
+# functions it cannot find locally through this index instead of re-parsing
+# the other files.
+import hashlib
+import json
+import os
+
+from token_types import TokenType
+from lexer import Lexer
+from parser import Parser, ParserError
+
+INDEX_VERSION = 1
+DEFAULT_INDEX_FILE = '.parlindex.json'
+SOURCE_PATTERN = '.parl'
+
+class WorkspaceIndexError(Exception):
+    pass
+
+class FunctionEntry:
+    def __init__(self, name, parameters, return_type, path, line):
+        self.name = name
+        self.parameters = parameters      # [(name, type)]
+        self.return_type = return_type
+        self.path = path
+        self.line = line
+
+    def __str__(self):
+        params = ', '.join(f"{name}: {type_}" for name, type_ in self.parameters)
+        return f"fun {self.name}({params}) -> {self.return_type}"
+
+    def to_json(self):
+        return [self.name, self.parameters, self.return_type, self.line]
+
+    @classmethod
+    def from_json(cls, data, path):
+        name, parameters, return_type, line = data
+        return cls(name, [tuple(p) for p in parameters], return_type, path, line)
+
+def scan_headers(source, path):
+    # Function headers at the top level of a source file, in order
+    tokens = Lexer(source, verbose=False).tokenize()
+    entries = []
+    depth = 0
+    for i, tok in enumerate(tokens):
+        if tok.type == TokenType.SEPARATOR and tok.lexeme in '{}':
+            depth += 1 if tok.lexeme == '{' else -1
+        elif depth == 0 and tok.type == TokenType.KEYWORD and tok.lexeme == 'fun':
+            parser = Parser(tokens, verbose=False)
+            parser.current = i
+            try:
+                header = parser.parse_function_header()
+            except (ParserError, IndexError):
+                continue    # a header that is still being written
+            params = [(param.name, param.type) for param in header.parameters]
+            entries.append(FunctionEntry(header.name, params, header.return_type, path, tok.line))
+    return entries
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+class WorkspaceIndex:
+    def __init__(self, index_path=None):
+        self.index_path = index_path
+        self.files = {}         # path -> {'mtime_ns', 'size', 'hash', 'functions'}
+        self.functions = {}     # name -> [FunctionEntry]
+        if index_path and os.path.exists(index_path):
+            self.load()
+
+    # --- updates ------------------------------------------------------------
+
+    def update_file(self, path, source=None):
+        # Reindexes one file if it changed; returns True when it did. Passing
+        # source indexes unsaved editor contents instead of the file on disk.
+        path = os.path.abspath(path)
+        record = self.files.get(path)
+        if source is None:
+            stat = os.stat(path)
+            if record and record['mtime_ns'] == stat.st_mtime_ns and record['size'] == stat.st_size:
+                return False
+            with open(path, 'rb') as f:
+                data = f.read()
+            mtime_ns, size = stat.st_mtime_ns, stat.st_size
+        else:
+            data = source.encode('utf-8')
+            mtime_ns, size = None, None
+
+        digest = content_hash(data)
+        if record and record['hash'] == digest:
+            record['mtime_ns'], record['size'] = mtime_ns, size
+            return False
+
+        try:
+            entries = scan_headers(data.decode('utf-8'), path)
+        except UnicodeDecodeError:
+            # Not a PArL source after all; it is recorded without functions
+            # so it is not rescanned until it changes
+            entries = []
+        self.remove_file(path)
+        self.files[path] = {'mtime_ns': mtime_ns, 'size': size, 'hash': digest, 'functions': entries}
+        for entry in entries:
+            self.functions.setdefault(entry.name, []).append(entry)
+        return True
+
+    def remove_file(self, path):
+        path = os.path.abspath(path)
+        record = self.files.pop(path, None)
+        if record is None:
+            return False
+        for entry in record['functions']:
+            remaining = [e for e in self.functions.get(entry.name, []) if e.path != path]
+            if remaining:
+                self.functions[entry.name] = remaining
+            else:
+                self.functions.pop(entry.name, None)
+        return True
+
+    def refresh(self, root):
+        # Brings the index up to date with every source file under root and
+        # returns the paths that were (re)indexed or dropped.
+        root = os.path.abspath(root)
+        seen = set()
+        changed = []
+        for directory, subdirectories, filenames in os.walk(root):
+            subdirectories[:] = [d for d in subdirectories if not d.startswith('.')]
+            for filename in filenames:
+                if filename.endswith(SOURCE_PATTERN):
+                    path = os.path.join(directory, filename)
+                    seen.add(path)
+                    if self.update_file(path):
+                        changed.append(path)
+        for path in list(self.files):
+            if path.startswith(root + os.sep) and path not in seen:
+                self.remove_file(path)
+                changed.append(path)
+        return changed
+
+    # --- queries ------------------------------------------------------------
+
+    def definitions(self, name):
+        return self.functions.get(name, [])
+
+    def lookup(self, name):
+        # The definition from the lexicographically first file wins, so the
+        # answer does not depend on indexing order
+        entries = self.functions.get(name)
+        if not entries:
+            return None
+        return min(entries, key=lambda entry: (entry.path, entry.line))
+
+    # --- persistence --------------------------------------------------------
+
+    def save(self, index_path=None):
+        index_path = index_path or self.index_path
+        data = {
+            'version': INDEX_VERSION,
+            'files': {path: {'mtime_ns': r['mtime_ns'], 'size': r['size'], 'hash': r['hash'],
+                             'functions': [e.to_json() for e in r['functions']]}
+                      for path, r in self.files.items()},
+        }
+        temp = f"{index_path}.{os.getpid()}.tmp"
+        with open(temp, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(temp, index_path)
+
+    def load(self, index_path=None):
+        index_path = index_path or self.index_path
+        try:
+            with open(index_path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as error:
+            raise WorkspaceIndexError(f"Cannot read workspace index {index_path}: {error}")
+        if data.get('version') != INDEX_VERSION:
+            # An index from another version is simply rebuilt from scratch
+            return
+        self.files = {}
+        self.functions = {}
+        for path, record in data['files'].items():
+            entries = [FunctionEntry.from_json(e, path) for e in record['functions']]
+            self.files[path] = dict(record, functions=entries)
+            for entry in entries:
+                self.functions.setdefault(entry.name, []).append(entry)